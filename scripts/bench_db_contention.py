@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+多进程 SQLite 写竞争压测：模拟 start_prod.sh 的多个 uvicorn worker（每个进程若干线程）同时访问同一数据库文件，
+对比默认配置（rollback journal、synchronous=FULL）与当前生产配置（WAL、synchronous=NORMAL、busy_timeout、mmap）。
+每个线程循环执行混合操作：按设备列录音（读）、预留并确认用量（写）、重写一条录音的转写片段（写，含 FTS / BM25）。
+用法：
+    python scripts/bench_db_contention.py [--workers 1,2,4] [--threads 4] [--seconds 5]
+不读写 sofew.db，不调用 DashScope。
+"""
+import argparse
+import multiprocessing as mp
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date
+from pathlib import Path
+
+_root = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(_root))
+
+# 不触发后台向量化
+os.environ["QA_SEMANTIC_ENABLED"] = "false"
+
+PROFILES = {
+    "default": dict(sqlite_journal_mode="DELETE", sqlite_synchronous="FULL", sqlite_mmap_size=0, sqlite_cache_size_kb=2000),
+    "production": {},
+}
+
+USERS = 200
+RECORDINGS = 200
+
+
+def _settings(url: str, profile: str):
+    from src.config import get_settings
+
+    return get_settings().database.model_copy(update={"url": url, **PROFILES[profile]})
+
+
+def seed(url: str) -> None:
+    from src.db import Base
+    from src.db.fts import ensure_fts
+    from src.db.models import RecordingMeta, User
+    from src.db.session import create_db_engine
+
+    engine = create_db_engine(_settings(url, "production"))
+    import src.db.models  # noqa: F401
+
+    Base.metadata.create_all(bind=engine)
+    ensure_fts(engine)
+    with engine.begin() as conn:
+        conn.execute(
+            User.__table__.insert(),
+            [{"email": f"u{i}@bench", "password_hash": "x", "role": "user", "balance": 10**9} for i in range(USERS)],
+        )
+        conn.execute(
+            RecordingMeta.__table__.insert(),
+            [
+                {
+                    "device_id": f"dev{i % 20}",
+                    "recording_id": f"rec{i}",
+                    "start_at": 1735660800 + i * 3600,
+                    "end_at": 1735660800 + i * 3600 + 1800,
+                    "timezone": "Asia/Shanghai",
+                    "oss_file_path": f"recordings/rec{i}.wav",
+                    "status": "done",
+                    "retry_count": 0,
+                }
+                for i in range(RECORDINGS)
+            ],
+        )
+    engine.dispose()
+
+
+def _thread_loop(Session, deadline: float, slot: int, slots: int, out: dict) -> None:
+    from sqlalchemy.exc import OperationalError
+
+    from src.services.recording_service import RecordingService
+    from src.services.transcript_service import TranscriptService
+    from src.services.usage_service import UserIdentity, commit_reservation, reserve
+
+    rng = random.Random(slot)
+    # 每个线程只重写自己名下的录音：同一录音的并发重写不在本压测范围内
+    own = [f"rec{i}" for i in range(slot, RECORDINGS, slots)]
+    db = Session()
+    while time.perf_counter() < deadline:
+        op = rng.random()
+        t = time.perf_counter()
+        try:
+            if op < 0.6:
+                kind = "read"
+                RecordingService(db).list_for_device(f"dev{rng.randrange(20)}", date(2025, 1, 1), date(2025, 1, 10))
+                db.rollback()
+            elif op < 0.9:
+                kind = "quota"
+                reservation = reserve(db, UserIdentity(user_id=rng.randrange(1, USERS + 1)), 1, "bench")
+                commit_reservation(db, reservation)
+            else:
+                kind = "segments"
+                n = rng.randint(20, 80)
+                TranscriptService(db).replace_segments(
+                    rng.choice(own),
+                    ({"segment_index": i, "text": f"第{i}句 王总 合同 {rng.random():.6f}"} for i in range(n)),
+                )
+        except OperationalError as e:
+            db.rollback()
+            out["errors"] += 1
+            out["last_error"] = str(e.orig)[:80]
+            continue
+        out["latency"].setdefault(kind, []).append((time.perf_counter() - t) * 1000)
+        out["ops"] += 1
+    db.close()
+
+
+def worker(
+    url: str, profile: str, workers: int, threads: int, seconds: float, start_at: float, worker_id: int, queue
+) -> None:
+    import threading
+
+    from sqlalchemy.orm import sessionmaker
+
+    from src.db.session import create_db_engine
+
+    engine = create_db_engine(_settings(url, profile))
+    Session = sessionmaker(bind=engine, autoflush=False)
+    outs = [{"ops": 0, "errors": 0, "latency": {}} for _ in range(threads)]
+    while time.time() < start_at:
+        time.sleep(0.005)
+    deadline = time.perf_counter() + seconds
+    pool = [
+        threading.Thread(target=_thread_loop, args=(Session, deadline, worker_id * threads + i, workers * threads, outs[i]))
+        for i in range(threads)
+    ]
+    for th in pool:
+        th.start()
+    for th in pool:
+        th.join()
+    engine.dispose()
+    merged = {"ops": sum(o["ops"] for o in outs), "errors": sum(o["errors"] for o in outs), "latency": {}}
+    for o in outs:
+        for kind, values in o["latency"].items():
+            merged["latency"].setdefault(kind, []).extend(values)
+        if "last_error" in o:
+            merged["last_error"] = o["last_error"]
+    queue.put(merged)
+
+
+def run(profile: str, workers: int, threads: int, seconds: float) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        url = f"sqlite:///{tmp}/contention.db"
+        seed(url)
+        ctx = mp.get_context("spawn")
+        queue = ctx.Queue()
+        start_at = time.time() + 2.0
+        procs = [
+            ctx.Process(target=worker, args=(url, profile, workers, threads, seconds, start_at, w, queue))
+            for w in range(workers)
+        ]
+        for p in procs:
+            p.start()
+        results = [queue.get() for _ in procs]
+        for p in procs:
+            p.join()
+    latency = {}
+    for r in results:
+        for kind, values in r["latency"].items():
+            latency.setdefault(kind, []).extend(values)
+    return {
+        "ops_per_s": sum(r["ops"] for r in results) / seconds,
+        "errors": sum(r["errors"] for r in results),
+        "last_error": next((r["last_error"] for r in results if "last_error" in r), ""),
+        "p95": {k: statistics.quantiles(v, n=20)[-1] if len(v) >= 20 else max(v) for k, v in latency.items()},
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", default="1,2,4", help="进程数列表")
+    parser.add_argument("--threads", type=int, default=4, help="每个进程的并发线程数")
+    parser.add_argument("--seconds", type=float, default=5.0)
+    args = parser.parse_args()
+
+    print(f"{'profile':<12}{'workers':>8}{'ops/s':>10}{'locked':>8}{'p95 读':>10}{'p95 扣减':>10}{'p95 转写':>10}")
+    for workers in [int(x) for x in args.workers.split(",")]:
+        for profile in PROFILES:
+            r = run(profile, workers, args.threads, args.seconds)
+            p95 = r["p95"]
+            print(
+                f"{profile:<12}{workers:>8}{r['ops_per_s']:>10.0f}{r['errors']:>8}"
+                f"{p95.get('read', 0):>9.1f}ms{p95.get('quota', 0):>8.1f}ms{p95.get('segments', 0):>8.1f}ms"
+            )
+            if r["errors"]:
+                print(f"{'':<12}最后一个错误：{r['last_error']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+向量文件（EmbeddingStore）查询耗时与内存评估：在临时目录中逐步追加随机归一化向量，
+每个规模下统计两种查询的耗时与进程内存：
+- 按录音过滤：只取 7 条录音（约 5600 行）做 top-k，即 /v1/qa 的用法
+- 全量扫描：分块遍历全部行
+RssAnon 为堆内存（不随语料增长），RssFile 为映射进来的文件页（可被系统回收）。
+用法：
+    python scripts/bench_embeddings.py [--dim 1024] [--steps 50000,200000,500000]
+不读写 data/embeddings，不调用 DashScope。
+"""
+import argparse
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+_root = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(_root))
+
+import numpy as np
+
+from src.services.embedding_store import EmbeddingStore
+
+
+def _rss_kb() -> dict:
+    out = {}
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                key, _, value = line.partition(":")
+                if key in ("RssAnon", "RssFile"):
+                    out[key] = int(value.split()[0])
+    except OSError:
+        pass
+    return out
+
+
+def _random_unit(rng: np.random.Generator, n: int, dim: int) -> np.ndarray:
+    m = rng.standard_normal((n, dim), dtype=np.float32)
+    m /= np.linalg.norm(m, axis=1, keepdims=True)
+    return m
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dim", type=int, default=1024)
+    parser.add_argument("--steps", default="50000,200000,500000", help="逐步追加到的总行数")
+    parser.add_argument("--recording-rows", type=int, default=5600, help="按录音过滤时的候选行数")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    steps = [int(x) for x in args.steps.split(",")]
+
+    rng = np.random.default_rng(7)
+    with tempfile.TemporaryDirectory() as tmp:
+        store = EmbeddingStore(tmp, args.dim)
+        print(f"{'rows':>9}{'append/s':>11}{'filter p50(ms)':>16}{'scan p50(ms)':>14}{'RssAnon(MB)':>13}{'RssFile(MB)':>13}")
+        for target in steps:
+            t0 = time.perf_counter()
+            added = 0
+            while len(store) < target:
+                n = min(4096, target - len(store))
+                store.append(np.arange(len(store), len(store) + n), _random_unit(rng, n, args.dim))
+                added += n
+            append_rate = added / (time.perf_counter() - t0) if added else 0
+
+            query = _random_unit(rng, 1, args.dim)[0]
+            # 模拟一组录音：连续若干段行号
+            start = int(rng.integers(0, max(1, target - args.recording_rows)))
+            rows = np.arange(start, min(target, start + args.recording_rows))
+
+            filtered, scanned = [], []
+            for _ in range(args.repeat):
+                t = time.perf_counter()
+                store.top_k(query, 20, rows=rows)
+                filtered.append((time.perf_counter() - t) * 1000)
+            for _ in range(max(3, args.repeat // 5)):
+                t = time.perf_counter()
+                store.top_k(query, 20)
+                scanned.append((time.perf_counter() - t) * 1000)
+            rss = _rss_kb()
+            print(
+                f"{target:>9}{append_rate:>11.0f}{statistics.median(filtered):>16.2f}{statistics.median(scanned):>14.1f}"
+                f"{rss.get('RssAnon', 0) / 1024:>13.1f}{rss.get('RssFile', 0) / 1024:>13.1f}"
+            )
+
+        # 校验：全量扫描与暴力计算结果一致
+        vectors = np.memmap(store.vectors_path, dtype=np.float32, mode="r", shape=(len(store), args.dim))
+        expect = np.argsort(-(vectors @ query), kind="stable")[:20]
+        got, _ = store.top_k(query, 20)
+        print()
+        print("top-k 与暴力计算一致：", set(expect.tolist()) == set(got.tolist()))
+
+
+if __name__ == "__main__":
+    main()
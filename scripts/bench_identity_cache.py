@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+身份缓存压测：同一登录会话反复请求 GET /v1/auth/me，对比关闭与开启进程内身份缓存（IDENTITY_CACHE_TTL_SECONDS）时
+每次请求的耗时与发往数据库的语句数；并检查扣减 / 充值后缓存立即失效、返回的余额是最新值。
+在进程内通过 ASGI 调用应用，数据库为临时 SQLite。
+用法：
+    python scripts/bench_identity_cache.py [--requests 2000]
+不读写 sofew.db，不调用 DashScope。
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+_root = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(_root))
+
+_tmp = tempfile.TemporaryDirectory()
+os.environ["DATABASE_URL"] = f"sqlite:///{_tmp.name}/identity.db"
+os.environ.setdefault("OSS_ACCESS_KEY_ID", "bench")
+os.environ.setdefault("OSS_ACCESS_KEY_SECRET", "bench")
+
+import httpx
+from sqlalchemy import event
+
+import src.services.identity_cache as identity_cache_module
+from src.config import get_settings
+from src.db.session import SessionLocal, async_engine
+from src.main import app, ensure_tables
+from src.services.auth_service import create_access_token, register_user
+from src.services.identity_cache import IdentityCache
+from src.services.usage_service import add_balance
+
+
+def use_cache(ttl_seconds: float) -> None:
+    settings = get_settings().auth
+    settings.identity_cache_ttl_seconds = ttl_seconds
+    identity_cache_module._identity_cache = IdentityCache()
+
+
+async def run(client: httpx.AsyncClient, requests: int, statements: dict) -> tuple:
+    statements["n"] = 0
+    t = time.perf_counter()
+    for _ in range(requests):
+        r = await client.get("/v1/auth/me")
+        r.raise_for_status()
+    elapsed = time.perf_counter() - t
+    return elapsed / requests * 1000, statements["n"] / requests
+
+
+async def main_async(requests: int) -> bool:
+    ensure_tables()
+    db = SessionLocal()
+    user = register_user(db, "bench@example.com", "bench123456")
+    add_balance(db, user.id, 10)
+    token = create_access_token(user.id, user.email, user.role)
+    user_id = user.id
+    db.close()
+
+    statements = {"n": 0}
+
+    @event.listens_for(async_engine.sync_engine, "before_cursor_execute")
+    def _count(*_args, **_kw):
+        statements["n"] += 1
+
+    transport = httpx.ASGITransport(app=app)
+    ok = True
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", cookies={"access_token": token}) as client:
+        print(f"GET /v1/auth/me × {requests}（同一会话）")
+        print(f"{'缓存':<8}{'每次(ms)':>10}{'每次语句数':>12}")
+        for label, ttl in (("关闭", 0.0), ("开启", 10.0)):
+            use_cache(ttl)
+            await run(client, 50, statements)  # 预热
+            ms, per_request = await run(client, requests, statements)
+            print(f"{label:<8}{ms:>10.3f}{per_request:>12.2f}")
+        print(f"缓存统计：{identity_cache_module.get_identity_cache().stats()}")
+
+        # 扣减与充值都要立刻反映到 /auth/me
+        before = (await client.get("/v1/auth/me")).json()["balance"]
+        await client.post("/v1/content-workflow/deduct-one")
+        after_deduct = (await client.get("/v1/auth/me")).json()["balance"]
+        db = SessionLocal()
+        add_balance(db, user_id, 5)
+        db.close()
+        after_grant = (await client.get("/v1/auth/me")).json()["balance"]
+        print(f"余额：{before} → 扣减后 {after_deduct} → 充值 5 后 {after_grant}")
+        if (after_deduct, after_grant) != (before - 1, before + 4):
+            print("失败：缓存未随余额变化失效")
+            ok = False
+    await async_engine.dispose()
+    return ok
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=2000)
+    args = parser.parse_args()
+    ok = asyncio.run(main_async(args.requests))
+    _tmp.cleanup()
+    if not ok:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+转写全文搜索耗时评估：在临时 SQLite 中生成 3 台设备一年的录音（每台每天 1 条、每条 1 小时、约 6 秒一个片段），
+经 transcript_segments 的触发器写入 FTS 索引，再统计 /v1/transcripts/search 同款查询的耗时。
+用法：
+    python scripts/bench_search.py [--days 365] [--segments 600]
+不读写 sofew.db，不调用 DashScope / OSS。
+"""
+import argparse
+import random
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+_root = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(_root))
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+import src.db.models  # noqa: F401
+from src.db import Base
+from src.db.fts import ensure_fts, register_functions
+from src.services.search_service import TranscriptSearchService
+
+
+# 日常口语高频词占绝大多数，关键词（人名、事项）按较低概率出现
+_FILLER = (
+    "我们 今天 明天 下午 上午 那个 就是 然后 其实 感觉 还是 可以 需要 问题 时间 地方 一下 这样 怎么 知道 "
+    "觉得 现在 已经 因为 所以 但是 如果 可能 应该 比较 东西 事情 时候 一起 出去 回来 吃饭 睡觉 孩子 妈妈"
+).split()
+_KEYWORDS = "王总 李经理 张老师 合同 签约 预算 项目 进度 客户 体检 报告 方案 电影 医院 作业 deadline OKR review".split()
+
+
+def _sentence(rng: random.Random) -> str:
+    words = [rng.choice(_FILLER) for _ in range(rng.randint(4, 14))]
+    for kw in _KEYWORDS:
+        if rng.random() < 0.004:
+            words.insert(rng.randrange(len(words) + 1), kw)
+    return "".join(words)
+
+
+def seed(db_url: str, days: int, segments: int, devices: int = 3) -> None:
+    engine = create_engine(db_url)
+    event.listen(engine, "connect", register_functions)
+    Base.metadata.create_all(bind=engine)
+    ensure_fts(engine)
+    rng = random.Random(42)
+    base = 1735660800  # 2025-01-01 00:00 +08:00
+    with engine.begin() as conn:
+        for d in range(days):
+            for dev in range(devices):
+                rid = f"dev{dev}_{d:04d}"
+                start_at = base + d * 86400 + 20 * 3600
+                conn.exec_driver_sql(
+                    "INSERT INTO recording_meta (device_id, recording_id, start_at, end_at, timezone, oss_file_path, "
+                    "status, retry_count) VALUES (?, ?, ?, ?, 'Asia/Shanghai', ?, 'transcribed', 0)",
+                    (f"dev{dev}", rid, start_at, start_at + 3600, f"recordings/{rid}.wav"),
+                )
+                conn.exec_driver_sql(
+                    "INSERT INTO transcript_segments (recording_id, segment_index, start_ms, end_ms, text) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    [
+                        (rid, i, i * 6000, i * 6000 + 5500, _sentence(rng))
+                        for i in range(segments)
+                    ],
+                )
+    engine.dispose()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--segments", type=int, default=600, help="每条录音的片段数")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_url = f"sqlite:///{tmp}/bench_search.db"
+        t0 = time.perf_counter()
+        seed(db_url, args.days, args.segments)
+        print(f"写入 {args.days * 3} 条录音 / {args.days * 3 * args.segments} 个片段（含 FTS 触发器）：{time.perf_counter() - t0:.1f}s")
+
+        engine = create_engine(db_url)
+        event.listen(engine, "connect", register_functions)
+        db = sessionmaker(bind=engine)()
+        svc = TranscriptSearchService(db)
+        base = 1735660800
+        cases = [
+            ("两字人名", dict(query="王总", device_id="dev0")),
+            ("两字常用词", dict(query="合同", device_id="dev0")),
+            ("多词", dict(query="王总 合同", device_id="dev0")),
+            ("英文", dict(query="deadline", device_id="dev1")),
+            ("一个月范围", dict(query="体检", device_id="dev2", start_from=base + 90 * 86400, start_to=base + 120 * 86400)),
+            ("高频口语词", dict(query="就是", device_id="dev0")),
+            ("第 10 页", dict(query="客户", device_id="dev0", page=10)),
+            ("相关度排序", dict(query="预算 方案", device_id="dev0", order="relevance")),
+            ("无结果", dict(query="不存在的词", device_id="dev0")),
+        ]
+        print()
+        print(f"{'case':<14}{'total':>8}{'p50(ms)':>10}{'max(ms)':>10}")
+        for name, kw in cases:
+            svc.search(**kw)
+            costs = []
+            for _ in range(args.repeat):
+                t = time.perf_counter()
+                res = svc.search(**kw)
+                costs.append((time.perf_counter() - t) * 1000)
+            total = f"{res['total']}+" if res["total_capped"] else str(res["total"])
+            print(f"{name:<14}{total:>8}{statistics.median(costs):>10.1f}{max(costs):>10.1f}")
+        sample = svc.search("王总", device_id="dev0", page_size=1)["items"]
+        if sample:
+            print()
+            print("示例：", sample[0])
+        db.close()
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
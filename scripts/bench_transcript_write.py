@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+转写落库耗时对比：旧实现（先删后提交、逐条 ORM add、再提交）与当前 TranscriptService.replace_segments
+（单事务、按差异 executemany）在同一份临时 SQLite（含 FTS 触发器与 BM25 倒排）上的表现。
+场景：首次写入、原样重写、约 5% 片段改动后重写。统计耗时与发往 SQLite 的语句数（executemany 记 1 次）。
+用法：
+    python scripts/bench_transcript_write.py [--segments 5000]
+不读写 sofew.db，不调用 DashScope。
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import Counter
+from pathlib import Path
+
+_root = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(_root))
+
+# 不触发后台向量化
+os.environ["QA_SEMANTIC_ENABLED"] = "false"
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+import src.db.models  # noqa: F401
+from src.db import Base
+from src.db.fts import ensure_fts, register_functions
+from src.db.models import RecordingMeta, TranscriptIndexStat, TranscriptSegment, TranscriptTerm
+from src.services.retrieval_service import tokenize
+from src.services.transcript_service import TranscriptService
+
+
+_WORDS = "我们 今天 明天 下午 那个 就是 然后 其实 感觉 还是 王总 合同 预算 项目 客户 孩子 作业 晚饭".split()
+
+
+def make_segments(n: int, seed: int = 1):
+    rng = random.Random(seed)
+    return [
+        {
+            "segment_index": i,
+            "start_ms": i * 6000,
+            "end_ms": i * 6000 + 5500,
+            "text": "".join(rng.choice(_WORDS) for _ in range(rng.randint(4, 14))),
+            "confidence": "0.93",
+        }
+        for i in range(n)
+    ]
+
+
+def legacy_replace(db, recording_id: str, segments, asr_model: str) -> int:
+    """改造前的写法：删除并提交，逐条 add 片段与倒排对象，最后再提交。"""
+    db.query(TranscriptSegment).filter(TranscriptSegment.recording_id == recording_id).delete()
+    db.query(TranscriptTerm).filter(TranscriptTerm.recording_id == recording_id).delete()
+    db.query(TranscriptIndexStat).filter(TranscriptIndexStat.recording_id == recording_id).delete()
+    db.commit()
+    count = total_terms = 0
+    for i, seg in enumerate(segments):
+        item = TranscriptSegment(
+            recording_id=recording_id,
+            segment_index=int(seg.get("segment_index", i)),
+            start_ms=int(seg.get("start_ms", 0)),
+            end_ms=int(seg.get("end_ms", 0)),
+            text=str(seg.get("text", "")),
+            confidence=str(seg.get("confidence")) if seg.get("confidence") is not None else None,
+            asr_model=asr_model,
+        )
+        db.add(item)
+        tokens = tokenize(item.text)
+        db.add_all(
+            TranscriptTerm(
+                recording_id=recording_id,
+                segment_index=item.segment_index,
+                term=term,
+                tf=tf,
+                doc_len=len(tokens),
+            )
+            for term, tf in Counter(tokens).items()
+        )
+        total_terms += len(tokens)
+        count += 1
+        if count % 500 == 0:
+            db.flush()
+    db.add(TranscriptIndexStat(recording_id=recording_id, segment_count=count, total_terms=total_terms))
+    db.commit()
+    return count
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--segments", type=int, default=5000)
+    parser.add_argument("--changed", type=float, default=0.05, help="改动场景中被修改的片段比例")
+    args = parser.parse_args()
+
+    base = make_segments(args.segments)
+    rng = random.Random(2)
+    changed = [dict(s) for s in base]
+    for s in rng.sample(changed, int(len(changed) * args.changed)):
+        s["text"] += "（修正）"
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{tmp}/bench_write.db")
+        event.listen(engine, "connect", register_functions)
+        Base.metadata.create_all(bind=engine)
+        ensure_fts(engine)
+        statements = {"n": 0}
+
+        @event.listens_for(engine, "before_cursor_execute")
+        def _count(*_args, **_kw):
+            statements["n"] += 1
+
+        Session = sessionmaker(bind=engine, autoflush=False)
+        db = Session()
+        for rid in ("legacy", "current"):
+            db.add(RecordingMeta(device_id="bench", recording_id=rid, start_at=0, end_at=3600, oss_file_path=rid))
+        db.commit()
+
+        def run(label, fn):
+            statements["n"] = 0
+            t = time.perf_counter()
+            fn()
+            return label, (time.perf_counter() - t) * 1000, statements["n"]
+
+        svc = TranscriptService(db)
+        rows = []
+        for scenario, segs in (("首次写入", base), ("原样重写", base), (f"{args.changed:.0%} 改动", changed)):
+            _, legacy_ms, legacy_n = run("legacy", lambda: legacy_replace(db, "legacy", segs, "paraformer-v1"))
+            _, cur_ms, cur_n = run("current", lambda: svc.replace_segments("current", iter(segs), "paraformer-v1"))
+            rows.append((scenario, legacy_ms, legacy_n, cur_ms, cur_n, svc.last_diff))
+
+        print(f"{args.segments} 个片段")
+        print(f"{'scenario':<10}{'旧(ms)':>10}{'旧语句数':>10}{'新(ms)':>10}{'新语句数':>10}{'加速':>8}   diff")
+        for scenario, legacy_ms, legacy_n, cur_ms, cur_n, diff in rows:
+            print(
+                f"{scenario:<10}{legacy_ms:>10.0f}{legacy_n:>10}{cur_ms:>10.0f}{cur_n:>10}"
+                f"{legacy_ms / cur_ms:>7.1f}x   +{diff.inserted} ~{diff.updated} -{diff.deleted} ={diff.unchanged}"
+            )
+        db.close()
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
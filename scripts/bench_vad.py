@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+VAD 去静音效果评估：对比原始音频分钟数与实际送 ASR 的分钟数。
+用法：
+    python scripts/bench_vad.py a.wav b.wav ...
+不传文件时生成一段 60 分钟的模拟枕边录音（约 15% 时间有人说话，其余为底噪）。
+不调用 DashScope / OSS。
+"""
+import sys
+import tempfile
+import time
+import wave
+from pathlib import Path
+
+_root = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(_root))
+
+import numpy as np
+
+from src.config import get_settings
+from src.services.audio_chunker import frame_energy_db, open_wav
+from src.services.audio_vad import OffsetMap, detect_speech_regions
+
+
+def make_sample(path: str, minutes: int = 60, speech_ratio: float = 0.15, sample_rate: int = 16000) -> None:
+    rng = np.random.default_rng(42)
+    total = minutes * 60 * sample_rate
+    with wave.open(path, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(sample_rate)
+        written = 0
+        while written < total:
+            # 说话段 3–40 秒，静音段按比例拉长
+            speech_len = int(rng.uniform(3, 40) * sample_rate)
+            silence_len = int(speech_len * (1 - speech_ratio) / speech_ratio * rng.uniform(0.5, 1.5))
+            silence = rng.normal(0, 15, silence_len)  # 约 -67 dBFS 底噪
+            t = np.arange(speech_len) / sample_rate
+            envelope = 0.5 + 0.5 * np.sin(2 * np.pi * 3 * t) ** 2
+            speech = rng.normal(0, 2500, speech_len) * envelope
+            block = np.concatenate([silence, speech])[: total - written]
+            w.writeframes(np.clip(block, -32768, 32767).astype("<i2").tobytes())
+            written += len(block)
+
+
+def bench(path: str) -> dict:
+    settings = get_settings().dashscope
+    t0 = time.perf_counter()
+    audio = open_wav(path)
+    if audio is None:
+        return {"file": path, "error": "not 16-bit PCM WAV"}
+    with audio:
+        energy = frame_energy_db(audio)
+        regions = detect_speech_regions(
+            energy,
+            audio.duration_ms,
+            threshold_db=settings.asr_vad_threshold_db,
+            min_silence_ms=settings.asr_vad_min_silence_ms,
+        )
+        duration_ms = audio.duration_ms
+    elapsed = time.perf_counter() - t0
+    sent_ms = OffsetMap.from_regions(regions).compact_duration_ms
+    return {
+        "file": Path(path).name,
+        "original_min": duration_ms / 60000,
+        "sent_min": sent_ms / 60000,
+        "regions": len(regions),
+        "vad_seconds": elapsed,
+    }
+
+
+def main():
+    paths = sys.argv[1:]
+    tmpdir = None
+    if not paths:
+        tmpdir = tempfile.TemporaryDirectory()
+        sample = str(Path(tmpdir.name) / "pillow_sample_60min.wav")
+        print("未指定文件，生成 60 分钟模拟录音...")
+        make_sample(sample)
+        paths = [sample]
+
+    print()
+    print(f"{'file':<32}{'原始(分)':>10}{'送ASR(分)':>12}{'占比':>8}{'语音段':>8}{'VAD耗时(s)':>12}")
+    total_orig = total_sent = 0.0
+    for p in paths:
+        r = bench(p)
+        if "error" in r:
+            print(f"{r['file']:<32}{r['error']}")
+            continue
+        total_orig += r["original_min"]
+        total_sent += r["sent_min"]
+        ratio = r["sent_min"] / r["original_min"] if r["original_min"] else 0
+        print(
+            f"{r['file']:<32}{r['original_min']:>10.1f}{r['sent_min']:>12.1f}"
+            f"{ratio:>8.0%}{r['regions']:>8}{r['vad_seconds']:>12.2f}"
+        )
+    if total_orig:
+        print()
+        print(f"合计：原始 {total_orig:.1f} 分钟，送 ASR {total_sent:.1f} 分钟（{total_sent / total_orig:.0%}）")
+
+    if tmpdir is not None:
+        tmpdir.cleanup()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+录音列表查询的执行计划检查：在临时 SQLite 中建表并写入大量录音，对 RecordingService 实际生成的 SQL
+执行 EXPLAIN QUERY PLAN，确认走复合索引、没有全表扫描和临时排序，并统计翻页耗时。
+用法：
+    python scripts/check_query_plans.py [--rows 1000000] [--devices 1000]
+任一检查不通过时以非零状态退出。不读写 sofew.db。
+"""
+import argparse
+import random
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+_root = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(_root))
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+import src.db.models  # noqa: F401
+from src.db import Base
+from src.db.fts import register_functions
+from src.db.models import RecordingMeta
+from src.services.recording_service import RecordingService
+
+
+_BASE = 1704038400  # 2024-01-01 00:00 +08:00
+
+
+def seed(engine, rows: int, devices: int) -> None:
+    rng = random.Random(3)
+    per_device = max(1, rows // devices)
+    zones = ["Asia/Shanghai", "Asia/Shanghai", "Asia/Shanghai", "America/Los_Angeles", "Europe/Berlin"]
+    batch = []
+    with engine.begin() as conn:
+        for dev in range(devices):
+            tz = zones[dev % len(zones)]
+            t = _BASE + rng.randint(0, 3600)
+            for i in range(per_device):
+                # 每台设备每天若干条录音
+                t += rng.randint(1800, 12 * 3600)
+                batch.append((f"dev{dev:05d}", f"dev{dev:05d}_{i}", t, t + 1800, tz, f"recordings/{dev}_{i}.wav", "done"))
+                if len(batch) >= 50000:
+                    _flush(conn, batch)
+            if len(batch) >= 50000:
+                _flush(conn, batch)
+        _flush(conn, batch)
+
+
+def _flush(conn, batch) -> None:
+    if batch:
+        conn.exec_driver_sql(
+            "INSERT INTO recording_meta (device_id, recording_id, start_at, end_at, timezone, oss_file_path, status, "
+            "retry_count) VALUES (?, ?, ?, ?, ?, ?, ?, 0)",
+            batch,
+        )
+        batch.clear()
+
+
+def plan(engine, query) -> list:
+    sql = str(query.statement.compile(dialect=engine.dialect, compile_kwargs={"literal_binds": True}))
+    with engine.connect() as conn:
+        return [row[-1] for row in conn.exec_driver_sql("EXPLAIN QUERY PLAN " + sql)]
+
+
+def check(name: str, details: list, index: str) -> bool:
+    text = " | ".join(details)
+    ok = any(index in d for d in details) and not any(d.startswith("SCAN") for d in details)
+    ok = ok and "TEMP B-TREE" not in text
+    print(f"[{'OK' if ok else 'FAIL'}] {name}: {text}")
+    return ok
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--devices", type=int, default=1000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{tmp}/plans.db")
+        event.listen(engine, "connect", register_functions)
+        Base.metadata.create_all(bind=engine)
+        t0 = time.perf_counter()
+        seed(engine, args.rows, args.devices)
+        with engine.begin() as conn:
+            conn.exec_driver_sql("ANALYZE")
+        print(f"写入 {args.rows} 条录音（{args.devices} 台设备）：{time.perf_counter() - t0:.1f}s")
+        print()
+
+        db = sessionmaker(bind=engine)()
+        svc = RecordingService(db)
+        ok = True
+        ok &= check(
+            "设备 + 时间区间（首页）",
+            plan(engine, svc.device_page_query("dev00007", _BASE, _BASE + 30 * 86400, None).limit(51)),
+            "ix_recording_meta_device_start",
+        )
+        ok &= check(
+            "设备 + 时间区间（keyset 翻页）",
+            plan(engine, svc.device_page_query("dev00007", _BASE, _BASE + 30 * 86400, (_BASE + 86400, 123)).limit(51)),
+            "ix_recording_meta_device_start",
+        )
+        status_query = (
+            db.query(RecordingMeta)
+            .filter(RecordingMeta.status == "uploaded")
+            .order_by(RecordingMeta.start_at.asc())
+            .limit(100)
+        )
+        ok &= check("按状态取待处理（list_by_status）", plan(engine, status_query), "ix_recording_meta_status_start")
+
+        # 翻遍一台设备一年的录音，每页耗时应与表大小无关
+        print()
+        costs = []
+        cursor = None
+        total = 0
+        while True:
+            t = time.perf_counter()
+            items, cursor = svc.list_for_device("dev00007", date(2024, 1, 1), date(2024, 12, 31), limit=50, after=cursor)
+            costs.append((time.perf_counter() - t) * 1000)
+            total += len(items)
+            if cursor is None:
+                break
+        single_day = date(2024, 1, 1) + timedelta(days=100)
+        t = time.perf_counter()
+        day_items, _ = svc.list_for_device("dev00003", single_day, single_day, limit=50)
+        day_ms = (time.perf_counter() - t) * 1000
+        print(f"dev00007 全年 {total} 条，{len(costs)} 页，每页平均 {sum(costs) / len(costs):.2f}ms、最慢 {max(costs):.2f}ms")
+        print(f"dev00003 单日（{single_day}）{len(day_items)} 条：{day_ms:.2f}ms")
+        db.close()
+        engine.dispose()
+
+    if not ok:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
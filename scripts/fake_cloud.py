@@ -0,0 +1,614 @@
+#!/usr/bin/env python3
+"""
+离线 DashScope / OSS 替身服务：压测和 CI 基准不再依赖外网、也不产生费用。
+实现本项目用到的接口子集：
+- OpenAI 兼容对话：POST /compatible-mode/v1/chat/completions（含 stream=True）、GET /compatible-mode/v1/models
+- 录音文件识别：POST /api/v1/services/audio/asr/transcription（Transcription.async_call）、
+  GET /api/v1/tasks/{task_id}（Transcription.fetch），结果经 transcription_url 下载；传了 callback_url 时完成后回调
+- OSS 签名 PUT / GET / HEAD / DELETE（path-style，签名不校验）
+
+用法：
+    python scripts/fake_cloud.py --port 9100
+    # 服务端 .env 指向替身：
+    DASHSCOPE_API_KEY=offline
+    DASHSCOPE_HTTP_BASE_URL=http://127.0.0.1:9100/api/v1
+    DASHSCOPE_COMPATIBLE_BASE_URL=http://127.0.0.1:9100/compatible-mode/v1
+    OSS_ENDPOINT=127.0.0.1:9100
+    OSS_USE_HTTPS=false
+    OSS_ACCESS_KEY_ID=offline
+    OSS_ACCESS_KEY_SECRET=offline
+
+延迟与错误（对数正态，给中位数与 sigma）：
+    --llm-ttft-ms 800 --llm-token-ms 25 --llm-tokens 400 --asr-base-ms 3000 --asr-rtf 0.05
+    --error-rate 0.01 （对话 / 提交转写随机返回 429 或 500）--asr-file-error-rate 0.0
+录制 / 回放（JSONL 卡带）：
+    --record cassette.jsonl --upstream-key $DASHSCOPE_API_KEY   转发到真实 DashScope 并记录对话与转写结果
+    --replay cassette.jsonl [--replay-timing]                      按请求指纹回放，未命中时退回合成结果
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import math
+import random
+import re
+import sys
+import tempfile
+import time
+import uuid
+import wave
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, List, Optional
+from urllib.parse import unquote, urlparse
+
+_root = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(_root))
+
+import httpx
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+
+from src.services.prompt_builder import estimate_tokens
+
+
+UPSTREAM_COMPATIBLE = "https://dashscope.aliyuncs.com/compatible-mode/v1"
+UPSTREAM_API = "https://dashscope.aliyuncs.com/api/v1"
+
+_FILLER_TEXT = (
+    "这是离线替身服务生成的示例内容，用于压测与基准，不代表真实模型输出。"
+    "内容长度与延迟分布可以通过命令行参数调整，便于复现线上的排队与长尾情况。"
+)
+
+
+@dataclass
+class Latency:
+    """对数正态延迟：median_ms * exp(sigma * N(0, 1))。"""
+
+    median_ms: float
+    sigma: float = 0.3
+
+    def sample(self, rng: random.Random) -> float:
+        if self.median_ms <= 0:
+            return 0.0
+        return self.median_ms * math.exp(self.sigma * rng.gauss(0, 1)) / 1000
+
+
+@dataclass
+class FakeTask:
+    task_id: str
+    file_urls: List[str]
+    submit_time: float
+    done_at: float
+    failed_files: List[bool]
+    callback_url: Optional[str] = None
+    callback_sent: bool = False
+    # 录制模式下真实任务的结果（已改写为本地 transcription_url）
+    upstream_output: Optional[Dict[str, Any]] = None
+
+
+@dataclass
+class Cassette:
+    path: Optional[Path]
+    entries: Dict[str, Dict[str, Any]] = field(default_factory=dict)
+
+    @classmethod
+    def load(cls, path: Optional[str]) -> "Cassette":
+        c = cls(Path(path) if path else None)
+        if c.path and c.path.exists():
+            for line in c.path.read_text(encoding="utf-8").splitlines():
+                if line.strip():
+                    item = json.loads(line)
+                    c.entries[item["key"]] = item
+        return c
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        return self.entries.get(key)
+
+    def put(self, item: Dict[str, Any]) -> None:
+        self.entries[item["key"]] = item
+        if self.path:
+            with self.path.open("a", encoding="utf-8") as f:
+                f.write(json.dumps(item, ensure_ascii=False) + "\n")
+
+
+def chat_key(body: Dict[str, Any]) -> str:
+    payload = {
+        "model": body.get("model"),
+        "messages": body.get("messages"),
+        "temperature": body.get("temperature"),
+        "response_format": body.get("response_format"),
+    }
+    return "chat:" + hashlib.sha256(json.dumps(payload, ensure_ascii=False, sort_keys=True).encode()).hexdigest()
+
+
+def audio_key(file_url: str, bucket: str) -> str:
+    """按对象路径（去掉签名参数与 path-style 的 bucket 前缀）标识音频，真实 OSS 与本地替身的 URL 可互相命中。"""
+    path = unquote(urlparse(file_url).path).lstrip("/")
+    if path.startswith(bucket + "/"):
+        path = path[len(bucket) + 1 :]
+    return "asr:" + path
+
+
+class FakeCloud:
+    def __init__(self, args: argparse.Namespace) -> None:
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.llm_ttft = Latency(args.llm_ttft_ms, args.llm_sigma)
+        self.asr_base = Latency(args.asr_base_ms, args.asr_sigma)
+        self.oss_latency = Latency(args.oss_latency_ms, 0.2)
+        self.oss_dir = Path(args.oss_dir or tempfile.mkdtemp(prefix="fake_oss_"))
+        self.tasks: Dict[str, FakeTask] = {}
+        self.cassette = Cassette.load(args.record or args.replay)
+        self.recording = bool(args.record)
+        self.http = httpx.AsyncClient(timeout=httpx.Timeout(300.0, connect=10.0))
+        self.stats: Dict[str, int] = {}
+
+    def bump(self, key: str) -> None:
+        self.stats[key] = self.stats.get(key, 0) + 1
+
+    def base_url(self, request: Request) -> str:
+        return str(request.base_url).rstrip("/")
+
+    def injected_error(self) -> Optional[JSONResponse]:
+        if self.args.error_rate <= 0 or self.rng.random() >= self.args.error_rate:
+            return None
+        self.bump("injected_errors")
+        if self.rng.random() < 0.5:
+            body = {"code": "Throttling.RateQuota", "message": "Requests rate limit exceeded (fake_cloud)"}
+            return JSONResponse(body, status_code=429)
+        return JSONResponse({"code": "InternalError", "message": "Injected failure (fake_cloud)"}, status_code=500)
+
+    # --- 对话 ---
+
+    def synth_text(self, body: Dict[str, Any]) -> str:
+        messages = body.get("messages") or []
+        prompt = "\n".join(str(m.get("content", "")) for m in messages)
+        wants_json = (body.get("response_format") or {}).get("type") == "json_object" or "严格 JSON" in prompt
+        if wants_json:
+            indexes = [int(x) for x in re.findall(r"^\[(\d+)\]", prompt, re.M)]
+            sample = indexes[:: max(1, len(indexes) // 5)][:5]
+            return json.dumps(
+                {
+                    "summary": "离线替身生成的摘要。",
+                    "people": [{"name": "张三", "evidence": [{"segment_index": i} for i in sample[:2]]}],
+                    "issues": [
+                        {"title": "打断对方", "detail": "示例问题。", "evidence": [{"segment_index": i} for i in sample[-1:]]}
+                    ],
+                    "suggestions": [{"title": "先倾听再回应", "detail": "示例建议。"}],
+                    "sources": [{"segment_index": i} for i in sample],
+                },
+                ensure_ascii=False,
+            )
+        seed = int(hashlib.sha256(prompt.encode()).hexdigest()[:8], 16)
+        start = seed % len(_FILLER_TEXT)
+        n = self.args.llm_tokens
+        return ((_FILLER_TEXT[start:] + _FILLER_TEXT) * (n // len(_FILLER_TEXT) + 2))[:n]
+
+    def completion_json(self, body: Dict[str, Any], text: str) -> Dict[str, Any]:
+        prompt_tokens = sum(estimate_tokens(str(m.get("content", ""))) for m in body.get("messages") or [])
+        completion_tokens = estimate_tokens(text)
+        return {
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "qwen-plus"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        }
+
+    @staticmethod
+    def chunk_json(model: str, cid: str, delta: Dict[str, Any], finish: Optional[str] = None) -> str:
+        chunk = {
+            "id": cid,
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish}],
+        }
+        return f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+
+    async def stream_text(
+        self, body: Dict[str, Any], pieces: AsyncIterator[str]
+    ) -> AsyncIterator[str]:
+        cid = f"chatcmpl-{uuid.uuid4().hex}"
+        model = body.get("model", "qwen-plus")
+        yield self.chunk_json(model, cid, {"role": "assistant", "content": ""})
+        async for piece in pieces:
+            yield self.chunk_json(model, cid, {"content": piece})
+        yield self.chunk_json(model, cid, {}, finish="stop")
+        yield "data: [DONE]\n\n"
+
+    async def timed_pieces(self, text: str, ttft: float, token_seconds: float) -> AsyncIterator[str]:
+        await asyncio.sleep(ttft)
+        step = 4
+        for i in range(0, len(text), step):
+            if i:
+                await asyncio.sleep(token_seconds * step)
+            yield text[i : i + step]
+
+    async def chat(self, request: Request) -> Response:
+        body = await request.json()
+        self.bump("chat_requests")
+        error = self.injected_error()
+        if error is not None:
+            return error
+        stream = bool(body.get("stream"))
+        key = chat_key(body)
+
+        if self.recording:
+            return await self.chat_record(request, body, key, stream)
+
+        recorded = self.cassette.get(key)
+        if recorded is not None:
+            self.bump("chat_replayed")
+            text = recorded["text"]
+            if self.args.replay_timing:
+                ttft = recorded["ttft_ms"] / 1000
+                per_char = max(0.0, recorded["total_ms"] - recorded["ttft_ms"]) / 1000 / max(1, len(text))
+            else:
+                ttft, per_char = 0.0, 0.0
+        else:
+            if self.args.replay and self.args.replay_strict:
+                return JSONResponse({"code": "NotRecorded", "message": "request not in cassette"}, status_code=404)
+            self.bump("chat_synthetic")
+            text = self.synth_text(body)
+            ttft = self.llm_ttft.sample(self.rng)
+            per_char = self.args.llm_token_ms / 1000
+
+        if stream:
+            return StreamingResponse(
+                self.stream_text(body, self.timed_pieces(text, ttft, per_char)), media_type="text/event-stream"
+            )
+        await asyncio.sleep(ttft + per_char * len(text))
+        return JSONResponse(self.completion_json(body, text))
+
+    async def chat_record(self, request: Request, body: Dict[str, Any], key: str, stream: bool) -> Response:
+        """转发到真实接口（总是以流式请求上游以测得首 token 时间），原样回给调用方并写入卡带。"""
+        headers = {"Authorization": self.upstream_auth(request), "Content-Type": "application/json"}
+        upstream_body = {**body, "stream": True}
+        started = time.perf_counter()
+        parts: List[str] = []
+        ttft_ms: List[float] = []
+
+        async def pieces() -> AsyncIterator[str]:
+            async with self.http.stream(
+                "POST", f"{self.args.upstream_compatible}/chat/completions", json=upstream_body, headers=headers
+            ) as resp:
+                resp.raise_for_status()
+                async for line in resp.aiter_lines():
+                    if not line.startswith("data:") or line.strip() == "data: [DONE]":
+                        continue
+                    chunk = json.loads(line[5:])
+                    for choice in chunk.get("choices") or []:
+                        piece = (choice.get("delta") or {}).get("content")
+                        if piece:
+                            if not ttft_ms:
+                                ttft_ms.append((time.perf_counter() - started) * 1000)
+                            parts.append(piece)
+                            yield piece
+            self.cassette.put(
+                {
+                    "key": key,
+                    "kind": "chat",
+                    "model": body.get("model"),
+                    "text": "".join(parts),
+                    "ttft_ms": ttft_ms[0] if ttft_ms else 0.0,
+                    "total_ms": (time.perf_counter() - started) * 1000,
+                }
+            )
+            self.bump("chat_recorded")
+
+        if stream:
+            return StreamingResponse(self.stream_text(body, pieces()), media_type="text/event-stream")
+        async for _ in pieces():
+            pass
+        return JSONResponse(self.completion_json(body, "".join(parts)))
+
+    def upstream_auth(self, request: Request) -> str:
+        if self.args.upstream_key:
+            return f"Bearer {self.args.upstream_key}"
+        return request.headers.get("Authorization", "")
+
+    # --- 录音文件识别 ---
+
+    def audio_seconds(self, file_url: str) -> float:
+        """URL 指向本地 OSS 替身里的 WAV 时读取真实时长，否则用 --asr-default-audio-seconds。"""
+        path = self.oss_path_from_url(file_url)
+        if path is not None and path.exists():
+            try:
+                with wave.open(str(path), "rb") as w:
+                    return w.getnframes() / float(w.getframerate())
+            except (wave.Error, EOFError):
+                return path.stat().st_size / 32000
+        return self.args.asr_default_audio_seconds
+
+    def oss_path_from_url(self, file_url: str) -> Optional[Path]:
+        parts = unquote(urlparse(file_url).path).lstrip("/").split("/", 1)
+        if len(parts) != 2:
+            return None
+        return self.oss_dir / parts[0] / parts[1]
+
+    async def asr_submit(self, request: Request) -> Response:
+        body = await request.json()
+        self.bump("asr_submits")
+        error = self.injected_error()
+        if error is not None:
+            return error
+        file_urls = list((body.get("input") or {}).get("file_urls") or [])
+        parameters = body.get("parameters") or {}
+        callback_url = parameters.get("callback_url") or body.get("callback_url")
+        task_id = str(uuid.uuid4())
+        now = time.time()
+
+        task = FakeTask(
+            task_id=task_id,
+            file_urls=file_urls,
+            submit_time=now,
+            done_at=now,
+            failed_files=[self.rng.random() < self.args.asr_file_error_rate for _ in file_urls],
+            callback_url=callback_url,
+        )
+        if self.recording:
+            headers = {
+                "Authorization": self.upstream_auth(request),
+                "Content-Type": "application/json",
+                "X-DashScope-Async": "enable",
+            }
+            resp = await self.http.post(
+                f"{self.args.upstream_api}/services/audio/asr/transcription", json=body, headers=headers
+            )
+            if resp.status_code != 200:
+                return Response(resp.content, status_code=resp.status_code, media_type="application/json")
+            task.task_id = task_id = resp.json()["output"]["task_id"]
+            task.done_at = float("inf")
+        elif all(self.cassette.get(audio_key(u, self.args.oss_bucket)) for u in file_urls) and not self.args.replay_timing:
+            self.bump("asr_replayed")
+        else:
+            longest = max([self.audio_seconds(u) for u in file_urls] or [0.0])
+            task.done_at = now + self.asr_base.sample(self.rng) + longest * self.args.asr_rtf
+        self.tasks[task_id] = task
+        return JSONResponse(
+            {"request_id": str(uuid.uuid4()), "output": {"task_id": task_id, "task_status": "PENDING"}}
+        )
+
+    async def asr_fetch(self, request: Request, task_id: str) -> Response:
+        self.bump("asr_fetches")
+        task = self.tasks.get(task_id)
+        if task is None:
+            return JSONResponse({"code": "InvalidParameter", "message": "task not found"}, status_code=400)
+        if self.recording and task.upstream_output is None:
+            output = await self.asr_fetch_upstream(request, task)
+            if output is None or output.get("task_status") not in ("SUCCEEDED", "FAILED"):
+                return JSONResponse({"request_id": str(uuid.uuid4()), "output": output or {"task_id": task_id}})
+        output = self.task_output(task, self.base_url(request))
+        if output["task_status"] in ("SUCCEEDED", "FAILED") and task.callback_url and not task.callback_sent:
+            task.callback_sent = True
+            asyncio.create_task(self.send_callback(task.callback_url, output))
+        return JSONResponse({"request_id": str(uuid.uuid4()), "output": output})
+
+    async def asr_fetch_upstream(self, request: Request, task: FakeTask) -> Optional[Dict[str, Any]]:
+        resp = await self.http.get(
+            f"{self.args.upstream_api}/tasks/{task.task_id}", headers={"Authorization": self.upstream_auth(request)}
+        )
+        if resp.status_code != 200:
+            return None
+        output = resp.json().get("output") or {}
+        if output.get("task_status") not in ("SUCCEEDED", "FAILED"):
+            return output
+        base = self.base_url(request)
+        results = []
+        for i, item in enumerate(output.get("results") or []):
+            item = dict(item)
+            if item.get("transcription_url"):
+                data = (await self.http.get(item["transcription_url"])).json()
+                self.cassette.put({"key": audio_key(item.get("file_url", ""), self.args.oss_bucket), "kind": "asr", "result": data})
+                self.bump("asr_recorded")
+                item["transcription_url"] = f"{base}/_fake/transcriptions/{task.task_id}/{i}.json"
+            results.append(item)
+        task.upstream_output = {**output, "results": results}
+        task.done_at = time.time()
+        return task.upstream_output
+
+    def task_output(self, task: FakeTask, base: str) -> Dict[str, Any]:
+        if task.upstream_output is not None:
+            return task.upstream_output
+        now = time.time()
+        status = "SUCCEEDED" if now >= task.done_at else ("RUNNING" if now - task.submit_time > 0.5 else "PENDING")
+        output: Dict[str, Any] = {
+            "task_id": task.task_id,
+            "task_status": status,
+            "submit_time": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(task.submit_time)),
+        }
+        if status != "SUCCEEDED":
+            return output
+        results = []
+        for i, (url, failed) in enumerate(zip(task.file_urls, task.failed_files)):
+            if failed:
+                results.append({"file_url": url, "subtask_status": "FAILED", "code": "InvalidFile", "message": "fake"})
+            else:
+                results.append(
+                    {
+                        "file_url": url,
+                        "transcription_url": f"{base}/_fake/transcriptions/{task.task_id}/{i}.json",
+                        "subtask_status": "SUCCEEDED",
+                    }
+                )
+        if results and all(r["subtask_status"] == "FAILED" for r in results):
+            output["task_status"] = "FAILED"
+        output["results"] = results
+        output["end_time"] = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(task.done_at))
+        output["task_metrics"] = {
+            "TOTAL": len(results),
+            "SUCCEEDED": sum(1 for r in results if r["subtask_status"] == "SUCCEEDED"),
+            "FAILED": sum(1 for r in results if r["subtask_status"] == "FAILED"),
+        }
+        return output
+
+    async def send_callback(self, url: str, output: Dict[str, Any]) -> None:
+        try:
+            await self.http.post(url, json={"request_id": str(uuid.uuid4()), "output": output})
+            self.bump("asr_callbacks")
+        except httpx.HTTPError:
+            self.bump("asr_callback_errors")
+
+    def transcription(self, task_id: str, index: int) -> Response:
+        task = self.tasks.get(task_id)
+        if task is None or index >= len(task.file_urls):
+            return JSONResponse({"code": "NotFound"}, status_code=404)
+        url = task.file_urls[index]
+        recorded = self.cassette.get(audio_key(url, self.args.oss_bucket))
+        if recorded is not None:
+            return JSONResponse(recorded["result"])
+        duration_ms = int(self.audio_seconds(url) * 1000)
+        sentences = []
+        step = 4000
+        for sid, begin in enumerate(range(0, max(duration_ms, 1), step)):
+            end = min(begin + step - 200, duration_ms)
+            sentences.append(
+                {"begin_time": begin, "end_time": max(end, begin), "text": f"离线替身第{sid + 1}句。", "sentence_id": sid + 1}
+            )
+        return JSONResponse(
+            {
+                "file_url": url,
+                "properties": {"original_duration_in_milliseconds": duration_ms},
+                "transcripts": [
+                    {"channel_id": 0, "text": "".join(s["text"] for s in sentences), "sentences": sentences}
+                ],
+            }
+        )
+
+    # --- OSS ---
+
+    def oss_file(self, bucket: str, key: str) -> Path:
+        path = (self.oss_dir / bucket / key).resolve()
+        if self.oss_dir.resolve() not in path.parents:
+            raise ValueError("invalid key")
+        return path
+
+    async def oss_sleep(self, size: int) -> None:
+        await asyncio.sleep(self.oss_latency.sample(self.rng) + size / (self.args.oss_mbps * 1024 * 1024 / 8))
+
+    @staticmethod
+    def oss_error(code: str, status_code: int) -> Response:
+        body = (
+            f"<?xml version=\"1.0\" encoding=\"UTF-8\"?><Error><Code>{code}</Code><Message>{code}</Message>"
+            f"<RequestId>fake</RequestId><HostId>fake_cloud</HostId></Error>"
+        )
+        return Response(body, status_code=status_code, media_type="application/xml", headers={"x-oss-request-id": "fake"})
+
+    async def oss(self, request: Request, bucket: str, key: str) -> Response:
+        self.bump(f"oss_{request.method.lower()}")
+        try:
+            path = self.oss_file(bucket, key)
+        except ValueError:
+            return self.oss_error("InvalidObjectName", 400)
+        headers = {"x-oss-request-id": uuid.uuid4().hex}
+        if request.method == "PUT":
+            data = await request.body()
+            await self.oss_sleep(len(data))
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_bytes(data)
+            headers["ETag"] = f'"{hashlib.md5(data).hexdigest().upper()}"'
+            return Response(status_code=200, headers=headers)
+        if request.method == "DELETE":
+            path.unlink(missing_ok=True)
+            return Response(status_code=204, headers=headers)
+        if not path.exists():
+            return self.oss_error("NoSuchKey", 404)
+        data = path.read_bytes()
+        headers.update(
+            {
+                "ETag": f'"{hashlib.md5(data).hexdigest().upper()}"',
+                "Last-Modified": time.strftime("%a, %d %b %Y %H:%M:%S GMT", time.gmtime(path.stat().st_mtime)),
+                "Content-Type": "application/octet-stream",
+            }
+        )
+        if request.method == "HEAD":
+            headers["Content-Length"] = str(len(data))
+            return Response(status_code=200, headers=headers)
+        await self.oss_sleep(len(data))
+        return Response(data, status_code=200, headers=headers)
+
+
+def build_app(cloud: FakeCloud) -> FastAPI:
+    app = FastAPI(title="fake_cloud")
+
+    @app.post("/compatible-mode/v1/chat/completions")
+    async def chat(request: Request):
+        return await cloud.chat(request)
+
+    @app.get("/compatible-mode/v1/models")
+    async def models():
+        return {"object": "list", "data": [{"id": "qwen-plus", "object": "model", "owned_by": "fake_cloud"}]}
+
+    @app.post("/api/v1/services/audio/asr/transcription")
+    async def asr_submit(request: Request):
+        return await cloud.asr_submit(request)
+
+    @app.api_route("/api/v1/tasks/{task_id}", methods=["GET", "POST"])
+    async def asr_fetch(request: Request, task_id: str):
+        return await cloud.asr_fetch(request, task_id)
+
+    @app.get("/_fake/transcriptions/{task_id}/{index}.json")
+    async def transcription(task_id: str, index: int):
+        return cloud.transcription(task_id, index)
+
+    @app.get("/_fake/stats")
+    async def stats():
+        return {"stats": cloud.stats, "tasks": len(cloud.tasks), "cassette_entries": len(cloud.cassette.entries)}
+
+    @app.api_route("/{bucket}/{key:path}", methods=["GET", "PUT", "HEAD", "DELETE"])
+    async def oss(request: Request, bucket: str, key: str):
+        return await cloud.oss(request, bucket, key)
+
+    return app
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    p = argparse.ArgumentParser(description="离线 DashScope / OSS 替身服务")
+    p.add_argument("--host", default="127.0.0.1")
+    p.add_argument("--port", type=int, default=9100)
+    p.add_argument("--seed", type=int, default=42)
+    p.add_argument("--llm-ttft-ms", type=float, default=800.0, help="首 token 延迟中位数")
+    p.add_argument("--llm-sigma", type=float, default=0.4)
+    p.add_argument("--llm-token-ms", type=float, default=25.0, help="每个输出字符的生成耗时")
+    p.add_argument("--llm-tokens", type=int, default=400, help="合成回答的长度（字）")
+    p.add_argument("--asr-base-ms", type=float, default=3000.0, help="转写任务固定耗时中位数")
+    p.add_argument("--asr-sigma", type=float, default=0.3)
+    p.add_argument("--asr-rtf", type=float, default=0.05, help="转写耗时 / 音频时长")
+    p.add_argument("--asr-default-audio-seconds", type=float, default=60.0)
+    p.add_argument("--asr-file-error-rate", type=float, default=0.0)
+    p.add_argument("--oss-latency-ms", type=float, default=30.0)
+    p.add_argument("--oss-mbps", type=float, default=200.0, help="OSS 传输带宽（Mbit/s）")
+    p.add_argument("--oss-dir", default="", help="对象存储目录，默认临时目录")
+    p.add_argument("--oss-bucket", default="sofewaccampany", help="与 OSS_BUCKET 一致，用于卡带里的音频键")
+    p.add_argument("--error-rate", type=float, default=0.0, help="对话 / 提交转写随机失败比例")
+    p.add_argument("--record", default="", help="录制卡带路径（转发到真实 DashScope）")
+    p.add_argument("--replay", default="", help="回放卡带路径")
+    p.add_argument("--replay-timing", action="store_true", help="回放时沿用录制时的耗时")
+    p.add_argument("--replay-strict", action="store_true", help="卡带未命中时返回 404 而不是合成结果")
+    p.add_argument("--upstream-key", default="", help="录制时使用的 DashScope API Key，默认透传请求头")
+    p.add_argument("--upstream-compatible", default=UPSTREAM_COMPATIBLE)
+    p.add_argument("--upstream-api", default=UPSTREAM_API)
+    args = p.parse_args(argv)
+    if args.record and args.replay:
+        p.error("--record 与 --replay 不能同时使用")
+    return args
+
+
+def main():
+    args = parse_args()
+    cloud = FakeCloud(args)
+    mode = "record" if args.record else ("replay" if args.replay else "synthetic")
+    print(f"fake_cloud: http://{args.host}:{args.port}  mode={mode}  oss_dir={cloud.oss_dir}")
+    uvicorn.run(build_app(cloud), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
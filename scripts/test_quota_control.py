@@ -4,9 +4,12 @@
 - 游客：前 3 次成功(200)，第 4 次 402
 - 普通用户余额 0：第 1 次即 402
 - 管理员：多次均 200（不扣次数）
-需先启动服务：uvicorn src.main:app --port 8000
+- 并发：同一游客 / 同一用户同时发起多次请求，成功次数恰好等于剩余次数，不会超扣
+需先启动服务：uvicorn src.main:app --port 8000（并发用例也可用 --workers 4 启动，检验多进程下的原子性）
 """
+import asyncio
 import sys
+import uuid
 from pathlib import Path
 
 _root = Path(__file__).resolve().parents[1]
@@ -16,6 +19,7 @@ import httpx
 
 BASE = "http://127.0.0.1:8000"
 TIMEOUT = 10
+RACE_REQUESTS = 20
 
 
 def test_guest_3_then_402():
@@ -95,6 +99,73 @@ def test_admin_unlimited():
     return True
 
 
+async def _race(cookies: dict, n: int) -> list:
+    """用同一身份同时发 n 个扣减请求，返回各自的状态码。"""
+    async with httpx.AsyncClient(base_url=BASE, timeout=TIMEOUT, cookies=cookies) as client:
+        responses = await asyncio.gather(
+            *(client.post("/v1/content-workflow/deduct-one", json={}) for _ in range(n))
+        )
+    return [r.status_code for r in responses]
+
+
+def _check_race(codes: list, expected_ok: int) -> bool:
+    ok, limited = codes.count(200), codes.count(402)
+    print(f"   {len(codes)} 个并发请求：{ok} 个 200，{limited} 个 402")
+    if ok != expected_ok or ok + limited != len(codes):
+        print(f"   期望恰好 {expected_ok} 个 200、其余 402，状态码: {sorted(codes)}")
+        return False
+    return True
+
+
+def test_guest_concurrent_race():
+    """游客：并发请求只有 3 个成功，剩余次数变为 0。"""
+    print(f"\n4. 游客并发：同时 {RACE_REQUESTS} 次，只应成功 3 次")
+    client = httpx.Client(base_url=BASE, timeout=TIMEOUT, follow_redirects=True)
+    r = client.get("/v1/auth/me")
+    quota = r.json().get("remaining")
+    codes = asyncio.run(_race({"guest_id": r.json()["guest_id"]}, RACE_REQUESTS))
+    if not _check_race(codes, quota):
+        return False
+    remaining = client.get("/v1/auth/me").json().get("remaining")
+    if remaining != 0:
+        print(f"   期望剩余 0，得到 {remaining}")
+        return False
+    print("   通过")
+    return True
+
+
+def test_user_concurrent_race():
+    """普通用户：管理员充值 5 次后并发请求，只有 5 个成功，余额为 0。"""
+    print(f"\n5. 用户并发：充值 5 次后同时 {RACE_REQUESTS} 次，只应成功 5 次")
+    admin = httpx.Client(base_url=BASE, timeout=TIMEOUT, follow_redirects=True)
+    r = admin.post("/v1/auth/login", json={"email": "YANGRONG", "password": "YANGRONG"})
+    if r.status_code != 200:
+        print(f"   失败: 管理员登录 -> {r.status_code} {r.text}")
+        return False
+    client = httpx.Client(base_url=BASE, timeout=TIMEOUT, follow_redirects=True)
+    r = client.post(
+        "/v1/auth/register",
+        json={"email": f"quota_race_{uuid.uuid4().hex[:8]}@example.com", "password": "test123456"},
+    )
+    if r.status_code != 200:
+        print(f"   失败: 注册 -> {r.status_code} {r.text}")
+        return False
+    user_id = r.json()["user"]["id"]
+    r = admin.post("/v1/admin/add-balance", json={"user_id": user_id, "amount": 5})
+    if r.status_code != 200 or r.json().get("new_balance") != 5:
+        print(f"   失败: 充值 -> {r.status_code} {r.text}")
+        return False
+    codes = asyncio.run(_race({"access_token": client.cookies.get("access_token")}, RACE_REQUESTS))
+    if not _check_race(codes, 5):
+        return False
+    balance = client.get("/v1/auth/me").json().get("balance")
+    if balance != 0:
+        print(f"   期望余额 0，得到 {balance}")
+        return False
+    print("   通过")
+    return True
+
+
 def main():
     print("========== 用户次数控制测试 ==========")
     print("请确保服务已启动: uvicorn src.main:app --port 8000")
@@ -112,10 +183,12 @@ def main():
     ok &= test_guest_3_then_402()
     ok &= test_user_zero_balance_402()
     ok &= test_admin_unlimited()
+    ok &= test_guest_concurrent_race()
+    ok &= test_user_concurrent_race()
 
     print("\n========== 结果 ==========")
     if ok:
-        print("全部通过：游客 3 次后限制、普通用户 0 余额限制、管理员不限。")
+        print("全部通过：游客 3 次后限制、普通用户 0 余额限制、管理员不限，并发请求不超扣。")
     else:
         print("存在失败用例。")
         sys.exit(1)
@@ -2,81 +2,81 @@
 from typing import Optional
 
 from fastapi import Cookie, Depends, HTTPException, Request, status
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from src.db import get_db
-from src.services.auth_service import decode_access_token
+from src.db import get_async_db
+from src.services.identity_cache import get_identity_cache
 from src.services.usage_service import (
     GuestIdentity,
-    UserIdentity,
-    get_or_create_guest,
-    get_guest_remaining,
-    get_user_identity_and_remaining,
+    get_guest_remaining_async,
+    get_user_identity_and_remaining_async,
 )
 
 
-def get_identity(
-    request: Request,
-    db: Session = Depends(get_db),
-    access_token: Optional[str] = Cookie(default=None, alias="access_token"),
-    guest_id: Optional[str] = Cookie(default=None, alias="guest_id"),
-):
+async def _resolve_identity(
+    db: AsyncSession, access_token: Optional[str], guest_id: Optional[str]
+) -> Optional[dict]:
     """
-    从 Cookie 解析身份：优先 access_token（已登录），否则 guest_id（游客）。
-    若为游客且未带 guest_id，不在此处创建（由 GET /auth/me 负责创建并 Set-Cookie）。
+    优先 access_token（已登录），否则 guest_id（游客）；都无效时返回 None。
+    在事件循环上用 AsyncSession 查询，不占用同步路由与 LLM 调用共用的线程池；
+    JWT 校验结果与身份快照走进程内缓存（见 identity_cache），同一会话的重复请求不验签、不查库。
     """
+    cache = get_identity_cache()
     if access_token:
-        payload = decode_access_token(access_token)
+        payload = cache.decode_token(access_token)
         if payload and payload.get("sub"):
             try:
                 uid = int(payload["sub"])
             except (ValueError, TypeError):
                 pass
             else:
-                identity, remaining = get_user_identity_and_remaining(db, uid)
+                key = ("user", str(uid))
+                cached = cache.get(key)
+                if cached is not None:
+                    return cached
+                version = cache.version(key)
+                identity, remaining = await get_user_identity_and_remaining_async(db, uid)
                 if identity is not None:
-                    return {"identity": identity, "remaining": remaining}
+                    info = {"identity": identity, "remaining": remaining}
+                    cache.put(key, version, info)
+                    return info
     if guest_id and guest_id.strip():
-        remaining = get_guest_remaining(db, guest_id)
-        return {"identity": GuestIdentity(guest_id=guest_id), "remaining": remaining}
+        key = ("guest", guest_id)
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
+        version = cache.version(key)
+        remaining = await get_guest_remaining_async(db, guest_id)
+        info = {"identity": GuestIdentity(guest_id=guest_id), "remaining": remaining}
+        cache.put(key, version, info)
+        return info
+    return None
+
+
+async def get_identity(
+    request: Request,
+    db: AsyncSession = Depends(get_async_db),
+    access_token: Optional[str] = Cookie(default=None, alias="access_token"),
+    guest_id: Optional[str] = Cookie(default=None, alias="guest_id"),
+):
+    """
+    从 Cookie 解析身份：优先 access_token（已登录），否则 guest_id（游客）。
+    若为游客且未带 guest_id，不在此处创建（由 GET /auth/me 负责创建并 Set-Cookie）。
+    """
+    identity_info = await _resolve_identity(db, access_token, guest_id)
+    if identity_info is not None:
+        return identity_info
     raise HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="请先访问首页以初始化，或登录后再使用",
     )
 
 
-def get_identity_optional(
+async def get_identity_optional(
     request: Request,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     access_token: Optional[str] = Cookie(default=None, alias="access_token"),
     guest_id: Optional[str] = Cookie(default=None, alias="guest_id"),
 ):
     """可选身份：用于 /auth/me，未登录时可为游客或需初始化。"""
-    if access_token:
-        payload = decode_access_token(access_token)
-        if payload and payload.get("sub"):
-            try:
-                uid = int(payload["sub"])
-            except (ValueError, TypeError):
-                pass
-            else:
-                identity, remaining = get_user_identity_and_remaining(db, uid)
-                if identity is not None:
-                    return {"identity": identity, "remaining": remaining}
-    if guest_id and guest_id.strip():
-        remaining = get_guest_remaining(db, guest_id)
-        return {"identity": GuestIdentity(guest_id=guest_id), "remaining": remaining}
-    return None
-
-
-def require_quota(
-    identity_info: dict = Depends(get_identity),
-):
-    """要求有剩余用量（游客≤3 次或用户余额>0 或管理员）。"""
-    remaining = identity_info.get("remaining", 0)
-    if remaining <= 0:
-        raise HTTPException(
-            status_code=status.HTTP_402_PAYMENT_REQUIRED,
-            detail="免费次数已用完，请注册并充值后继续使用",
-        )
-    return identity_info
+    return await _resolve_identity(db, access_token, guest_id)
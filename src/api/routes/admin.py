@@ -6,6 +6,7 @@ from sqlalchemy.orm import Session
 from src.api.deps import get_identity
 from src.db import get_db
 from src.db.models import User
+from src.services.usage_service import add_balance as grant_balance
 
 router = APIRouter(prefix="/admin", tags=["admin"])
 
@@ -43,11 +44,9 @@ def add_balance(
     db: Session = Depends(get_db),
     _admin=Depends(require_admin),
 ):
-    """为指定用户增加可用次数（仅管理员）。"""
-    user = db.query(User).filter(User.id == body.user_id).first()
-    if not user:
+    """为指定用户增加可用次数（仅管理员），原子累加并记一条 grant 流水。"""
+    admin = _admin.get("identity")
+    new_balance = grant_balance(db, body.user_id, body.amount, reason=f"admin:{getattr(admin, 'user_id', '')}")
+    if new_balance is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="用户不存在")
-    user.balance = (user.balance or 0) + body.amount
-    db.commit()
-    db.refresh(user)
-    return {"ok": True, "user_id": user.id, "new_balance": user.balance}
+    return {"ok": True, "user_id": body.user_id, "new_balance": new_balance}
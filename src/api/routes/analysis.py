@@ -1,12 +1,12 @@
 import json
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from src.db import get_db, Base, engine
-from src.services.analysis_repo import AnalysisRepo
+from src.db import get_async_db, Base, engine
+from src.services.analysis_repo import AsyncAnalysisRepo
 from src.services.analysis_service import AnalysisService
-from src.services.recording_service import RecordingService
-from src.services.transcript_service import TranscriptService
+from src.services.recording_service import AsyncRecordingService
+from src.services.transcript_service import AsyncTranscriptService
 
 
 Base.metadata.create_all(bind=engine)
@@ -15,14 +15,12 @@ router = APIRouter(prefix="/analysis", tags=["analysis"])
 
 
 @router.post("/{recording_id}/run")
-def run_analysis(recording_id: str, db: Session = Depends(get_db)):
-    recording_service = RecordingService(db)
-    rec = recording_service.get_recording(recording_id)
+async def run_analysis(recording_id: str, db: AsyncSession = Depends(get_async_db)):
+    rec = await AsyncRecordingService(db).get_recording(recording_id)
     if not rec:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Recording not found")
 
-    transcript_service = TranscriptService(db)
-    segs = transcript_service.list_segments(recording_id)
+    segs = await AsyncTranscriptService(db).list_segments(recording_id)
     if not segs:
         raise HTTPException(status_code=400, detail="No transcript segments found; run transcribe first.")
 
@@ -30,20 +28,28 @@ def run_analysis(recording_id: str, db: Session = Depends(get_db)):
         {"segment_index": s.segment_index, "start_ms": s.start_ms, "end_ms": s.end_ms, "text": s.text}
         for s in segs
     ]
-    analysis = AnalysisService().analyze_transcript(payload)
-    repo = AnalysisRepo(db)
-    saved = repo.upsert_analysis(recording_id, analysis, version="v1")
+    # 结束读事务、归还连接，LLM 调用期间不占连接（expire_on_commit=False，rec 仍可用）
+    await db.commit()
+    analysis_service = AnalysisService()
+    analysis = await analysis_service.analyze_transcript(payload)
+    saved = await AsyncAnalysisRepo(db).upsert_analysis(recording_id, analysis, version="v1")
 
     rec.status = "ready"
-    db.commit()
+    await db.commit()
 
-    return {"data": {"recording_id": recording_id, "analysis_version": saved.analysis_version, "status": rec.status}}
+    return {
+        "data": {
+            "recording_id": recording_id,
+            "analysis_version": saved.analysis_version,
+            "status": rec.status,
+            "prompt_tokens": analysis_service.prompt_tokens,
+        }
+    }
 
 
 @router.get("/{recording_id}")
-def get_analysis(recording_id: str, db: Session = Depends(get_db)):
-    repo = AnalysisRepo(db)
-    item = repo.get_analysis(recording_id, version="v1")
+async def get_analysis(recording_id: str, db: AsyncSession = Depends(get_async_db)):
+    item = await AsyncAnalysisRepo(db).get_analysis(recording_id, version="v1")
     if not item:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Analysis not found")
 
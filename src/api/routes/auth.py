@@ -1,17 +1,18 @@
 """注册、登录、登出、当前身份与用量。"""
 from fastapi import APIRouter, Depends, HTTPException, Response, status
 from pydantic import BaseModel, Field, field_validator
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
 from src.api.deps import get_identity_optional
-from src.db import get_db
+from src.db import get_async_db, get_db
 from src.services.auth_service import (
     create_access_token,
     login_user,
     register_user,
 )
 from src.services.email_service import send_welcome_email
-from src.services.usage_service import get_or_create_guest
+from src.services.usage_service import get_or_create_guest_async
 from src.config import get_settings
 
 router = APIRouter(prefix="/auth", tags=["auth"])
@@ -121,9 +122,9 @@ def logout(response: Response):
 
 
 @router.get("/me")
-def me(
+async def me(
     response: Response,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     identity_info=Depends(get_identity_optional),
 ):
     """
@@ -151,7 +152,7 @@ def me(
                     "remaining": remaining,
                 }
     # 无 Cookie：初始化游客
-    guest_identity, remaining = get_or_create_guest(db, None)
+    guest_identity, remaining = await get_or_create_guest_async(db, None)
     response.set_cookie(
         key="guest_id",
         value=guest_identity.guest_id,
@@ -2,20 +2,41 @@
 AI 内容永动机工作流 API。
 顺序：拆解(Skill1) → 想清楚(Skill2) → 写一次(Skill3) → 用到极致(Skill4)
 需登录或游客身份，且剩余用量 > 0；每次运行扣减 1 次。
+运行前原子预留次数（不足返回 402），成功后确认扣减，失败或客户端中途断开则退回。
+/skill/{n}/stream 为 SSE 流式版本，流正常结束后才确认扣减。
+/run 在服务端一次跑完四步，逐步推送结果，整次运行一次性预留 4 次（游客不超过其免费次数）。
 """
+import json
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator
+
+import anyio
 from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from src.api.deps import require_quota
-from src.db import get_db
+from src.api.deps import get_identity
+from src.config import get_settings
+from src.db import get_async_db
+from src.db.session import AsyncSessionLocal
 from src.services.content_skills_service import (
+    run_workflow,
     skill1_content_structure_judge,
     skill2_pre_writing_clarifier,
     skill3_mother_content_architect,
     skill4_content_repurposing_engine,
+    skill4_fanout,
+    stream_skill,
+)
+from src.services.llm_cache_service import get_llm_response_cache
+from src.services.llm_service import get_llm_service
+from src.services.usage_service import (
+    QuotaReservation,
+    commit_reservation_async,
+    release_reservation_async,
+    reserve_async,
 )
-from src.services.usage_service import consume_guest, consume_user
 
 
 router = APIRouter(prefix="/content-workflow", tags=["content-workflow"])
@@ -38,91 +59,279 @@ class Skill3Request(BaseModel):
 
 class Skill4Request(BaseModel):
     mother_content: str = Field(..., description="一篇完整母内容")
+    fanout: bool = Field(default=False, description="为 true 时各输出部分并发生成后按顺序拼接；默认单次补全")
 
 
-# --- Endpoints ---
+class WorkflowRunRequest(BaseModel):
+    content: str = Field(..., description="Skill 1 输入：一条完整内容")
+    writing_intent: str = Field(default="", description="Skill 2 输入，可留空")
+    core_idea: str = Field(default="", description="Skill 3 输入，留空则基于 Skill 1 的拆解结果")
+    mother_content: str = Field(default="", description="Skill 4 输入，留空则基于 Skill 3 的结构蓝图")
+    fanout: bool = Field(default=False, description="Skill 4 是否以扇出模式执行，见 Skill4Request.fanout")
 
 
-def _consume_after_skill(db: Session, identity_info: dict) -> None:
-    identity = identity_info.get("identity")
-    if not identity:
-        return
+# 一次完整运行的扣减次数，与分别调用四个 Skill 一致
+WORKFLOW_QUOTA_COST = 4
+
+
+def _workflow_cost(identity: Any) -> int:
+    """游客的免费次数可能少于 4 次，按免费次数封顶，否则游客永远无法运行完整工作流。"""
     if getattr(identity, "type", None) == "guest":
-        consume_guest(db, getattr(identity, "guest_id", "") or "")
-    elif getattr(identity, "type", None) == "user" and getattr(identity, "role", "") != "admin":
-        consume_user(db, getattr(identity, "user_id", 0) or 0)
+        return max(1, min(WORKFLOW_QUOTA_COST, get_settings().auth.guest_free_quota))
+    return WORKFLOW_QUOTA_COST
+
+
+# --- Endpoints ---
+
+
+_NO_QUOTA = "免费次数已用完，请注册并充值后继续使用"
+
+
+async def _reserve(
+    db: AsyncSession, identity_info: dict, amount: int, reason: str, detail: str = _NO_QUOTA
+) -> QuotaReservation:
+    reservation = await reserve_async(db, identity_info.get("identity"), amount, reason)
+    if reservation is None:
+        raise HTTPException(status_code=402, detail=detail)
+    return reservation
+
+
+async def _settle(reservation: QuotaReservation, ok: bool) -> None:
+    """
+    确认或退回。流式响应结束时依赖注入的 Session 已关闭，非流式请求被取消时它可能正处于中断状态，这里单独开一个；
+    客户端断开时所在任务已被取消，屏蔽取消以保证退回能执行完。
+    """
+    with anyio.CancelScope(shield=True):
+        async with AsyncSessionLocal() as db:
+            if ok:
+                await commit_reservation_async(db, reservation)
+            else:
+                await release_reservation_async(db, reservation)
+
+
+@asynccontextmanager
+async def _charged(db: AsyncSession, identity_info: dict, reason: str) -> AsyncIterator[QuotaReservation]:
+    """
+    预留 1 次（不足则 402）；块内正常结束确认扣减，抛出异常或被取消（客户端断开、进程关闭）则退回。
+    结算与流式接口一样走 _settle：屏蔽取消、单独的 Session。
+    """
+    reservation = await _reserve(db, identity_info, 1, reason)
+    ok = False
+    try:
+        yield reservation
+        ok = True
+    finally:
+        await _settle(reservation, ok)
 
 
 @router.post("/skill/1", summary="爆款结构拆解器")
-def run_skill1(
+async def run_skill1(
     body: Skill1Request,
-    db: Session = Depends(get_db),
-    identity_info: dict = Depends(require_quota),
+    db: AsyncSession = Depends(get_async_db),
+    identity_info: dict = Depends(get_identity),
 ) -> dict:
     """判断内容结构是否值得复用。每次运行扣减 1 次用量。"""
-    try:
-        result = skill1_content_structure_judge(body.content)
-        _consume_after_skill(db, identity_info)
-        return {"ok": True, "skill_id": 1, "skill_name": "爆款结构拆解器", "result": result}
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    async with _charged(db, identity_info, "skill1"):
+        try:
+            result = await skill1_content_structure_judge(body.content)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+    return {"ok": True, "skill_id": 1, "skill_name": "爆款结构拆解器", "result": result}
 
 
 @router.post("/skill/2", summary="写作前元思考澄清器")
-def run_skill2(
+async def run_skill2(
     body: Skill2Request,
-    db: Session = Depends(get_db),
-    identity_info: dict = Depends(require_quota),
+    db: AsyncSession = Depends(get_async_db),
+    identity_info: dict = Depends(get_identity),
 ) -> dict:
     """输出 6 个写作前必须回答的澄清问题。每次运行扣减 1 次用量。"""
-    try:
-        result = skill2_pre_writing_clarifier(body.writing_intent)
-        _consume_after_skill(db, identity_info)
-        return {"ok": True, "skill_id": 2, "skill_name": "写作前元思考澄清器", "result": result}
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    async with _charged(db, identity_info, "skill2"):
+        try:
+            result = await skill2_pre_writing_clarifier(body.writing_intent)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+    return {"ok": True, "skill_id": 2, "skill_name": "写作前元思考澄清器", "result": result}
 
 
 @router.post("/skill/3", summary="母内容结构构建器")
-def run_skill3(
+async def run_skill3(
     body: Skill3Request,
-    db: Session = Depends(get_db),
-    identity_info: dict = Depends(require_quota),
+    db: AsyncSession = Depends(get_async_db),
+    identity_info: dict = Depends(get_identity),
 ) -> dict:
     """基于核心观点，输出母内容的完整结构蓝图。每次运行扣减 1 次用量。"""
-    try:
-        result = skill3_mother_content_architect(body.core_idea)
-        _consume_after_skill(db, identity_info)
-        return {"ok": True, "skill_id": 3, "skill_name": "母内容结构构建器", "result": result}
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    async with _charged(db, identity_info, "skill3"):
+        try:
+            result = await skill3_mother_content_architect(body.core_idea)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+    return {"ok": True, "skill_id": 3, "skill_name": "母内容结构构建器", "result": result}
 
 
 @router.post("/skill/4", summary="内容裂变与复利引擎")
-def run_skill4(
+async def run_skill4(
     body: Skill4Request,
-    db: Session = Depends(get_db),
-    identity_info: dict = Depends(require_quota),
+    db: AsyncSession = Depends(get_async_db),
+    identity_info: dict = Depends(get_identity),
 ) -> dict:
     """将母内容裂变为多平台、多形式可分发内容。每次运行扣减 1 次用量。"""
+    async with _charged(db, identity_info, "skill4"):
+        try:
+            if body.fanout:
+                result, sections = await skill4_fanout(body.mother_content)
+            else:
+                result, sections = await skill4_content_repurposing_engine(body.mother_content), None
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+    resp = {"ok": True, "skill_id": 4, "skill_name": "内容裂变与复利引擎", "result": result}
+    if sections is not None:
+        resp["sections"] = sections
+    return resp
+
+
+# --- 流式（SSE） ---
+
+
+_SKILL_NAMES = {
+    1: "爆款结构拆解器",
+    2: "写作前元思考澄清器",
+    3: "母内容结构构建器",
+    4: "内容裂变与复利引擎",
+}
+
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+async def _skill_events(skill_id: int, reservation: QuotaReservation, **kwargs: Any) -> AsyncIterator[str]:
+    """
+    事件：delta（增量文本）→ done；出错时为 error。
+    只有流完整结束才确认扣减；客户端中途断开或生成失败退回预留的次数。
+    """
+    finished = False
     try:
-        result = skill4_content_repurposing_engine(body.mother_content)
-        _consume_after_skill(db, identity_info)
-        return {"ok": True, "skill_id": 4, "skill_name": "内容裂变与复利引擎", "result": result}
+        async for text in stream_skill(skill_id, **kwargs):
+            yield _sse("delta", {"text": text})
+        finished = True
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        yield _sse("error", {"detail": str(e)})
+        return
+    finally:
+        await _settle(reservation, finished)
+    yield _sse("done", {"ok": True, "skill_id": skill_id, "skill_name": _SKILL_NAMES[skill_id]})
+
+
+async def _stream_response(db: AsyncSession, skill_id: int, identity_info: dict, **kwargs: Any) -> StreamingResponse:
+    reservation = await _reserve(db, identity_info, 1, f"skill{skill_id}")
+    return StreamingResponse(
+        _skill_events(skill_id, reservation, **kwargs),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.post("/skill/1/stream", summary="爆款结构拆解器（流式）")
+async def stream_skill1(
+    body: Skill1Request,
+    db: AsyncSession = Depends(get_async_db),
+    identity_info: dict = Depends(get_identity),
+):
+    return await _stream_response(db, 1, identity_info, content=body.content)
+
+
+@router.post("/skill/2/stream", summary="写作前元思考澄清器（流式）")
+async def stream_skill2(
+    body: Skill2Request,
+    db: AsyncSession = Depends(get_async_db),
+    identity_info: dict = Depends(get_identity),
+):
+    return await _stream_response(db, 2, identity_info, writing_intent=body.writing_intent)
+
+
+@router.post("/skill/3/stream", summary="母内容结构构建器（流式）")
+async def stream_skill3(
+    body: Skill3Request,
+    db: AsyncSession = Depends(get_async_db),
+    identity_info: dict = Depends(get_identity),
+):
+    return await _stream_response(db, 3, identity_info, core_idea=body.core_idea)
+
+
+@router.post("/skill/4/stream", summary="内容裂变与复利引擎（流式）")
+async def stream_skill4(
+    body: Skill4Request,
+    db: AsyncSession = Depends(get_async_db),
+    identity_info: dict = Depends(get_identity),
+):
+    return await _stream_response(db, 4, identity_info, mother_content=body.mother_content)
+
+
+async def _workflow_events(body: WorkflowRunRequest, reservation: QuotaReservation) -> AsyncIterator[str]:
+    """事件：step（每步结果，按完成顺序）→ done；失败时为 error 并退回预留的次数，客户端断开同样退回。"""
+    finished = False
+    try:
+        steps = run_workflow(body.content, body.writing_intent, body.core_idea, body.mother_content, fanout=body.fanout)
+        async for step in steps:
+            yield _sse("step", {**step, "skill_name": _SKILL_NAMES[step["skill_id"]]})
+        finished = True
+    except Exception as e:
+        yield _sse("error", {"detail": str(e)})
+        return
+    finally:
+        await _settle(reservation, finished)
+    yield _sse("done", {"ok": True, "quota_charged": reservation.amount})
+
+
+@router.post("/run", summary="四步工作流一次运行（流式）")
+async def run_workflow_endpoint(
+    body: WorkflowRunRequest,
+    db: AsyncSession = Depends(get_async_db),
+    identity_info: dict = Depends(get_identity),
+):
+    """
+    服务端依次执行 拆解 → 想清楚 → 写一次 → 用到极致，Skill 1 / 2 并行；
+    开始前一次性原子预留 4 次（游客按免费次数封顶），全部完成后确认扣减，运行失败或中途断开则全部退回。
+    """
+    cost = _workflow_cost(identity_info.get("identity"))
+    reservation = await _reserve(
+        db,
+        identity_info,
+        cost,
+        "workflow",
+        detail=f"剩余次数不足，完整工作流需要 {cost} 次",
+    )
+    return StreamingResponse(
+        _workflow_events(body, reservation),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 @router.post("/deduct-one", summary="[测试] 仅扣减 1 次用量，不调用 LLM")
-def deduct_one(
-    db: Session = Depends(get_db),
-    identity_info: dict = Depends(require_quota),
+async def deduct_one(
+    db: AsyncSession = Depends(get_async_db),
+    identity_info: dict = Depends(get_identity),
 ) -> dict:
     """仅用于验证次数控制逻辑，不消耗 DashScope。"""
-    _consume_after_skill(db, identity_info)
+    async with _charged(db, identity_info, "deduct-one"):
+        pass
     return {"ok": True, "message": "已扣减 1 次"}
 
 
+@router.get("/llm-stats", summary="LLM 并发状态")
+def llm_stats() -> dict:
+    """本进程在途 / 排队中的 LLM 请求数。"""
+    return {"data": get_llm_service().stats()}
+
+
+@router.get("/cache-stats", summary="Skill 结果缓存命中率")
+def skill_cache_stats() -> dict:
+    """按 Skill 统计的缓存命中率（本进程）。命中缓存同样扣减用量。"""
+    return {"data": get_llm_response_cache().stats()}
+
+
 @router.get("/workflow", summary="工作流说明")
 def get_workflow() -> dict:
     """返回四步工作流顺序与各 Skill 说明，供前端展示。"""
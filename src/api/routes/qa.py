@@ -1,17 +1,25 @@
+import asyncio
+import logging
 from typing import List, Optional
 
 from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel, Field
 from sqlalchemy.orm import Session
 
+from src.config import get_settings
 from src.db import get_db, Base, engine
 from src.services.recording_service import RecordingService
 from src.services.transcript_service import TranscriptService
 from src.services.llm_service import get_llm_service
+from src.services.prompt_builder import budget_for_model, build_prompt
+from src.services.retrieval_service import TranscriptRetriever, fuse_rankings
+from src.services.semantic_retrieval_service import SegmentEmbeddingIndex
 
 
 Base.metadata.create_all(bind=engine)
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter(prefix="/qa", tags=["qa"])
 
 
@@ -21,58 +29,105 @@ class QARequest(BaseModel):
 
 
 @router.post("")
-def qa(body: QARequest, db: Session = Depends(get_db)):
+async def qa(body: QARequest, db: Session = Depends(get_db)):
     if not body.recording_ids:
         raise HTTPException(status_code=400, detail="recording_ids is required")
 
     recording_service = RecordingService(db)
     transcript_service = TranscriptService(db)
-
-    merged: List[str] = []
-    citations: List[dict] = []
-
-    for rid in body.recording_ids:
-        rec = recording_service.get_recording(rid)
-        if not rec:
-            continue
-        segs = transcript_service.list_segments(rid)
-        for s in segs:
-            merged.append(f"[{rid}#{s.segment_index}] {s.text}")
-            citations.append(
-                {
-                    "recording_id": rid,
-                    "segment_index": s.segment_index,
-                    "start_ms": s.start_ms,
-                    "end_ms": s.end_ms,
-                }
+    retriever = TranscriptRetriever(db)
+    settings = get_settings().qa
+
+    recording_ids = [rid for rid in dict.fromkeys(body.recording_ids) if recording_service.get_recording(rid)]
+
+    # 先用 BM25 + 向量召回只挑相关片段（RRF 融合）；两路都没有结果（如“总结一下”）时退回全部片段，由 prompt 预算兜底
+    rankings = []
+    bm25 = None
+    if settings.retrieval_enabled:
+        # 旧录音首次查询会在 rank 内补建倒排（分词 + 批量写入），放到线程里，不阻塞事件循环
+        bm25 = await asyncio.to_thread(retriever.rank, recording_ids, body.question, settings.top_k)
+        if bm25 is not None:
+            rankings.append(bm25[0])
+    semantic: List[tuple] = []
+    if settings.semantic_enabled:
+        try:
+            semantic = await asyncio.to_thread(
+                SegmentEmbeddingIndex(db).rank,
+                recording_ids,
+                body.question,
+                settings.top_k,
+                settings.semantic_min_score,
             )
+        except Exception:
+            # 向量服务不可用时只用 BM25；回滚失败的事务，后面的查询还要用这个 Session
+            logger.exception("semantic retrieval failed")
+            db.rollback()
+            semantic = []
+        if semantic:
+            rankings.append(semantic)
+
+    retrieval = {"mode": "full"}
+    if rankings:
+        keys = fuse_rankings(rankings, settings.top_k) if len(rankings) > 1 else [k for k, _ in rankings[0]]
+        segs = retriever.expand(recording_ids, keys, settings.neighbor_segments)
+        retrieval = {
+            "mode": "hybrid" if len(rankings) > 1 else ("bm25" if bm25 is not None else "semantic"),
+            "hits": len(keys),
+            "bm25_hits": len(bm25[0]) if bm25 is not None else 0,
+            "semantic_hits": len(semantic),
+            "candidates": bm25[1] if bm25 is not None else len(semantic),
+        }
+    else:
+        segs = [s for rid in recording_ids for s in transcript_service.list_segments(rid)]
+    retrieval["segments"] = len(segs)
+
+    merged: List[tuple] = []
+    citations: List[dict] = []
+    for s in segs:
+        merged.append((f"{s.recording_id}#{s.segment_index}", s.text))
+        citations.append(
+            {
+                "recording_id": s.recording_id,
+                "segment_index": s.segment_index,
+                "start_ms": s.start_ms,
+                "end_ms": s.end_ms,
+            }
+        )
 
     if not merged:
         raise HTTPException(status_code=400, detail="No transcript segments found for provided recording_ids")
 
     llm = get_llm_service()
-    prompt = (
-        "你是一个严谨的中文智能陪伴助理。以下是用户的对话转写片段（格式：[recording#segment] 文本）：\n"
-        + "\n".join(merged)
-        + "\n\n用户问题："
+    built = build_prompt(
+        "你是一个严谨的中文智能陪伴助理。以下是用户的对话转写片段（格式：[recording#segment] 文本）：\n",
+        merged,
+        "\n\n用户问题："
         + body.question
         + "\n\n要求：\n"
         + "1) 优先基于提供的内容回答，不要编造。\n"
         + "2) 如果涉及“见了哪些人”，请列出人物并给出对应片段编号作为证据。\n"
         + "3) 如果涉及“不妥当的地方”，指出片段编号并给出更合理的说法建议。\n"
-        + "4) 输出：先给回答，再给 citations（列出你引用到的片段编号）。\n"
+        + "4) 输出：先给回答，再给 citations（列出你引用到的片段编号）。\n",
+        budget_tokens=budget_for_model(llm.model),
+        query=body.question,
     )
+    prompt = built.text
 
-    resp = llm.client.chat.completions.create(
-        model=llm.model,
-        messages=[
+    answer = await llm.chat(
+        [
             {"role": "system", "content": "You are a helpful assistant."},
             {"role": "user", "content": prompt},
         ],
         temperature=0.2,
     )
-    answer = resp.choices[0].message.content or ""
 
-    return {"data": {"answer": answer, "available_citations": citations}}
+    return {
+        "data": {
+            "answer": answer,
+            "available_citations": citations,
+            "prompt_tokens": built.prompt_tokens,
+            "retrieval": {**retrieval, "segments_dropped": built.dropped_lines},
+        }
+    }
 
 
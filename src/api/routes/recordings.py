@@ -1,9 +1,13 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from datetime import date as Date
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, status
 from pydantic import BaseModel, Field
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
-from src.db import get_db, Base, engine
-from src.services.recording_service import RecordingService
+from src.db import get_async_db, get_db, Base, engine
+from src.services.recording_service import AsyncRecordingService, RecordingService, local_date
 from src.services.oss_service import get_oss_service
 
 
@@ -32,16 +36,16 @@ class RecordingResponse(BaseModel):
 
 
 @router.post("", response_model=RecordingResponse)
-def create_recording(
+async def create_recording(
     body: RecordingCreateRequest,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
-    recording_service = RecordingService(db)
+    recording_service = AsyncRecordingService(db)
     oss_service = get_oss_service()
 
     oss_file_path = oss_service.object_key_for_recording_with_ext(body.recording_id, body.file_ext)
 
-    rec = recording_service.create_or_get_recording(
+    rec = await recording_service.create_or_get_recording(
         device_id=body.device_id,
         recording_id=body.recording_id,
         start_at=body.start_at,
@@ -61,13 +65,66 @@ def create_recording(
     )
 
 
+def _parse_cursor(cursor: str) -> tuple:
+    start_at, sep, rec_id = cursor.partition("_")
+    if not sep or not start_at.lstrip("-").isdigit() or not rec_id.isdigit():
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+    return int(start_at), int(rec_id)
+
+
+@router.get("")
+async def list_recordings(
+    device_id: str = Query(..., description="设备 ID"),
+    date: Optional[Date] = Query(None, description="本地日期 YYYY-MM-DD，按录音自身时区判断；与 date_from/date_to 二选一"),
+    date_from: Optional[Date] = Query(None, description="本地日期范围起（含）"),
+    date_to: Optional[Date] = Query(None, description="本地日期范围止（含）"),
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = Query(None, description="上一页返回的 next_cursor"),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """按设备 + 本地日期列出录音，按开始时间升序，keyset 分页。"""
+    if date is not None:
+        date_from = date_to = date
+    if date_from is None or date_to is None:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="date or date_from/date_to is required")
+    if date_to < date_from:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="date_to must not be before date_from")
+
+    recs, next_key = await AsyncRecordingService(db).list_for_device(
+        device_id,
+        date_from,
+        date_to,
+        limit=limit,
+        after=_parse_cursor(cursor) if cursor else None,
+    )
+    return {
+        "data": {
+            "items": [
+                {
+                    **RecordingResponse(
+                        device_id=rec.device_id,
+                        recording_id=rec.recording_id,
+                        start_at=rec.start_at,
+                        end_at=rec.end_at,
+                        timezone=rec.timezone,
+                        oss_file_path=rec.oss_file_path,
+                        status=rec.status,
+                    ).model_dump(),
+                    "local_date": local_date(rec).isoformat(),
+                }
+                for rec in recs
+            ],
+            "next_cursor": f"{next_key[0]}_{next_key[1]}" if next_key else None,
+        }
+    }
+
+
 @router.get("/{recording_id}", response_model=RecordingResponse)
-def get_recording(
+async def get_recording(
     recording_id: str,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
-    recording_service = RecordingService(db)
-    rec = recording_service.get_recording(recording_id)
+    rec = await AsyncRecordingService(db).get_recording(recording_id)
     if not rec:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Recording not found")
 
@@ -0,0 +1,36 @@
+from typing import Literal, Optional
+
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy.orm import Session
+
+from src.api.deps import get_identity
+from src.db import get_db
+from src.services.search_service import MAX_PAGE_SIZE, TranscriptSearchService
+
+
+router = APIRouter(prefix="/transcripts", tags=["transcripts"])
+
+
+@router.get("/search")
+def search_transcripts(
+    q: str = Query(..., min_length=1, description="搜索词，空格分隔多个词（需同时出现）"),
+    device_id: str = Query(..., min_length=1, description="设备 ID，只搜该设备的录音"),
+    start_from: Optional[int] = Query(None, description="录音开始时间下限（Unix 秒，含）"),
+    start_to: Optional[int] = Query(None, description="录音开始时间上限（Unix 秒，不含）"),
+    page: int = Query(1, ge=1),
+    page_size: int = Query(20, ge=1, le=MAX_PAGE_SIZE),
+    order: Literal["time", "relevance"] = Query("time", description="time：按录音时间倒序；relevance：按相关度"),
+    db: Session = Depends(get_db),
+    identity_info: dict = Depends(get_identity),
+):
+    """在一个设备的转写中全文搜索；需要登录或游客身份，查询始终以 device_id 为边界。"""
+    data = TranscriptSearchService(db).search(
+        q,
+        device_id,
+        start_from=start_from,
+        start_to=start_to,
+        page=page,
+        page_size=page_size,
+        order=order,
+    )
+    return {"data": data}
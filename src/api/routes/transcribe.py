@@ -1,12 +1,27 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from pydantic import BaseModel
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from fastapi.concurrency import run_in_threadpool
+from pydantic import BaseModel, Field
 from sqlalchemy.orm import Session
 
 from src.db import get_db, Base, engine
+from src.services.asr_cache_service import cache_stats
+from src.services.asr_poller import ASRTaskCancelled, get_asr_poller
 from src.services.asr_service import get_asr_service
 from src.services.oss_service import get_oss_service
 from src.services.recording_service import RecordingService
 from src.services.transcript_service import TranscriptService
+from src.services.transcription_job_service import (
+    apply_transcription_output,
+    build_callback_url,
+    is_callback_task,
+    register_callback_task,
+    transcribe_and_save,
+    submit_transcription_batch,
+    verify_callback_signature,
+    watch_task_as_safety_net,
+)
 
 
 Base.metadata.create_all(bind=engine)
@@ -30,12 +45,73 @@ def start_transcribe(body: TranscribeStartRequest, db: Session = Depends(get_db)
     download_url = oss.sign_url_for_key("GET", rec.oss_file_path, 3600)
 
     asr = get_asr_service()
-    task_id = asr.create_transcription_task([download_url])
+    audio_seconds = rec.end_at - rec.start_at
+    callback_url = build_callback_url(body.recording_id, audio_seconds) if body.use_callback else None
+    task_id = asr.create_transcription_task([download_url], callback_url=callback_url)
 
     rec.status = "transcribing"
     db.commit()
 
-    return {"data": {"recording_id": body.recording_id, "task_id": task_id, "status": "transcribing"}}
+    if body.use_callback:
+        register_callback_task(db, task_id, body.recording_id)
+        # 结果由回调落库；轮询只作低频兜底
+        watch_task_as_safety_net(task_id, body.recording_id, audio_seconds=audio_seconds)
+
+    return {
+        "data": {
+            "recording_id": body.recording_id,
+            "task_id": task_id,
+            "status": "transcribing",
+            "use_callback": body.use_callback,
+        }
+    }
+
+
+@router.post("/callback", include_in_schema=False)
+async def transcribe_callback(
+    request: Request,
+    recording_id: str = Query(...),
+    exp: int = Query(...),
+    sig: str = Query(...),
+    db: Session = Depends(get_db),
+):
+    """
+    DashScope 转写完成回调：校验签名与过期时间，确认 task_id 登记在该录音名下，
+    再由服务端重新查询任务结果后写入转写并推进录音状态。body 只用来取 task_id。
+    """
+    if not verify_callback_signature(recording_id, exp, sig):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Invalid callback signature")
+    try:
+        payload = await request.json()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid JSON body")
+    if not isinstance(payload, dict):
+        raise HTTPException(status_code=400, detail="Invalid callback payload")
+
+    reported = payload.get("output") if isinstance(payload.get("output"), dict) else payload
+    task_id = reported.get("task_id") or payload.get("task_id")
+    if not isinstance(task_id, str) or not task_id:
+        raise HTTPException(status_code=400, detail="Missing task_id")
+    if not await run_in_threadpool(is_callback_task, db, recording_id, task_id):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Unknown task for recording")
+
+    try:
+        output = await run_in_threadpool(get_asr_service().fetch_task, task_id)
+    except Exception as e:
+        raise HTTPException(status_code=502, detail=f"ASR fetch failed: {str(e)}")
+    saved = await run_in_threadpool(apply_transcription_output, db, recording_id, output or {})
+    if saved is not None:
+        get_asr_poller().cancel(task_id)
+
+    rec = RecordingService(db).get_recording(recording_id)
+    return {
+        "data": {
+            "recording_id": recording_id,
+            "task_id": task_id,
+            "segments_saved": saved or 0,
+            "status": rec.status if rec else None,
+        }
+    }
 
 
 @router.get("/query/{task_id}")
@@ -50,28 +126,136 @@ class TranscribeWaitRequest(BaseModel):
     task_id: str
 
 
+@router.get("/poller")
+def poller_stats():
+    """集中轮询器状态：在途任务数与每个任务的等待时长。"""
+    return {"data": get_asr_poller().stats()}
+
+
+@router.get("/cache-stats")
+def asr_cache_stats():
+    """转写结果缓存命中统计（本进程）。"""
+    return {"data": cache_stats()}
+
+
 @router.post("/wait-and-save")
-def wait_and_save(body: TranscribeWaitRequest, db: Session = Depends(get_db)):
+async def wait_and_save(body: TranscribeWaitRequest, db: Session = Depends(get_db)):
     recording_service = RecordingService(db)
     rec = recording_service.get_recording(body.recording_id)
     if not rec:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Recording not found")
 
     asr = get_asr_service()
-    segments = asr.wait_transcription(body.task_id)
-    if not segments:
+    transcript_service = TranscriptService(db)
+    try:
+        output = await asr.await_output(body.task_id, audio_seconds=rec.end_at - rec.start_at)
+        # 流式解析结果并边解析边落库
+        saved = await run_in_threadpool(
+            transcript_service.replace_segments,
+            body.recording_id,
+            asr.iter_segments(output),
+            asr_model=asr.settings.asr_model,
+        )
+    except ASRTaskCancelled:
+        # 回调已先行落库并取消了轮询：按已处理返回录音当前状态
+        db.refresh(rec)
+        return {
+            "data": {
+                "recording_id": body.recording_id,
+                "segments_saved": len(transcript_service.list_segments(body.recording_id)),
+                "status": rec.status,
+            }
+        }
+    except (TimeoutError, RuntimeError) as e:
+        rec.status = "failed"
+        rec.error_code = "ASR_ERROR"
+        rec.error_message = f"ASR wait failed: {str(e)}"[:256]
+        db.commit()
+        raise HTTPException(status_code=500, detail=f"ASR failed: {str(e)}")
+    if not saved:
         rec.status = "failed"
         rec.error_code = "ASR_EMPTY"
         rec.error_message = "ASR returned empty segments"
         db.commit()
         raise HTTPException(status_code=500, detail="ASR failed or returned empty result")
 
-    transcript_service = TranscriptService(db)
-    transcript_service.replace_segments(body.recording_id, segments, asr_model=asr.settings.asr_model)
+    rec.status = "analyzing"
+    db.commit()
+
+    return {
+        "data": {
+            "recording_id": body.recording_id,
+            "segments_saved": saved,
+            "status": rec.status,
+        }
+    }
+
+
+class TranscribeChunkedRequest(BaseModel):
+    recording_id: str
+
+
+@router.post("/chunked-and-save")
+async def chunked_and_save(body: TranscribeChunkedRequest, db: Session = Depends(get_db)):
+    """
+    转写并落库：相同音频内容命中缓存则直接复用；长 WAV 切段并行转写后拼接，
+    不满足切段条件时回退为整文件转写。
+    """
+    recording_service = RecordingService(db)
+    rec = recording_service.get_recording(body.recording_id)
+    if not rec:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Recording not found")
+
+    rec.status = "transcribing"
+    db.commit()
+
+    try:
+        saved, cache_hit = await transcribe_and_save(db, rec)
+    except (TimeoutError, RuntimeError) as e:
+        rec.status = "failed"
+        rec.error_code = "ASR_ERROR"
+        rec.error_message = f"ASR wait failed: {str(e)}"[:256]
+        db.commit()
+        raise HTTPException(status_code=500, detail=f"ASR failed: {str(e)}")
+    if not saved:
+        rec.status = "failed"
+        rec.error_code = "ASR_EMPTY"
+        rec.error_message = "ASR returned empty segments"
+        db.commit()
+        raise HTTPException(status_code=500, detail="ASR failed or returned empty result")
 
     rec.status = "analyzing"
     db.commit()
 
-    return {"data": {"recording_id": body.recording_id, "segments_saved": len(segments), "status": rec.status}}
+    return {
+        "data": {
+            "recording_id": body.recording_id,
+            "segments_saved": saved,
+            "asr_cache_hit": cache_hit,
+            "status": rec.status,
+        }
+    }
+
+
+class TranscribeBatchRequest(BaseModel):
+    recording_ids: Optional[List[str]] = Field(None, description="不传则处理 status=uploaded 的积压录音")
+    limit: int = Field(500, ge=1, le=5000)
+
+
+@router.post("/batch")
+async def transcribe_batch(body: TranscribeBatchRequest, db: Session = Depends(get_db)):
+    """
+    夜间积压批处理：多条录音打包进同一个转写任务，创建任务后立即返回各录音的 task_id；
+    任务完成后由集中轮询器按录音拆分落库，进度通过录音状态查询。
+    """
+    recording_service = RecordingService(db)
+    if body.recording_ids:
+        recs = [r for r in (recording_service.get_recording(rid) for rid in body.recording_ids[: body.limit]) if r]
+    else:
+        recs = recording_service.list_by_status("uploaded", limit=body.limit)
+    if not recs:
+        return {"data": {"recordings": []}}
 
+    results = await submit_transcription_batch(db, recs)
+    return {"data": {"recordings": results}}
 
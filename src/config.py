@@ -1,5 +1,5 @@
 from functools import lru_cache
-from typing import Optional
+from typing import Dict, Optional
 
 from pydantic import BaseModel, Field
 from dotenv import load_dotenv
@@ -22,6 +22,54 @@ class DashScopeSettings(BaseModel):
     api_key: str = Field(default="", description="DASHSCOPE_API_KEY")
     asr_model: str = Field(default="paraformer-v1")
     llm_model: str = Field(default="qwen-plus")
+    compatible_base_url: str = Field(
+        default="https://dashscope.aliyuncs.com/compatible-mode/v1",
+        description="OpenAI 兼容接口地址；离线压测时指向 scripts/fake_cloud.py",
+    )
+    llm_max_concurrency: int = Field(default=200, description="单个 worker 同时在途的 LLM 请求上限")
+    llm_pool_max_connections: int = Field(default=100, description="LLM keep-alive 连接池大小")
+    llm_timeout_seconds: float = Field(default=180.0)
+    llm_warm_connections: int = Field(default=4, description="启动时预热的连接数，0 关闭")
+    llm_cache_enabled: bool = Field(default=True, description="内容 Skill 相同输入复用已有生成结果")
+    llm_cache_ttl_seconds: int = Field(default=7 * 24 * 3600, description="Skill 结果缓存有效期（秒）")
+    llm_cache_memory_entries: int = Field(default=1000, description="进程内 LRU 条目上限")
+    llm_cache_max_bytes: int = Field(default=100 * 1024 * 1024, description="SQLite 层总大小上限（压缩后字节）")
+    llm_prompt_token_budget: int = Field(default=30000, description="转写类 prompt 的默认 token 预算")
+    llm_prompt_token_budgets: Dict[str, int] = Field(
+        default_factory=dict, description="按模型覆盖的 token 预算，如 qwen-plus=100000,qwen-turbo=6000"
+    )
+    analysis_window_tokens: int = Field(default=6000, description="分析时每个窗口的转写文本 token 预算，超过则分窗 map-reduce")
+    asr_poll_min_interval: float = Field(default=1.0, description="转写任务首次轮询间隔（秒）")
+    asr_poll_max_interval: float = Field(default=30.0, description="转写任务最大轮询间隔（秒）")
+    asr_callback_secret: str = Field(default="", description="转写回调 URL 签名密钥，留空则使用 JWT_SECRET")
+    asr_callback_safety_poll_seconds: float = Field(default=300.0, description="回调模式下兜底轮询间隔（秒）")
+    asr_chunking_enabled: bool = Field(default=True, description="长 WAV 是否切段并行转写")
+    asr_chunking_min_audio_seconds: int = Field(default=300, description="超过该时长的音频才切段")
+    asr_chunk_target_seconds: int = Field(default=60)
+    asr_chunk_min_seconds: int = Field(default=30)
+    asr_chunk_max_seconds: int = Field(default=120)
+    asr_vad_enabled: bool = Field(default=True, description="送 ASR 前去掉 WAV 中的长静音")
+    asr_vad_threshold_db: float = Field(default=-50.0, description="语音能量下限（dBFS）")
+    asr_vad_min_silence_ms: int = Field(default=2000, description="短于该时长的静音保留")
+    asr_batch_max_files: int = Field(default=100, description="单个转写任务最多打包的文件数（DashScope 上限 100）")
+    asr_cache_enabled: bool = Field(default=True, description="相同音频内容复用已有转写结果")
+    asr_cache_max_bytes: int = Field(default=200 * 1024 * 1024, description="转写缓存总大小上限（压缩后字节）")
+
+
+class DatabaseSettings(BaseModel):
+    url: str = Field(default="sqlite:///./sofew.db", description="DATABASE_URL，SQLAlchemy 连接串")
+    async_url: Optional[str] = Field(
+        default=None,
+        description="DATABASE_ASYNC_URL，异步 engine 的连接串；留空按 url 换成对应的异步驱动（aiosqlite / asyncpg / aiomysql）",
+    )
+    pool_size: int = Field(default=10, description="每个 worker 常驻连接数；总连接数约为 WORKERS × (pool_size + max_overflow)")
+    max_overflow: int = Field(default=20, description="每个 worker 高峰时额外允许的连接数")
+    pool_timeout: float = Field(default=30.0, description="等待空闲连接的最长秒数")
+    sqlite_journal_mode: str = Field(default="WAL", description="WAL 下读写互不阻塞，多 worker 只在写入时排队")
+    sqlite_synchronous: str = Field(default="NORMAL", description="WAL 下 NORMAL 仍保证一致性，仅断电时可能丢最后几个事务")
+    sqlite_busy_timeout_ms: int = Field(default=5000, description="写锁被占用时等待的毫秒数，超时才报 database is locked")
+    sqlite_mmap_size: int = Field(default=256 * 1024 * 1024, description="读取使用内存映射的字节数，0 关闭")
+    sqlite_cache_size_kb: int = Field(default=64 * 1024, description="每个连接的页缓存（KB）")
 
 
 class OSSSettings(BaseModel):
@@ -41,6 +89,13 @@ class AuthSettings(BaseModel):
     admin_username: str = Field(default="YANGRONG", description="管理员账号")
     admin_password: str = Field(default="YANGRONG", description="管理员密码")
     guest_free_quota: int = Field(default=3, description="游客免费次数")
+    reservation_ttl_seconds: int = Field(
+        default=3600, description="用量预留超过该秒数仍未结算（进程中途退出）时，启动时自动退回"
+    )
+    identity_cache_ttl_seconds: float = Field(
+        default=10.0, description="进程内身份缓存有效期（秒），0 关闭；其他 worker 上的余额变化最多延迟这么久可见"
+    )
+    identity_cache_entries: int = Field(default=4096, description="身份缓存（token 与身份快照各自）的 LRU 条目上限")
 
 
 class EmailSettings(BaseModel):
@@ -54,14 +109,43 @@ class EmailSettings(BaseModel):
     send_welcome_email: bool = Field(default=False, description="注册成功后是否发欢迎邮件")
 
 
+class EmbeddingSettings(BaseModel):
+    provider: str = Field(default="dashscope", description="dashscope | hashing（本地哈希向量，离线可用）")
+    model: str = Field(default="text-embedding-v3")
+    dim: int = Field(default=1024, description="向量维度；hashing 同样使用该维度")
+    batch_size: int = Field(default=10, description="单次向量化请求的文本条数（text-embedding-v3 上限 10）")
+    store_dir: str = Field(default="./data/embeddings", description="向量文件目录，按 provider/model/维度分子目录")
+
+
+class QASettings(BaseModel):
+    retrieval_enabled: bool = Field(default=True, description="问答前用 BM25 只挑选相关片段")
+    top_k: int = Field(default=20, description="BM25 取前 k 个片段")
+    neighbor_segments: int = Field(default=1, description="每个命中片段前后各带几个相邻片段作为上下文")
+    semantic_enabled: bool = Field(default=True, description="同时按向量相似度召回片段，与 BM25 结果融合")
+    semantic_min_score: float = Field(default=0.35, description="向量召回的最低余弦相似度，低于则不计入")
+
+
 class Settings(BaseModel):
     app: AppSettings
     dashscope: DashScopeSettings
+    qa: QASettings
+    embedding: EmbeddingSettings
+    database: DatabaseSettings
     oss: OSSSettings
     auth: AuthSettings
     email: EmailSettings
 
 
+def _parse_int_map(raw: str) -> Dict[str, int]:
+    """解析 "a=1,b=2"，忽略格式不对的项。"""
+    result: Dict[str, int] = {}
+    for item in raw.split(","):
+        key, _, value = item.partition("=")
+        if key.strip() and value.strip().isdigit():
+            result[key.strip()] = int(value.strip())
+    return result
+
+
 @lru_cache()
 def get_settings() -> Settings:
     return Settings(
@@ -74,6 +158,61 @@ def get_settings() -> Settings:
             api_key=os.getenv("DASHSCOPE_API_KEY", ""),
             asr_model=os.getenv("DASHSCOPE_ASR_MODEL", "paraformer-v1"),
             llm_model=os.getenv("DASHSCOPE_LLM_MODEL", "qwen-plus"),
+            compatible_base_url=os.getenv(
+                "DASHSCOPE_COMPATIBLE_BASE_URL", "https://dashscope.aliyuncs.com/compatible-mode/v1"
+            ),
+            llm_max_concurrency=int(os.getenv("LLM_MAX_CONCURRENCY", "200")),
+            llm_pool_max_connections=int(os.getenv("LLM_POOL_MAX_CONNECTIONS", "100")),
+            llm_timeout_seconds=float(os.getenv("LLM_TIMEOUT_SECONDS", "180")),
+            llm_warm_connections=int(os.getenv("LLM_WARM_CONNECTIONS", "4")),
+            llm_cache_enabled=os.getenv("LLM_CACHE_ENABLED", "true").lower() == "true",
+            llm_cache_ttl_seconds=int(os.getenv("LLM_CACHE_TTL_SECONDS", str(7 * 24 * 3600))),
+            llm_cache_memory_entries=int(os.getenv("LLM_CACHE_MEMORY_ENTRIES", "1000")),
+            llm_cache_max_bytes=int(os.getenv("LLM_CACHE_MAX_BYTES", str(100 * 1024 * 1024))),
+            llm_prompt_token_budget=int(os.getenv("LLM_PROMPT_TOKEN_BUDGET", "30000")),
+            llm_prompt_token_budgets=_parse_int_map(os.getenv("LLM_PROMPT_TOKEN_BUDGETS", "")),
+            analysis_window_tokens=int(os.getenv("ANALYSIS_WINDOW_TOKENS", "6000")),
+            asr_poll_min_interval=float(os.getenv("ASR_POLL_MIN_INTERVAL", "1.0")),
+            asr_poll_max_interval=float(os.getenv("ASR_POLL_MAX_INTERVAL", "30.0")),
+            asr_callback_secret=os.getenv("ASR_CALLBACK_SECRET", ""),
+            asr_callback_safety_poll_seconds=float(os.getenv("ASR_CALLBACK_SAFETY_POLL_SECONDS", "300")),
+            asr_chunking_enabled=os.getenv("ASR_CHUNKING_ENABLED", "true").lower() == "true",
+            asr_chunking_min_audio_seconds=int(os.getenv("ASR_CHUNKING_MIN_AUDIO_SECONDS", "300")),
+            asr_chunk_target_seconds=int(os.getenv("ASR_CHUNK_TARGET_SECONDS", "60")),
+            asr_chunk_min_seconds=int(os.getenv("ASR_CHUNK_MIN_SECONDS", "30")),
+            asr_chunk_max_seconds=int(os.getenv("ASR_CHUNK_MAX_SECONDS", "120")),
+            asr_vad_enabled=os.getenv("ASR_VAD_ENABLED", "true").lower() == "true",
+            asr_vad_threshold_db=float(os.getenv("ASR_VAD_THRESHOLD_DB", "-50")),
+            asr_vad_min_silence_ms=int(os.getenv("ASR_VAD_MIN_SILENCE_MS", "2000")),
+            asr_batch_max_files=int(os.getenv("ASR_BATCH_MAX_FILES", "100")),
+            asr_cache_enabled=os.getenv("ASR_CACHE_ENABLED", "true").lower() == "true",
+            asr_cache_max_bytes=int(os.getenv("ASR_CACHE_MAX_BYTES", str(200 * 1024 * 1024))),
+        ),
+        qa=QASettings(
+            retrieval_enabled=os.getenv("QA_RETRIEVAL_ENABLED", "true").lower() == "true",
+            top_k=int(os.getenv("QA_TOP_K", "20")),
+            neighbor_segments=int(os.getenv("QA_NEIGHBOR_SEGMENTS", "1")),
+            semantic_enabled=os.getenv("QA_SEMANTIC_ENABLED", "true").lower() == "true",
+            semantic_min_score=float(os.getenv("QA_SEMANTIC_MIN_SCORE", "0.35")),
+        ),
+        embedding=EmbeddingSettings(
+            provider=os.getenv("EMBEDDING_PROVIDER", "dashscope"),
+            model=os.getenv("EMBEDDING_MODEL", "text-embedding-v3"),
+            dim=int(os.getenv("EMBEDDING_DIM", "1024")),
+            batch_size=int(os.getenv("EMBEDDING_BATCH_SIZE", "10")),
+            store_dir=os.getenv("EMBEDDING_STORE_DIR", "./data/embeddings"),
+        ),
+        database=DatabaseSettings(
+            url=os.getenv("DATABASE_URL", "sqlite:///./sofew.db"),
+            async_url=os.getenv("DATABASE_ASYNC_URL") or None,
+            pool_size=int(os.getenv("DB_POOL_SIZE", "10")),
+            max_overflow=int(os.getenv("DB_MAX_OVERFLOW", "20")),
+            pool_timeout=float(os.getenv("DB_POOL_TIMEOUT", "30")),
+            sqlite_journal_mode=os.getenv("SQLITE_JOURNAL_MODE", "WAL"),
+            sqlite_synchronous=os.getenv("SQLITE_SYNCHRONOUS", "NORMAL"),
+            sqlite_busy_timeout_ms=int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000")),
+            sqlite_mmap_size=int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024))),
+            sqlite_cache_size_kb=int(os.getenv("SQLITE_CACHE_SIZE_KB", str(64 * 1024))),
         ),
         oss=OSSSettings(
             endpoint=os.getenv("OSS_ENDPOINT", "oss-cn-beijing.aliyuncs.com"),
@@ -91,6 +230,9 @@ def get_settings() -> Settings:
             admin_username=os.getenv("ADMIN_USERNAME", "YANGRONG"),
             admin_password=os.getenv("ADMIN_PASSWORD", "YANGRONG"),
             guest_free_quota=int(os.getenv("GUEST_FREE_QUOTA", "3")),
+            reservation_ttl_seconds=int(os.getenv("QUOTA_RESERVATION_TTL_SECONDS", "3600")),
+            identity_cache_ttl_seconds=float(os.getenv("IDENTITY_CACHE_TTL_SECONDS", "10")),
+            identity_cache_entries=int(os.getenv("IDENTITY_CACHE_ENTRIES", "4096")),
         ),
         email=EmailSettings(
             smtp_host=os.getenv("SMTP_HOST", ""),
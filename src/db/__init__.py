@@ -1,5 +1,3 @@
-from .session import Base, engine, get_db
-
-__all__ = ["Base", "engine", "get_db"]
-
+from .session import Base, engine, get_async_db, get_db
 
+__all__ = ["Base", "engine", "get_async_db", "get_db"]
@@ -0,0 +1,77 @@
+"""
+transcript_segments 的 FTS5 全文索引（transcript_fts）。
+
+- 中文逐字切开再交给 unicode61 分词，查询词转为短语查询（"王 总"），任意长度的中文子串都能命中；
+  trigram 分词器对两字词（人名、“合同”等最常见的查询）无能为力，因此不用。
+- 表为 contentless（content=''），只存倒排，原文仍在 transcript_segments，摘要由调用方按原文生成。
+- 由 transcript_segments 上的触发器同步插入 / 删除 / 改文本；触发器调用 Python 注册的 fts_tokens()，
+  连接建立时由 register_functions 注册。不经本应用的连接（如 sqlite3 命令行）写入片段会因缺少函数而报错。
+"""
+import re
+
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+
+
+FTS_TABLE = "transcript_fts"
+
+_CJK_CHAR_RE = re.compile(r"([\u3400-\u9fff\uf900-\ufaff])")
+
+_DDL = [
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(body, content='', tokenize='unicode61')",
+    f"""
+    CREATE TRIGGER IF NOT EXISTS transcript_segments_fts_ai AFTER INSERT ON transcript_segments BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, body) VALUES (new.id, fts_tokens(new.text));
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS transcript_segments_fts_ad AFTER DELETE ON transcript_segments BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, body) VALUES ('delete', old.id, fts_tokens(old.text));
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS transcript_segments_fts_au AFTER UPDATE OF text ON transcript_segments BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, body) VALUES ('delete', old.id, fts_tokens(old.text));
+        INSERT INTO {FTS_TABLE}(rowid, body) VALUES (new.id, fts_tokens(new.text));
+    END
+    """,
+]
+
+
+def fts_tokens(value) -> str:
+    """中文字符前后加空格，使 unicode61 按字切分；其余内容（英文、数字）按原分词规则。"""
+    if value is None:
+        return ""
+    return _CJK_CHAR_RE.sub(r" \1 ", str(value))
+
+
+def to_match_query(query: str) -> str:
+    """用户输入按空白拆词，每个词转为 FTS5 短语，多个词之间为 AND；无有效词时返回空串。"""
+    phrases = []
+    for term in query.split():
+        tokens = fts_tokens(term.replace('"', " ")).split()
+        if tokens:
+            phrases.append('"' + " ".join(tokens) + '"')
+    return " ".join(phrases)
+
+
+def register_functions(dbapi_connection, _connection_record=None) -> None:
+    """engine 的 connect 事件回调：注册触发器与查询用到的 SQL 函数。"""
+    dbapi_connection.create_function("fts_tokens", 1, fts_tokens, deterministic=True)
+
+
+def ensure_fts(engine: Engine) -> None:
+    """建表与触发器（幂等）；首次建表时为已有片段补建索引。非 SQLite 数据库跳过。"""
+    if engine.dialect.name != "sqlite":
+        return
+    with engine.begin() as conn:
+        exists = conn.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+            {"name": FTS_TABLE},
+        ).first()
+        for stmt in _DDL:
+            conn.execute(text(stmt))
+        if not exists:
+            conn.execute(
+                text(f"INSERT INTO {FTS_TABLE}(rowid, body) SELECT id, fts_tokens(text) FROM transcript_segments")
+            )
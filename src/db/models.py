@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, BigInteger, TIMESTAMP, Text, ForeignKey
+from sqlalchemy import Column, Integer, String, BigInteger, TIMESTAMP, Text, ForeignKey, Index, LargeBinary, UniqueConstraint
 from sqlalchemy.sql import func
 
 from .session import Base
@@ -26,11 +26,41 @@ class GuestUsage(Base):
     updated_at = Column(TIMESTAMP, nullable=False, server_default=func.now(), onupdate=func.now())
 
 
+class UsageLedgerEntry(Base):
+    """
+    用量流水，只追加不修改：reserve 预扣、commit 确认、release 退回、grant 充值。
+    phase 为 open（预留）/ settle（结算）；同一预留最多一条结算，由唯一约束保证 commit 与 release 互斥且只生效一次。
+    """
+    __tablename__ = "usage_ledger"
+    __table_args__ = (
+        UniqueConstraint("reservation_id", "phase", name="uq_usage_ledger_reservation_phase"),
+        Index("ix_usage_ledger_identity", "identity_type", "identity_key", "created_at"),
+        # 启动时回收超时未结算的预留
+        Index("ix_usage_ledger_phase_created", "phase", "created_at"),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    reservation_id = Column(String(36), nullable=True)  # grant 为空
+    phase = Column(String(8), nullable=True)  # open | settle，grant 为空
+    event = Column(String(16), nullable=False)  # reserve | commit | release | grant
+    identity_type = Column(String(8), nullable=False)  # guest | user
+    identity_key = Column(String(64), nullable=False)  # guest_id 或 user_id
+    amount = Column(Integer, nullable=False)
+    reason = Column(String(64), nullable=False, default="")
+    created_at = Column(TIMESTAMP, nullable=False, server_default=func.now())
+
+
 class RecordingMeta(Base):
     __tablename__ = "recording_meta"
+    __table_args__ = (
+        # 按设备 + 时间范围列表（keyset 分页按 (start_at, id) 推进，id 即 rowid，已隐含在索引中）
+        Index("ix_recording_meta_device_start", "device_id", "start_at"),
+        # 按状态取待处理录音（list_by_status）
+        Index("ix_recording_meta_status_start", "status", "start_at"),
+    )
 
     id = Column(Integer, primary_key=True, index=True, autoincrement=True)
-    device_id = Column(String(64), index=True, nullable=False)
+    device_id = Column(String(64), nullable=False)
     recording_id = Column(String(128), unique=True, nullable=False, index=True)
     start_at = Column(BigInteger, nullable=False)
     end_at = Column(BigInteger, nullable=False)
@@ -43,6 +73,16 @@ class RecordingMeta(Base):
     create_time = Column(TIMESTAMP, nullable=False, server_default=func.now())
 
 
+class ASRCallbackTask(Base):
+    """回调模式下提交的转写任务：回调只接受登记在该录音名下的 task_id。"""
+    __tablename__ = "asr_callback_tasks"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    task_id = Column(String(128), unique=True, nullable=False)
+    recording_id = Column(String(128), nullable=False, index=True)
+    created_at = Column(TIMESTAMP, nullable=False, server_default=func.now())
+
+
 class TranscriptSegment(Base):
     __tablename__ = "transcript_segments"
 
@@ -57,6 +97,47 @@ class TranscriptSegment(Base):
     created_at = Column(TIMESTAMP, nullable=False, server_default=func.now())
 
 
+class TranscriptTerm(Base):
+    """转写片段的 BM25 倒排：每个 (片段, 词) 一行，doc_len 为该片段的词数。"""
+    __tablename__ = "transcript_terms"
+    __table_args__ = (
+        Index("ix_transcript_terms_term_recording", "term", "recording_id"),
+        Index("ix_transcript_terms_recording", "recording_id"),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    recording_id = Column(String(128), nullable=False)
+    segment_index = Column(Integer, nullable=False)
+    term = Column(String(32), nullable=False)
+    tf = Column(Integer, nullable=False, default=1)
+    doc_len = Column(Integer, nullable=False, default=0)
+
+
+class TranscriptIndexStat(Base):
+    """每条录音的倒排统计，用于计算 BM25 的 N 与平均片段长度。"""
+    __tablename__ = "transcript_index_stats"
+
+    recording_id = Column(String(128), primary_key=True)
+    segment_count = Column(Integer, nullable=False, default=0)
+    total_terms = Column(Integer, nullable=False, default=0)
+
+
+class SegmentEmbedding(Base):
+    """片段在向量文件中的行号；text_hash 变化（片段改写）时重新向量化并追加新行。"""
+    __tablename__ = "segment_embeddings"
+    __table_args__ = (
+        UniqueConstraint("space", "segment_id", name="uq_segment_embeddings_space_segment"),
+        Index("ix_segment_embeddings_space_recording", "space", "recording_id"),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    space = Column(String(96), nullable=False)  # Embedder.space，如 text-embedding-v3-1024
+    segment_id = Column(Integer, nullable=False)
+    recording_id = Column(String(128), nullable=False)
+    row = Column(Integer, nullable=False)
+    text_hash = Column(String(16), nullable=False)
+
+
 class RecordingAnalysis(Base):
     __tablename__ = "recording_analyses"
 
@@ -71,3 +152,33 @@ class RecordingAnalysis(Base):
     created_at = Column(TIMESTAMP, nullable=False, server_default=func.now())
 
 
+class ASRCacheEntry(Base):
+    """按音频内容哈希 + asr_model 缓存的转写结果（segments 为 zlib 压缩的 JSON）。"""
+    __tablename__ = "asr_result_cache"
+    __table_args__ = (UniqueConstraint("content_hash", "asr_model", name="uq_asr_cache_hash_model"),)
+
+    id = Column(Integer, primary_key=True, index=True, autoincrement=True)
+    content_hash = Column(String(128), nullable=False)
+    asr_model = Column(String(64), nullable=False)
+    segments_blob = Column(LargeBinary, nullable=False)
+    segment_count = Column(Integer, nullable=False, default=0)
+    size_bytes = Column(Integer, nullable=False, default=0)
+    created_at = Column(TIMESTAMP, nullable=False, server_default=func.now())
+    last_used_at = Column(BigInteger, nullable=False, default=0, index=True)
+
+
+class LLMResponseCacheEntry(Base):
+    """内容 Skill 的 LLM 生成结果缓存（response 为 zlib 压缩的 UTF-8 文本）。"""
+    __tablename__ = "llm_response_cache"
+
+    id = Column(Integer, primary_key=True, index=True, autoincrement=True)
+    cache_key = Column(String(64), unique=True, nullable=False)
+    skill = Column(String(32), nullable=False, default="")
+    model = Column(String(64), nullable=False)
+    response_blob = Column(LargeBinary, nullable=False)
+    size_bytes = Column(Integer, nullable=False, default=0)
+    expires_at = Column(BigInteger, nullable=False, default=0, index=True)
+    last_used_at = Column(BigInteger, nullable=False, default=0, index=True)
+    created_at = Column(TIMESTAMP, nullable=False, server_default=func.now())
+
+
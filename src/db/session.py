@@ -1,14 +1,120 @@
-from typing import Generator
+from typing import AsyncGenerator, Generator
 
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import declarative_base, sessionmaker, Session
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 
-DATABASE_URL = "sqlite:///./sofew.db"
+from src.config import DatabaseSettings, get_settings
 
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+from .fts import register_functions
+
+
+_JOURNAL_MODES = {"DELETE", "TRUNCATE", "PERSIST", "MEMORY", "WAL", "OFF"}
+_SYNCHRONOUS = {"OFF", "NORMAL", "FULL", "EXTRA"}
+
+# 同步连接串的数据库类型 -> 异步驱动
+_ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+    "mysql": "mysql+aiomysql",
+}
+
+
+def _sqlite_on_connect(settings: DatabaseSettings):
+    journal_mode = settings.sqlite_journal_mode.upper()
+    synchronous = settings.sqlite_synchronous.upper()
+    if journal_mode not in _JOURNAL_MODES:
+        raise ValueError(f"unsupported SQLITE_JOURNAL_MODE: {settings.sqlite_journal_mode}")
+    if synchronous not in _SYNCHRONOUS:
+        raise ValueError(f"unsupported SQLITE_SYNCHRONOUS: {settings.sqlite_synchronous}")
+
+    def on_connect(dbapi_connection, connection_record) -> None:
+        register_functions(dbapi_connection, connection_record)
+        cursor = dbapi_connection.cursor()
+        try:
+            # journal_mode=WAL 写入数据库文件头，对之后所有连接（包括其他 worker）生效
+            cursor.execute(f"PRAGMA journal_mode={journal_mode}")
+            cursor.execute(f"PRAGMA synchronous={synchronous}")
+            cursor.execute(f"PRAGMA busy_timeout={int(settings.sqlite_busy_timeout_ms)}")
+            cursor.execute(f"PRAGMA mmap_size={int(settings.sqlite_mmap_size)}")
+            cursor.execute(f"PRAGMA cache_size=-{int(settings.sqlite_cache_size_kb)}")
+            cursor.execute("PRAGMA temp_store=MEMORY")
+        finally:
+            cursor.close()
+
+    return on_connect
+
+
+def create_db_engine(settings: DatabaseSettings) -> Engine:
+    """
+    按 DatabaseSettings 建 engine。连接池按单个 worker 配置（多 worker 时各自一份）。
+    SQLite：每个新连接设置 WAL / synchronous / busy_timeout / mmap_size 等，并注册 FTS 用到的函数；
+    其他数据库只设置连接池（转写全文搜索依赖 SQLite FTS5，不可用）。
+    """
+    pool = {
+        "pool_size": settings.pool_size,
+        "max_overflow": settings.max_overflow,
+        "pool_timeout": settings.pool_timeout,
+    }
+    if not settings.url.startswith("sqlite"):
+        return create_engine(settings.url, pool_pre_ping=True, **pool)
+    engine = create_engine(
+        settings.url,
+        connect_args={"check_same_thread": False, "timeout": settings.sqlite_busy_timeout_ms / 1000},
+        **pool,
+    )
+    event.listen(engine, "connect", _sqlite_on_connect(settings))
+    return engine
+
+
+def async_database_url(settings: DatabaseSettings) -> str:
+    """异步 engine 的连接串：优先 DATABASE_ASYNC_URL，否则把 DATABASE_URL 的驱动换成对应的异步驱动。"""
+    if settings.async_url:
+        return settings.async_url
+    scheme, sep, rest = settings.url.partition("://")
+    backend = scheme.split("+", 1)[0]
+    if backend not in _ASYNC_DRIVERS:
+        raise ValueError(f"no async driver known for {scheme}; set DATABASE_ASYNC_URL")
+    return f"{_ASYNC_DRIVERS[backend]}{sep}{rest}"
+
+
+def create_async_db_engine(settings: DatabaseSettings) -> AsyncEngine:
+    """
+    与 create_db_engine 相同的连接池与 SQLite PRAGMA，驱动换成异步驱动，供 AsyncSession 在事件循环上直接等待 IO。
+    与同步 engine 各有一份连接池，指向同一个库。
+    """
+    url = async_database_url(settings)
+    pool = {
+        "pool_size": settings.pool_size,
+        "max_overflow": settings.max_overflow,
+        "pool_timeout": settings.pool_timeout,
+    }
+    if not url.startswith("sqlite"):
+        return create_async_engine(url, pool_pre_ping=True, **pool)
+    # aiosqlite 默认 NullPool，每次取连接都要新开线程、重设 PRAGMA；改用队列池复用连接
+    engine = create_async_engine(
+        url,
+        connect_args={"timeout": settings.sqlite_busy_timeout_ms / 1000},
+        poolclass=AsyncAdaptedQueuePool,
+        **pool,
+    )
+    event.listen(engine.sync_engine, "connect", _sqlite_on_connect(settings))
+    return engine
+
+
+DATABASE_URL = get_settings().database.url
+
+engine = create_db_engine(get_settings().database)
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+async_engine = create_async_db_engine(get_settings().database)
+
+# 提交后不过期：路由在 commit 之后读取对象属性不会再触发（异步下不允许的）隐式加载
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
 Base = declarative_base()
 
 
@@ -20,3 +126,6 @@ def get_db() -> Generator[Session, None, None]:
         db.close()
 
 
+async def get_async_db() -> AsyncGenerator[AsyncSession, None]:
+    async with AsyncSessionLocal() as db:
+        yield db
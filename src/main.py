@@ -15,8 +15,16 @@ from .api.routes import (
     content_workflow,
     auth,
     admin,
+    search,
 )
+from .config import get_settings
 from .db import Base, engine
+from .db.session import SessionLocal, async_engine
+from .db.fts import ensure_fts
+from .services.asr_poller import get_asr_poller
+from .services.http_client import close_http_client
+from .services.llm_service import get_llm_service
+from .services.usage_service import release_stale_reservations
 
 app = FastAPI(title="Sofew Intelligent Companion API", version="0.1.0")
 
@@ -25,9 +33,47 @@ _static_dir = Path(__file__).resolve().parent / "static"
 
 @app.on_event("startup")
 def ensure_tables():
-    """确保用户与用量表存在。"""
+    """确保各表、索引与转写全文索引存在。"""
     import src.db.models  # noqa: F401
     Base.metadata.create_all(bind=engine)
+    # create_all 不会给已存在的表补建新增的索引
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+    ensure_fts(engine)
+
+
+@app.on_event("startup")
+def release_stale_quota():
+    """退回上次进程退出时仍未结算的用量预留。"""
+    db = SessionLocal()
+    try:
+        release_stale_reservations(db, get_settings().auth.reservation_ttl_seconds)
+    finally:
+        db.close()
+
+
+@app.on_event("startup")
+async def warmup_llm_client():
+    """预热 LLM 连接池，首个请求不再付 TLS 握手开销。"""
+    await get_llm_service().warmup(get_settings().dashscope.llm_warm_connections)
+
+
+@app.on_event("shutdown")
+def stop_asr_poller():
+    """停止转写任务集中轮询线程，关闭共享 HTTP 连接池。"""
+    get_asr_poller().shutdown()
+    close_http_client()
+
+
+@app.on_event("shutdown")
+async def close_llm_client():
+    await get_llm_service().aclose()
+
+
+@app.on_event("shutdown")
+async def close_async_engine():
+    await async_engine.dispose()
 
 
 @app.get("/", include_in_schema=False)
@@ -64,5 +110,6 @@ app.include_router(local_dev.router, prefix="/v1")
 app.include_router(content_workflow.router, prefix="/v1")
 app.include_router(auth.router, prefix="/v1")
 app.include_router(admin.router, prefix="/v1")
+app.include_router(search.router, prefix="/v1")
 
 
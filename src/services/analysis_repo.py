@@ -1,11 +1,21 @@
 import json
 from typing import Any, Dict, Optional
 
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
 from src.db.models import RecordingAnalysis
 
 
+def _apply(existing: RecordingAnalysis, analysis: Dict[str, Any]) -> None:
+    existing.summary = analysis.get("summary")
+    existing.people_json = json.dumps(analysis.get("people", []), ensure_ascii=False)
+    existing.issues_json = json.dumps(analysis.get("issues", []), ensure_ascii=False)
+    existing.suggestions_json = json.dumps(analysis.get("suggestions", []), ensure_ascii=False)
+    existing.sources_json = json.dumps(analysis.get("sources", []), ensure_ascii=False)
+
+
 class AnalysisRepo:
     def __init__(self, db: Session) -> None:
         self.db = db
@@ -20,12 +30,7 @@ class AnalysisRepo:
             existing = RecordingAnalysis(recording_id=recording_id, analysis_version=version)
             self.db.add(existing)
 
-        existing.summary = analysis.get("summary")
-        existing.people_json = json.dumps(analysis.get("people", []), ensure_ascii=False)
-        existing.issues_json = json.dumps(analysis.get("issues", []), ensure_ascii=False)
-        existing.suggestions_json = json.dumps(analysis.get("suggestions", []), ensure_ascii=False)
-        existing.sources_json = json.dumps(analysis.get("sources", []), ensure_ascii=False)
-
+        _apply(existing, analysis)
         self.db.commit()
         self.db.refresh(existing)
         return existing
@@ -38,3 +43,26 @@ class AnalysisRepo:
         )
 
 
+class AsyncAnalysisRepo:
+    """AnalysisRepo 的异步版本。"""
+
+    def __init__(self, db: AsyncSession) -> None:
+        self.db = db
+
+    async def upsert_analysis(self, recording_id: str, analysis: Dict[str, Any], version: str = "v1") -> RecordingAnalysis:
+        existing = await self.get_analysis(recording_id, version)
+        if existing is None:
+            existing = RecordingAnalysis(recording_id=recording_id, analysis_version=version)
+            self.db.add(existing)
+        _apply(existing, analysis)
+        await self.db.commit()
+        await self.db.refresh(existing)
+        return existing
+
+    async def get_analysis(self, recording_id: str, version: str = "v1") -> Optional[RecordingAnalysis]:
+        result = await self.db.execute(
+            select(RecordingAnalysis).where(
+                RecordingAnalysis.recording_id == recording_id, RecordingAnalysis.analysis_version == version
+            )
+        )
+        return result.scalar_one_or_none()
@@ -1,7 +1,15 @@
+import asyncio
 import json
-from typing import Any, Dict, List
+import logging
+import re
+from typing import Any, Dict, List, Optional
 
+from src.config import get_settings
 from src.services.llm_service import get_llm_service
+from src.services.prompt_builder import budget_for_model, build_prompt, estimate_tokens
+
+
+logger = logging.getLogger(__name__)
 
 
 ANALYSIS_JSON_SCHEMA_HINT = """
@@ -15,33 +23,196 @@ ANALYSIS_JSON_SCHEMA_HINT = """
 }
 """
 
+EMPTY_ANALYSIS: Dict[str, Any] = {"summary": None, "people": [], "issues": [], "suggestions": [], "sources": []}
+
+
+def _segment_line(seg: Dict[str, Any], fallback_index: int) -> str:
+    return f"[{seg.get('segment_index', fallback_index)}] {seg.get('text', '')}"
+
+
+def split_windows(transcript_segments: List[Dict[str, Any]], window_tokens: int) -> List[List[Dict[str, Any]]]:
+    """按 token 预算顺序切窗，每个窗口至少一个片段；片段保留原 segment_index。"""
+    windows: List[List[Dict[str, Any]]] = []
+    current: List[Dict[str, Any]] = []
+    used = 0
+    for i, seg in enumerate(transcript_segments):
+        seg = {**seg, "segment_index": seg.get("segment_index", i)}
+        cost = estimate_tokens(_segment_line(seg, i)) + 1
+        if current and used + cost > window_tokens:
+            windows.append(current)
+            current, used = [], 0
+        current.append(seg)
+        used += cost
+    if current:
+        windows.append(current)
+    return windows
+
+
+def parse_analysis_json(text: str) -> Optional[Dict[str, Any]]:
+    """容忍 ```json 包裹或前后多余文字，取第一个 JSON 对象；解析失败返回 None。"""
+    text = (text or "").strip()
+    if text.startswith("```"):
+        text = re.sub(r"^```[a-zA-Z]*\s*|\s*```$", "", text)
+    start = text.find("{")
+    if start < 0:
+        return None
+    try:
+        obj, _ = json.JSONDecoder().raw_decode(text[start:])
+    except ValueError:
+        return None
+    return obj if isinstance(obj, dict) else None
+
+
+def _evidence(items: Any, valid: set) -> List[Dict[str, int]]:
+    """只保留落在本窗口内的 segment_index，去重并按顺序排列。"""
+    found = set()
+    for item in items or []:
+        idx = item.get("segment_index") if isinstance(item, dict) else item
+        try:
+            idx = int(idx)
+        except (TypeError, ValueError):
+            continue
+        if idx in valid:
+            found.add(idx)
+    return [{"segment_index": i} for i in sorted(found)]
+
+
+def merge_analyses(parts: List[Dict[str, Any]], valid_indexes: List[set]) -> Dict[str, Any]:
+    """
+    合并各窗口结果：people 按姓名合并证据，issues / suggestions 按标题去重，sources 取并集。
+    summary 由调用方另行生成。
+    """
+    people: Dict[str, set] = {}
+    issues: Dict[str, Dict[str, Any]] = {}
+    suggestions: Dict[str, Dict[str, Any]] = {}
+    sources: set = set()
+
+    def indexes(items: Any, valid: set) -> set:
+        return {e["segment_index"] for e in _evidence(items, valid)}
+
+    for part, valid in zip(parts, valid_indexes):
+        for p in part.get("people") or []:
+            name = (p.get("name") or "").strip() if isinstance(p, dict) else ""
+            if name:
+                people.setdefault(name, set()).update(indexes(p.get("evidence"), valid))
+        for it in part.get("issues") or []:
+            title = (it.get("title") or "").strip() if isinstance(it, dict) else ""
+            if not title:
+                continue
+            entry = issues.setdefault(title, {"title": title, "detail": it.get("detail", ""), "evidence": set()})
+            entry["evidence"].update(indexes(it.get("evidence"), valid))
+        for sg in part.get("suggestions") or []:
+            title = (sg.get("title") or "").strip() if isinstance(sg, dict) else ""
+            if title and title not in suggestions:
+                suggestions[title] = {"title": title, "detail": sg.get("detail", "")}
+        sources.update(indexes(part.get("sources"), valid))
+
+    def as_refs(found: set) -> List[Dict[str, int]]:
+        return [{"segment_index": i} for i in sorted(found)]
+
+    return {
+        "summary": None,
+        "people": [{"name": name, "evidence": as_refs(found)} for name, found in people.items()],
+        "issues": [{**it, "evidence": as_refs(it["evidence"])} for it in issues.values()],
+        "suggestions": list(suggestions.values()),
+        "sources": as_refs(sources),
+    }
+
 
 class AnalysisService:
-    def analyze_transcript(self, transcript_segments: List[Dict[str, Any]]) -> Dict[str, Any]:
-        llm = get_llm_service()
-        content = "\n".join([f"[{i}] {seg.get('text','')}" for i, seg in enumerate(transcript_segments)])
+    """
+    - 转写较短：单次调用
+    - 超过 analysis_window_tokens：按 token 预算切窗并发分析（map），再合并结构化字段并汇总摘要（reduce），
+      墙钟时间取决于窗口大小而不是整段录音长度；片段编号全程使用全局 segment_index
+    """
 
-        prompt = (
-            "你是一个严谨的中文沟通分析助手。以下是用户当天的一段对话转写（按片段编号）：\n"
-            f"{content}\n\n"
-            "任务：总结主要内容，抽取出现的人物（若不确定可省略），指出可能不得当的沟通点，并给出改进建议。"
-            + ANALYSIS_JSON_SCHEMA_HINT
+    def __init__(self, window_tokens: Optional[int] = None) -> None:
+        self.window_tokens = window_tokens or get_settings().dashscope.analysis_window_tokens
+        # 最近一次 analyze_transcript 所有调用的 prompt token 合计（估算）
+        self.prompt_tokens = 0
+
+    async def analyze_transcript(self, transcript_segments: List[Dict[str, Any]]) -> Dict[str, Any]:
+        self.prompt_tokens = 0
+        windows = split_windows(transcript_segments, self.window_tokens)
+        if not windows:
+            return dict(EMPTY_ANALYSIS)
+        if len(windows) == 1:
+            return await self._analyze_window(windows[0], part=None) or dict(EMPTY_ANALYSIS)
+
+        # 单个窗口调用失败不拖垮整次分析：合并成功的窗口；全部失败时抛出第一个错误
+        results = await asyncio.gather(
+            *[self._analyze_window(w, part=(i + 1, len(windows))) for i, w in enumerate(windows)],
+            return_exceptions=True,
         )
+        errors = [r for r in results if isinstance(r, BaseException)]
+        for err in errors:
+            if not isinstance(err, Exception):
+                raise err
+            logger.warning("analysis window failed: %s", err)
+        results = [None if isinstance(r, BaseException) else r for r in results]
+        parts = [r for r in results if r is not None]
+        if not parts:
+            if errors and len(errors) == len(results):
+                raise errors[0]
+            return dict(EMPTY_ANALYSIS)
+        valid = [{s["segment_index"] for s in w} for w, r in zip(windows, results) if r is not None]
+        merged = merge_analyses(parts, valid)
+        merged["summary"] = await self._reduce_summary([p.get("summary") for p in parts])
+        return merged
 
-        # 这里用 LLMService 的最小实现：如果你希望更严格的 schema 校验，可后续加 jsonschema
-        resp = llm.client.chat.completions.create(
-            model=llm.model,
-            messages=[
+    async def _analyze_window(
+        self,
+        segments: List[Dict[str, Any]],
+        part: Optional[tuple],
+    ) -> Optional[Dict[str, Any]]:
+        llm = get_llm_service()
+        scope = (
+            f"以下是用户当天一段较长对话转写中的第 {part[0]}/{part[1]} 部分（按片段编号）：\n"
+            if part
+            else "以下是用户当天的一段对话转写（按片段编号）：\n"
+        )
+        built = build_prompt(
+            "你是一个严谨的中文沟通分析助手。" + scope,
+            [(str(seg.get("segment_index", i)), seg.get("text", "")) for i, seg in enumerate(segments)],
+            "\n\n任务：总结主要内容，抽取出现的人物（若不确定可省略），指出可能不得当的沟通点，并给出改进建议。"
+            "evidence / sources 中的 segment_index 必须使用方括号中的片段编号。" + ANALYSIS_JSON_SCHEMA_HINT,
+            budget_tokens=budget_for_model(llm.model),
+        )
+        self.prompt_tokens += built.prompt_tokens
+        prompt = built.text
+
+        text = await llm.chat(
+            [
                 {"role": "system", "content": "You are a helpful assistant."},
                 {"role": "user", "content": prompt},
             ],
             temperature=0.2,
+            response_format={"type": "json_object"},
         )
+        parsed = parse_analysis_json(text)
+        if parsed is None:
+            return None
+        return {**EMPTY_ANALYSIS, **parsed}
 
-        text = resp.choices[0].message.content or "{}"
+    async def _reduce_summary(self, summaries: List[Optional[str]]) -> Optional[str]:
+        parts = [s.strip() for s in summaries if isinstance(s, str) and s.strip()]
+        if len(parts) <= 1:
+            return parts[0] if parts else None
+        llm = get_llm_service()
+        prompt = (
+            "以下是同一段长对话按时间顺序分段后的各段摘要：\n"
+            + "\n".join(f"{i + 1}. {s}" for i, s in enumerate(parts))
+            + "\n\n请合并为一段连贯的中文总摘要，只输出摘要正文。"
+        )
+        self.prompt_tokens += estimate_tokens(prompt)
         try:
-            return json.loads(text)
+            text = await llm.chat(
+                [
+                    {"role": "system", "content": "You are a helpful assistant."},
+                    {"role": "user", "content": prompt},
+                ],
+                temperature=0.2,
+            )
         except Exception:
-            return {"summary": None, "people": [], "issues": [], "suggestions": [], "sources": []}
-
-
+            text = ""
+        return text.strip() or "\n".join(parts)
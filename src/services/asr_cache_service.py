@@ -0,0 +1,126 @@
+"""
+转写结果缓存：以音频内容哈希（OSS ETag 或本地 sha256）+ asr_model 为键。
+设备重试上传、重复跑 pipeline 时，同样的字节直接复用已存 segments，不再调用 DashScope。
+按压缩后总字节数淘汰最久未使用的条目。
+"""
+import hashlib
+import json
+import threading
+import time
+import zlib
+from typing import Any, Dict, Iterable, List, Optional
+
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from src.config import get_settings
+from src.db.models import ASRCacheEntry
+
+
+_stats_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+
+
+def _bump(key: str, n: int = 1) -> None:
+    with _stats_lock:
+        _stats[key] += n
+
+
+def cache_stats() -> Dict[str, Any]:
+    """本进程内的命中统计。"""
+    with _stats_lock:
+        stats = dict(_stats)
+    lookups = stats["hits"] + stats["misses"]
+    stats["hit_rate"] = round(stats["hits"] / lookups, 4) if lookups else 0.0
+    return stats
+
+
+def content_hash_for_etag(etag: str) -> str:
+    return "etag:" + etag.strip('"').lower()
+
+
+def content_hash_for_file(path: str, block_size: int = 1024 * 1024) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            h.update(block)
+    return f"sha256:{h.hexdigest()}"
+
+
+class ASRCacheService:
+    def __init__(self, db: Session) -> None:
+        self.db = db
+        self.max_bytes = get_settings().dashscope.asr_cache_max_bytes
+
+    def get(self, content_hash: str, asr_model: str) -> Optional[List[Dict[str, Any]]]:
+        entry = (
+            self.db.query(ASRCacheEntry)
+            .filter(ASRCacheEntry.content_hash == content_hash, ASRCacheEntry.asr_model == asr_model)
+            .one_or_none()
+        )
+        if entry is None:
+            _bump("misses")
+            return None
+        _bump("hits")
+        entry.last_used_at = int(time.time())
+        self.db.commit()
+        return json.loads(zlib.decompress(entry.segments_blob).decode("utf-8"))
+
+    def put(self, content_hash: str, asr_model: str, segments: Iterable[Dict[str, Any]]) -> None:
+        items = [
+            {
+                "segment_index": seg.get("segment_index", i),
+                "start_ms": seg.get("start_ms", 0),
+                "end_ms": seg.get("end_ms", 0),
+                "text": seg.get("text", ""),
+                "confidence": seg.get("confidence"),
+            }
+            for i, seg in enumerate(segments)
+        ]
+        if not items:
+            return
+        blob = zlib.compress(json.dumps(items, ensure_ascii=False).encode("utf-8"))
+        if len(blob) > self.max_bytes:
+            return
+
+        entry = (
+            self.db.query(ASRCacheEntry)
+            .filter(ASRCacheEntry.content_hash == content_hash, ASRCacheEntry.asr_model == asr_model)
+            .one_or_none()
+        )
+        if entry is None:
+            entry = ASRCacheEntry(content_hash=content_hash, asr_model=asr_model)
+            self.db.add(entry)
+        entry.segments_blob = blob
+        entry.segment_count = len(items)
+        entry.size_bytes = len(blob)
+        entry.last_used_at = int(time.time())
+        try:
+            self.db.commit()
+        except IntegrityError:
+            # 并发写入同一键：以先写入者为准
+            self.db.rollback()
+            return
+        _bump("stores")
+        self._evict()
+
+    def _evict(self) -> None:
+        total = self.db.query(func.coalesce(func.sum(ASRCacheEntry.size_bytes), 0)).scalar() or 0
+        if total <= self.max_bytes:
+            return
+        rows = (
+            self.db.query(ASRCacheEntry.id, ASRCacheEntry.size_bytes)
+            .order_by(ASRCacheEntry.last_used_at.asc(), ASRCacheEntry.id.asc())
+            .all()
+        )
+        victims = []
+        for row_id, size in rows:
+            if total <= self.max_bytes:
+                break
+            victims.append(row_id)
+            total -= size
+        if victims:
+            self.db.query(ASRCacheEntry).filter(ASRCacheEntry.id.in_(victims)).delete(synchronize_session=False)
+            self.db.commit()
+            _bump("evictions", len(victims))
@@ -0,0 +1,252 @@
+"""
+DashScope 转写任务的集中轮询器。
+
+所有在途 task_id 由一个后台线程统一轮询，按自适应退避节奏调用 Transcription.fetch：
+刚提交时查得勤，随后逐步放慢；长音频的最大间隔更大。任务结束时解析结果并完成对应 Future，
+调用方可 `await asyncio.wrap_future(fut)`，也可 `fut.result()` 同步等待。
+"""
+import heapq
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+from dashscope.audio.asr import Transcription
+
+from src.config import get_settings
+
+
+FetchFn = Callable[[str], Dict[str, Any]]
+
+
+class ASRTaskCancelled(Exception):
+    """等待中的任务被 cancel（如回调已先行落库）；与请求自身被取消的 CancelledError 区分开。"""
+
+
+def _default_fetch(task_id: str) -> Dict[str, Any]:
+    resp = Transcription.fetch(task=task_id)
+    return resp.output  # type: ignore[return-value]
+
+
+@dataclass
+class _PendingTask:
+    task_id: str
+    future: Future
+    submitted_at: float
+    deadline: float
+    audio_seconds: Optional[int] = None
+    min_interval: Optional[float] = None
+    max_interval: Optional[float] = None
+    polls: int = 0
+    next_poll_at: float = 0.0
+    last_status: Optional[str] = None
+
+
+@dataclass(order=True)
+class _HeapItem:
+    due: float
+    task_id: str = field(compare=False)
+
+
+class ASRTaskPoller:
+    """
+    单线程轮询所有在途转写任务。
+    - submit(task_id, audio_seconds?, max_wait_seconds) -> Future[output]
+    - stats() -> 队列深度与每个任务已等待时长
+    fetch_fn 可注入，便于用假的 Transcription.fetch 测试。
+    """
+
+    def __init__(
+        self,
+        fetch_fn: Optional[FetchFn] = None,
+        min_interval: float = 1.0,
+        max_interval: float = 30.0,
+        backoff: float = 1.5,
+    ) -> None:
+        self._fetch = fetch_fn or _default_fetch
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self._tasks: Dict[str, _PendingTask] = {}
+        self._heap: List[_HeapItem] = []
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = False
+
+    # --- 调度 ---
+
+    def interval_for(
+        self,
+        polls: int,
+        audio_seconds: Optional[int],
+        min_interval: Optional[float] = None,
+        max_interval: Optional[float] = None,
+    ) -> float:
+        """第 polls 次轮询之后的等待间隔：指数退避，上限随音频时长增大。"""
+        lo = self.min_interval if min_interval is None else min_interval
+        hi = self.max_interval if max_interval is None else max_interval
+        cap = hi
+        if audio_seconds:
+            # 约 2 分钟音频对应 1 秒间隔上限，短音频不低于 5 秒，长音频不超过 max_interval
+            cap = min(hi, max(5.0, audio_seconds / 120.0))
+        cap = max(cap, lo)
+        return min(cap, lo * (self.backoff ** polls))
+
+    def submit(
+        self,
+        task_id: str,
+        audio_seconds: Optional[int] = None,
+        max_wait_seconds: int = 600,
+        min_interval: Optional[float] = None,
+        max_interval: Optional[float] = None,
+    ) -> Future:
+        """
+        登记一个 task_id；重复提交同一 task_id 返回同一个 Future。
+        min_interval/max_interval 可按任务覆盖默认节奏（如回调模式下的低频兜底轮询）。
+        """
+        with self._cond:
+            existing = self._tasks.get(task_id)
+            if existing is not None:
+                return existing.future
+            now = time.monotonic()
+            task = _PendingTask(
+                task_id=task_id,
+                future=Future(),
+                submitted_at=now,
+                deadline=now + max_wait_seconds,
+                audio_seconds=audio_seconds,
+                min_interval=min_interval,
+                max_interval=max_interval,
+                next_poll_at=now + (self.min_interval if min_interval is None else min_interval),
+            )
+            self._tasks[task_id] = task
+            heapq.heappush(self._heap, _HeapItem(task.next_poll_at, task_id))
+            self._ensure_started()
+            self._cond.notify()
+            return task.future
+
+    def cancel(self, task_id: str) -> None:
+        with self._cond:
+            task = self._tasks.pop(task_id, None)
+        if task is not None:
+            task.future.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        with self._cond:
+            tasks = [
+                {
+                    "task_id": t.task_id,
+                    "wait_seconds": round(now - t.submitted_at, 1),
+                    "polls": t.polls,
+                    "last_status": t.last_status,
+                    "next_poll_in": round(max(0.0, t.next_poll_at - now), 1),
+                }
+                for t in self._tasks.values()
+            ]
+        return {"queue_depth": len(tasks), "tasks": tasks}
+
+    # --- 生命周期 ---
+
+    def _ensure_started(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name="asr-poller", daemon=True)
+        self._thread.start()
+
+    def shutdown(self, timeout: float = 5.0) -> None:
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        with self._cond:
+            pending = list(self._tasks.values())
+            self._tasks.clear()
+            self._heap.clear()
+        for t in pending:
+            t.future.cancel()
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._stopping:
+                    if not self._heap:
+                        self._cond.wait()
+                        continue
+                    delay = self._heap[0].due - time.monotonic()
+                    if delay <= 0:
+                        break
+                    self._cond.wait(delay)
+                if self._stopping:
+                    return
+                item = heapq.heappop(self._heap)
+                task = self._tasks.get(item.task_id)
+            if task is None or task.future.done():
+                # 已取消或已完成（重复的堆项）
+                with self._cond:
+                    self._tasks.pop(item.task_id, None)
+                continue
+            self._poll_once(task)
+
+    def _poll_once(self, task: _PendingTask) -> None:
+        try:
+            output = self._fetch(task.task_id)
+        except Exception as e:
+            # 网络抖动不终止任务，按退避节奏继续查
+            output = None
+            fetch_error: Optional[Exception] = e
+        else:
+            fetch_error = None
+
+        task.polls += 1
+        status = (output or {}).get("task_status") if output is not None else None
+        task.last_status = status or task.last_status
+
+        if status == "SUCCEEDED":
+            self._finish(task, result=output)
+            return
+        if status == "FAILED":
+            msg = (output or {}).get("message", "unknown error")
+            self._finish(task, error=RuntimeError(f"ASR task {task.task_id} failed: {msg}"))
+            return
+
+        now = time.monotonic()
+        if now >= task.deadline:
+            reason = f"status={task.last_status}"
+            if fetch_error is not None:
+                reason += f", last error: {fetch_error}"
+            self._finish(task, error=TimeoutError(f"ASR task {task.task_id} timeout, {reason}"))
+            return
+
+        interval = self.interval_for(task.polls, task.audio_seconds, task.min_interval, task.max_interval)
+        task.next_poll_at = min(task.deadline, now + interval)
+        with self._cond:
+            if task.task_id in self._tasks:
+                heapq.heappush(self._heap, _HeapItem(task.next_poll_at, task.task_id))
+
+    def _finish(self, task: _PendingTask, result: Any = None, error: Optional[BaseException] = None) -> None:
+        with self._cond:
+            self._tasks.pop(task.task_id, None)
+        if task.future.done():
+            return
+        if error is not None:
+            task.future.set_exception(error)
+        else:
+            task.future.set_result(result)
+
+
+_asr_poller: Optional[ASRTaskPoller] = None
+
+
+def get_asr_poller() -> ASRTaskPoller:
+    global _asr_poller
+    if _asr_poller is None:
+        settings = get_settings().dashscope
+        _asr_poller = ASRTaskPoller(
+            min_interval=settings.asr_poll_min_interval,
+            max_interval=settings.asr_poll_max_interval,
+        )
+    return _asr_poller
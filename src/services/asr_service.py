@@ -1,10 +1,14 @@
-from typing import Any, Dict, List, Optional
+import asyncio
+import json
+import re
+from typing import Any, Dict, Iterable, Iterator, List, Optional
 
 import dashscope
 from dashscope.audio.asr import Transcription
-import httpx
 
 from src.config import get_settings
+from src.services.asr_poller import ASRTaskCancelled, get_asr_poller
+from src.services.http_client import get_http_client
 
 
 class ASRService:
@@ -14,6 +18,8 @@ class ASRService:
     - create_transcription_task(file_urls, callback_url?) -> task_id
     - fetch_task(task_id) -> raw output dict
     - wait_transcription(task_id) -> segments[]
+    - iter_segments(output) -> 逐条产出 segments（流式解析 transcription_url）
+    - await_transcription(task_id) -> segments[]（协程版，不阻塞线程）
     """
 
     def __init__(self) -> None:
@@ -32,103 +38,197 @@ class ASRService:
         resp = Transcription.fetch(task=task_id)
         return resp.output  # type: ignore[return-value]
 
-    def wait_transcription(self, task_id: str, max_wait_seconds: int = 600) -> List[Dict[str, Any]]:
+    def wait_transcription(
+        self,
+        task_id: str,
+        max_wait_seconds: int = 600,
+        audio_seconds: Optional[int] = None,
+    ) -> List[Dict[str, Any]]:
         """
-        轮询等待转写任务完成，最多等待 max_wait_seconds 秒。
+        同步等待转写任务完成（由集中轮询器负责查询），最多等待 max_wait_seconds 秒。
         """
-        import time
-        
-        start_time = time.time()
-        while True:
-            resp = Transcription.fetch(task=task_id)
-            output = resp.output
-            task_status = output.get("task_status")
-            
-            if task_status == "SUCCEEDED":
-                break
-            elif task_status == "FAILED":
-                raise RuntimeError(f"ASR task {task_id} failed: {output.get('message', 'unknown error')}")
-            
-            elapsed = time.time() - start_time
-            if elapsed > max_wait_seconds:
-                raise TimeoutError(f"ASR task {task_id} timeout after {max_wait_seconds}s, status={task_status}")
-            
-            # 每 5 秒轮询一次
-            time.sleep(5)
-
-        # DashScope 返回结构可能包含 transcription_url；此处优先尝试 sentences
-        segments: List[Dict[str, Any]] = []
+        future = get_asr_poller().submit(task_id, audio_seconds=audio_seconds, max_wait_seconds=max_wait_seconds)
+        output = future.result()
+        return self.parse_segments(output)
+
+    async def await_output(
+        self,
+        task_id: str,
+        max_wait_seconds: int = 600,
+        audio_seconds: Optional[int] = None,
+    ) -> Dict[str, Any]:
+        """
+        异步等待转写任务成功并返回原始 output；等待期间不占用线程池。
+        同一 task_id 的等待方共用一个 Future：本请求被取消不会取消它（shield）；
+        任务被 poller.cancel 时抛出 ASRTaskCancelled。
+        """
+        future = get_asr_poller().submit(task_id, audio_seconds=audio_seconds, max_wait_seconds=max_wait_seconds)
         try:
+            return await asyncio.shield(asyncio.wrap_future(future))
+        except asyncio.CancelledError:
+            if future.cancelled():
+                raise ASRTaskCancelled(task_id) from None
+            raise
+
+    async def await_transcription(
+        self,
+        task_id: str,
+        max_wait_seconds: int = 600,
+        audio_seconds: Optional[int] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        异步等待转写任务完成：等待期间不占用线程池，结果解析（可能需下载 transcription_url）放到线程中执行。
+        """
+        output = await self.await_output(task_id, max_wait_seconds=max_wait_seconds, audio_seconds=audio_seconds)
+        return await asyncio.to_thread(self.parse_segments, output)
+
+    def parse_segments(self, output: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """从 SUCCEEDED 的任务输出中解析 segments（全部载入内存）。"""
+        return list(self.iter_segments(output))
+
+    def iter_segments(self, output: Dict[str, Any], result_index: int = 0) -> Iterator[Dict[str, Any]]:
+        """
+        逐条产出 segments。若结果以 transcription_url 给出，则流式下载并增量解析，
+        内存占用与音频时长无关；可直接喂给 TranscriptService.replace_segments。
+        多文件任务用 result_index 指定取 results[] 中的哪一项（见 match_results）。
+        """
+        try:
+            # DashScope 返回结构可能包含 transcription_url；此处优先尝试 sentences
             results = output.get("results") or []
-            if results and isinstance(results, list):
-                first = results[0] or {}
-                sentences = first.get("sentences") or []
-                for i, s in enumerate(sentences):
-                    segments.append(
-                        {
-                            "segment_index": i,
-                            "start_ms": int(s.get("begin_time", 0)),
-                            "end_ms": int(s.get("end_time", 0)),
-                            "text": str(s.get("text", "")),
-                            "confidence": s.get("confidence"),
-                        }
-                    )
-
-                # 有些返回不会直接带 sentences，而是给一个 transcription_url（JSON 文件）
-                if not segments:
-                    transcription_url = first.get("transcription_url")
-                    if transcription_url:
-                        with httpx.Client(timeout=60.0) as client:
-                            r = client.get(transcription_url)
-                            r.raise_for_status()
-                            detail = r.json()
-                        # DashScope 返回的 JSON 结构：
-                        # {"transcripts": [{"sentences": [{"begin_time": 150, "end_time": 7510, "text": "..."}, ...]}, ...]}
-                        # 或者直接 {"sentences": [...]}
-                        transcripts_list = detail.get("transcripts") or []
-                        sents = []
-                        # 遍历 transcripts，提取所有 sentences
-                        for transcript in transcripts_list:
-                            if isinstance(transcript, dict):
-                                nested_sents = transcript.get("sentences") or []
-                                sents.extend(nested_sents)
-                        
-                        # 如果没有 transcripts，尝试直接获取 sentences
-                        if not sents:
-                            sents = (
-                                detail.get("sentences")
-                                or detail.get("Sentences")
-                                or detail.get("result", {}).get("sentences")
-                                or detail.get("data", {}).get("sentences")
-                                or []
-                            )
-                        
-                        segment_idx = 0
-                        for s in sents:
-                            # begin_time/end_time 单位是毫秒（不需要 * 1000）
-                            begin_ms = s.get("begin_time") or s.get("BeginTime") or 0
-                            end_ms = s.get("end_time") or s.get("EndTime") or 0
-                            # 如果是秒，转换为毫秒
-                            if begin_ms < 10000:  # 假设如果小于 10000，可能是秒
-                                begin_ms = int(begin_ms * 1000)
-                            if end_ms < 10000:
-                                end_ms = int(end_ms * 1000)
-                            
-                            segments.append(
-                                {
-                                    "segment_index": segment_idx,
-                                    "start_ms": int(begin_ms),
-                                    "end_ms": int(end_ms),
-                                    "text": str(s.get("text", s.get("Text", ""))),
-                                    "confidence": s.get("confidence", s.get("Confidence")),
-                                }
-                            )
-                            segment_idx += 1
+            if not results or not isinstance(results, list) or result_index >= len(results):
+                return
+            first = results[result_index] or {}
+            if first.get("subtask_status") == "FAILED":
+                reason = first.get("message") or first.get("code") or "unknown error"
+                raise RuntimeError(f"ASR subtask failed: {reason}")
+            sentences = first.get("sentences") or []
+            for i, s in enumerate(sentences):
+                yield {
+                    "segment_index": i,
+                    "start_ms": int(s.get("begin_time", 0)),
+                    "end_ms": int(s.get("end_time", 0)),
+                    "text": str(s.get("text", "")),
+                    "confidence": s.get("confidence"),
+                }
+            if sentences:
+                return
+
+            # 有些返回不会直接带 sentences，而是给一个 transcription_url（JSON 文件）
+            transcription_url = first.get("transcription_url")
+            if not transcription_url:
+                return
+            with get_http_client().stream("GET", transcription_url) as r:
+                r.raise_for_status()
+                for i, s in enumerate(iter_sentence_objects(r.iter_text())):
+                    yield _sentence_to_segment(s, i)
+        except RuntimeError:
+            raise
         except Exception as e:
-            # 保底：返回空，让上层记录失败原因
+            # 保底：交给上层记录失败原因
             raise RuntimeError(f"Failed to parse ASR segments: {e}") from e
 
-        return segments
+    @staticmethod
+    def match_results(output: Dict[str, Any], file_urls: List[str]) -> List[Optional[int]]:
+        """
+        多文件任务：为每个提交的 file_url 找到 results[] 中对应的下标。
+        优先按返回的 file_url 精确匹配，缺失时按提交顺序兜底。
+        """
+        results = output.get("results") or []
+        by_url: Dict[str, int] = {}
+        for i, r in enumerate(results):
+            url = (r or {}).get("file_url")
+            if url and url not in by_url:
+                by_url[url] = i
+        matched: List[Optional[int]] = []
+        for i, url in enumerate(file_urls):
+            if url in by_url:
+                matched.append(by_url[url])
+            elif not by_url and i < len(results):
+                matched.append(i)
+            else:
+                matched.append(None)
+        return matched
+
+
+# DashScope 返回的 JSON 结构：
+# {"transcripts": [{"sentences": [{"begin_time": 150, "end_time": 7510, "text": "..."}, ...]}, ...]}
+# 或者直接 {"sentences": [...]} / {"result": {"sentences": [...]}}
+_SENTENCES_KEY_RE = re.compile(r'(?<!\\)"(?:sentences|Sentences)"\s*:\s*\[')
+_MAX_KEY_TAIL = 64
+_BUFFER_TRIM = 64 * 1024
+
+
+def iter_sentence_objects(chunks: Iterable[str]) -> Iterator[Dict[str, Any]]:
+    """
+    增量解析：在文本流中定位任意层级的 "sentences": [...]，逐个解码数组内的对象并产出。
+    只在缓冲区中保留当前未解析完的部分，不构建整棵 JSON。
+    """
+    decoder = json.JSONDecoder()
+    chunk_iter = iter(chunks)
+    buf = ""
+    pos = 0
+    in_array = False
+    exhausted = False
+
+    while True:
+        if not in_array:
+            m = _SENTENCES_KEY_RE.search(buf, pos)
+            if m:
+                in_array = True
+                pos = m.end()
+                continue
+            # 保留尾部，防止 key 被切在两个 chunk 之间
+            buf = buf[max(pos, len(buf) - _MAX_KEY_TAIL):]
+            pos = 0
+        else:
+            while pos < len(buf) and buf[pos] in " \t\r\n,":
+                pos += 1
+            if pos < len(buf):
+                if buf[pos] == "]":
+                    in_array = False
+                    pos += 1
+                    continue
+                try:
+                    obj, end = decoder.raw_decode(buf, pos)
+                except json.JSONDecodeError:
+                    if exhausted:
+                        raise RuntimeError("Truncated transcription JSON")
+                else:
+                    pos = end
+                    if pos > _BUFFER_TRIM:
+                        buf = buf[pos:]
+                        pos = 0
+                    if isinstance(obj, dict):
+                        yield obj
+                    continue
+
+        if exhausted:
+            if in_array:
+                raise RuntimeError("Truncated transcription JSON")
+            return
+        chunk = next(chunk_iter, None)
+        if chunk is None:
+            exhausted = True
+        else:
+            buf += chunk
+
+
+def _sentence_to_segment(s: Dict[str, Any], index: int) -> Dict[str, Any]:
+    # begin_time/end_time 单位是毫秒（不需要 * 1000）
+    begin_ms = s.get("begin_time") or s.get("BeginTime") or 0
+    end_ms = s.get("end_time") or s.get("EndTime") or 0
+    # 如果是秒（带小数），转换为毫秒；整数按毫秒处理，避免把前 10 秒内的毫秒值误放大
+    if isinstance(begin_ms, float) and begin_ms < 10000:
+        begin_ms = int(begin_ms * 1000)
+    if isinstance(end_ms, float) and end_ms < 10000:
+        end_ms = int(end_ms * 1000)
+    return {
+        "segment_index": index,
+        "start_ms": int(begin_ms),
+        "end_ms": int(end_ms),
+        "text": str(s.get("text", s.get("Text", ""))),
+        "confidence": s.get("confidence", s.get("Confidence")),
+    }
 
 
 _asr_service: Optional[ASRService] = None
@@ -0,0 +1,187 @@
+"""
+长音频切分：以内存映射方式读取 PCM WAV，按帧能量在低能量处（停顿）切成 30–120 秒的片段。
+
+只负责音频本身，不涉及 OSS / ASR：
+- open_wav(path) -> WavAudio（mmap + 头信息）
+- frame_energy_db(audio) -> 每帧能量（dB）
+- plan_chunks(audio, ...) -> [AudioChunk(start_ms, end_ms, ...)]
+- write_chunk(audio, chunk, out_path)
+"""
+import mmap
+import struct
+import wave
+from dataclasses import dataclass
+from typing import List, Optional
+
+import numpy as np
+
+
+FRAME_MS = 20
+
+
+@dataclass
+class WavAudio:
+    path: str
+    mm: mmap.mmap
+    channels: int
+    sample_rate: int
+    sample_width: int
+    data_offset: int
+    data_size: int
+
+    @property
+    def frame_bytes(self) -> int:
+        return self.channels * self.sample_width
+
+    @property
+    def num_samples(self) -> int:
+        return self.data_size // self.frame_bytes
+
+    @property
+    def duration_ms(self) -> int:
+        return int(self.num_samples * 1000 / self.sample_rate)
+
+    def samples(self) -> np.ndarray:
+        """单声道 int16 视图（多声道取第一声道），直接映射文件，不复制。"""
+        arr = np.frombuffer(self.mm, dtype="<i2", count=self.num_samples * self.channels, offset=self.data_offset)
+        if self.channels > 1:
+            arr = arr[:: self.channels]
+        return arr
+
+    def byte_range(self, start_ms: int, end_ms: int) -> slice:
+        start = self.data_offset + self.ms_to_sample(start_ms) * self.frame_bytes
+        end = self.data_offset + self.ms_to_sample(end_ms) * self.frame_bytes
+        return slice(start, min(end, self.data_offset + self.data_size))
+
+    def ms_to_sample(self, ms: int) -> int:
+        return min(self.num_samples, int(ms * self.sample_rate / 1000))
+
+    def close(self) -> None:
+        self.mm.close()
+
+    def __enter__(self) -> "WavAudio":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+@dataclass
+class AudioChunk:
+    index: int
+    start_ms: int
+    end_ms: int
+
+
+def open_wav(path: str) -> Optional[WavAudio]:
+    """以 mmap 打开 16-bit PCM WAV；非该格式返回 None（调用方回退为整文件转写）。"""
+    with open(path, "rb") as f:
+        try:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # 空文件
+            return None
+    if len(mm) < 12 or mm[0:4] != b"RIFF" or mm[8:12] != b"WAVE":
+        mm.close()
+        return None
+
+    fmt = None
+    pos = 12
+    while pos + 8 <= len(mm):
+        chunk_id = mm[pos : pos + 4]
+        (chunk_size,) = struct.unpack("<I", mm[pos + 4 : pos + 8])
+        body = pos + 8
+        if chunk_id == b"fmt ":
+            audio_format, channels, sample_rate, _, _, bits = struct.unpack("<HHIIHH", mm[body : body + 16])
+            fmt = (audio_format, channels, sample_rate, bits)
+        elif chunk_id == b"data":
+            if fmt is None:
+                break
+            audio_format, channels, sample_rate, bits = fmt
+            # 1 = PCM，0xFFFE = WAVE_FORMAT_EXTENSIBLE（常见于多声道 PCM）
+            if audio_format not in (1, 0xFFFE) or bits != 16 or channels < 1:
+                break
+            data_size = min(chunk_size, len(mm) - body)
+            return WavAudio(
+                path=path,
+                mm=mm,
+                channels=channels,
+                sample_rate=sample_rate,
+                sample_width=2,
+                data_offset=body,
+                data_size=data_size - data_size % (channels * 2),
+            )
+        pos = body + chunk_size + (chunk_size & 1)
+    mm.close()
+    return None
+
+
+def frame_energy_db(audio: WavAudio, frame_ms: int = FRAME_MS, block_frames: int = 4096) -> np.ndarray:
+    """
+    每 frame_ms 一帧的平均能量（dBFS），向量化计算。
+    按 block_frames 帧一块直接在 int16 映射上求平方和，不整体转成浮点，峰值内存与音频时长无关。
+    """
+    samples = audio.samples()
+    frame_len = max(1, int(audio.sample_rate * frame_ms / 1000))
+    n_frames = len(samples) // frame_len
+    if n_frames == 0:
+        return np.zeros(0, dtype=np.float32)
+    power = np.empty(n_frames, dtype=np.float64)
+    for start in range(0, n_frames, block_frames):
+        end = min(n_frames, start + block_frames)
+        block = samples[start * frame_len : end * frame_len].reshape(end - start, frame_len)
+        power[start:end] = np.einsum("ij,ij->i", block, block, dtype=np.float64)
+    power /= frame_len * 32768.0 * 32768.0
+    return (10.0 * np.log10(power + 1e-10)).astype(np.float32)
+
+
+def plan_chunks(
+    audio: WavAudio,
+    target_seconds: int = 60,
+    min_seconds: int = 30,
+    max_seconds: int = 120,
+    energy_db: Optional[np.ndarray] = None,
+) -> List[AudioChunk]:
+    """
+    从头向后切：每段长度在 [min_seconds, max_seconds] 之间，
+    在该范围内选平滑后能量最低的帧作为切点，离 target_seconds 越近越优先。
+    """
+    if energy_db is None:
+        energy_db = frame_energy_db(audio)
+    total_ms = audio.duration_ms
+    if total_ms <= max_seconds * 1000 or len(energy_db) == 0:
+        return [AudioChunk(index=0, start_ms=0, end_ms=total_ms)]
+
+    # 约 100 ms 滑动平均，避免切在单帧的瞬时低谷上
+    kernel = np.ones(5, dtype=np.float32) / 5.0
+    smoothed = np.convolve(energy_db, kernel, mode="same")
+
+    frames_per_s = 1000 // FRAME_MS
+    chunks: List[AudioChunk] = []
+    cursor = 0  # 帧号
+    n = len(smoothed)
+    while cursor < n:
+        if n - cursor <= max_seconds * frames_per_s:
+            end = n
+        else:
+            lo = cursor + min_seconds * frames_per_s
+            hi = min(n, cursor + max_seconds * frames_per_s)
+            window = smoothed[lo:hi]
+            target = cursor + target_seconds * frames_per_s - lo
+            # 每偏离目标 1 秒加 0.1 dB 惩罚
+            penalty = np.abs(np.arange(len(window)) - target) * (0.1 / frames_per_s)
+            end = lo + int(np.argmin(window + penalty))
+        start_ms = cursor * FRAME_MS
+        end_ms = total_ms if end >= n else end * FRAME_MS
+        chunks.append(AudioChunk(index=len(chunks), start_ms=start_ms, end_ms=end_ms))
+        cursor = end
+    return chunks
+
+
+def write_chunk(audio: WavAudio, chunk: AudioChunk, out_path: str) -> None:
+    """把 [start_ms, end_ms) 的原始 PCM 写成独立 WAV 文件（不重采样）。"""
+    with wave.open(out_path, "wb") as w:
+        w.setnchannels(audio.channels)
+        w.setsampwidth(audio.sample_width)
+        w.setframerate(audio.sample_rate)
+        w.writeframes(audio.mm[audio.byte_range(chunk.start_ms, chunk.end_ms)])
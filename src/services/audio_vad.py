@@ -0,0 +1,110 @@
+"""
+基于帧能量的语音活动检测（VAD）：在送 ASR 之前去掉长时间静音。
+
+- detect_speech_regions(energy_db, ...) -> [(start_ms, end_ms)]，全部向量化计算
+- OffsetMap：压缩后时间轴 -> 原始文件时间轴，保证落库的 start_ms/end_ms 仍指向原音频
+- write_speech_only(audio, regions, out_path)：把语音区间拼接成新的 WAV
+"""
+import wave
+from bisect import bisect_left, bisect_right
+from dataclasses import dataclass, field
+from typing import List, Tuple
+
+import numpy as np
+
+from src.services.audio_chunker import FRAME_MS, WavAudio
+
+
+Region = Tuple[int, int]
+
+
+def detect_speech_regions(
+    energy_db: np.ndarray,
+    duration_ms: int,
+    threshold_db: float = -50.0,
+    noise_margin_db: float = 12.0,
+    min_silence_ms: int = 2000,
+    pad_ms: int = 300,
+) -> List[Region]:
+    """
+    返回语音区间（毫秒）。阈值取 max(threshold_db, 噪声底 + noise_margin_db)，噪声底为能量的第 10 百分位，
+    且不高于 threshold_db：连续说话的录音第 10 百分位本身就是语音，不封顶会把整段都判成静音；
+    短于 min_silence_ms 的静音不切掉，每段语音两侧各保留 pad_ms。
+    """
+    if len(energy_db) == 0:
+        return []
+    noise_floor = min(float(np.percentile(energy_db, 10)), threshold_db)
+    threshold = max(threshold_db, noise_floor + noise_margin_db)
+    speech = energy_db > threshold
+
+    pad = pad_ms // FRAME_MS
+    if pad > 0:
+        speech = np.convolve(speech.astype(np.int32), np.ones(2 * pad + 1, dtype=np.int32), mode="same") > 0
+
+    edges = np.diff(np.concatenate(([0], speech.astype(np.int8), [0])))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+    if len(starts) == 0:
+        return []
+
+    # 合并间隔短于 min_silence_ms 的相邻语音段
+    keep_gap = (starts[1:] - ends[:-1]) * FRAME_MS >= min_silence_ms
+    starts = starts[np.concatenate(([True], keep_gap))]
+    ends = ends[np.concatenate((keep_gap, [True]))]
+
+    regions = [(int(s) * FRAME_MS, min(int(e) * FRAME_MS, duration_ms)) for s, e in zip(starts, ends)]
+    # 末帧之后不足一帧的尾巴并入最后一段
+    if regions and len(energy_db) * FRAME_MS - regions[-1][1] < FRAME_MS:
+        regions[-1] = (regions[-1][0], duration_ms)
+    return regions
+
+
+@dataclass
+class OffsetMap:
+    """压缩时间轴上的区间 [compact_start, compact_start + length) 对应原始时间轴 [orig_start, ...)。"""
+
+    compact_starts: List[int] = field(default_factory=list)
+    orig_starts: List[int] = field(default_factory=list)
+    lengths: List[int] = field(default_factory=list)
+
+    @classmethod
+    def from_regions(cls, regions: List[Region]) -> "OffsetMap":
+        m = cls()
+        cursor = 0
+        for start, end in regions:
+            m.compact_starts.append(cursor)
+            m.orig_starts.append(start)
+            m.lengths.append(end - start)
+            cursor += end - start
+        return m
+
+    @property
+    def compact_duration_ms(self) -> int:
+        return sum(self.lengths)
+
+    def to_original(self, compact_ms: int) -> int:
+        if not self.compact_starts:
+            return compact_ms
+        i = max(0, bisect_right(self.compact_starts, compact_ms) - 1)
+        return self.orig_starts[i] + min(max(0, compact_ms - self.compact_starts[i]), self.lengths[i])
+
+    def to_original_end(self, compact_ms: int) -> int:
+        """
+        映射结束时间戳：恰好落在区间边界上的结束时间属于前一个区间，
+        钳到该区间的原始结束位置，而不是跳到下一个区间的起点（否则句子会跨过被删掉的静音）。
+        """
+        if not self.compact_starts:
+            return compact_ms
+        i = max(0, bisect_left(self.compact_starts, compact_ms) - 1)
+        return self.orig_starts[i] + min(max(0, compact_ms - self.compact_starts[i]), self.lengths[i])
+
+
+def write_speech_only(audio: WavAudio, regions: List[Region], out_path: str) -> None:
+    """按顺序拼接语音区间的原始 PCM，写成新的 WAV。"""
+    with wave.open(out_path, "wb") as w:
+        w.setnchannels(audio.channels)
+        w.setsampwidth(audio.sample_width)
+        w.setframerate(audio.sample_rate)
+        for start, end in regions:
+            w.writeframes(audio.mm[audio.byte_range(start, end)])
+
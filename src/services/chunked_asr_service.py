@@ -0,0 +1,222 @@
+"""
+长音频本地预处理后转写：下载 → VAD 去静音 → 低能量处切段 → 并发上传 OSS 并提交 ASR → 按偏移拼回一条有序的 segments。
+
+一小时录音切成若干 30–120 秒片段后同时提交，整体耗时约等于最慢的那一段，而不是整条音频；
+去掉的静音不再送 ASR，落库的时间戳通过 OffsetMap 映射回原始文件时间轴。
+"""
+import asyncio
+import os
+import shutil
+import tempfile
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from src.config import get_settings
+from src.services.asr_poller import get_asr_poller
+from src.services.asr_service import ASRService, get_asr_service
+from src.services.audio_chunker import (
+    AudioChunk,
+    WavAudio,
+    frame_energy_db,
+    open_wav,
+    plan_chunks,
+    write_chunk,
+)
+from src.services.audio_vad import OffsetMap, detect_speech_regions, write_speech_only
+from src.services.oss_service import get_oss_service
+
+
+_UPLOAD_CONCURRENCY = 8
+
+
+def stitch_segments(
+    asr: ASRService,
+    chunks: List[AudioChunk],
+    outputs: List[Dict[str, Any]],
+    offset_map: Optional[OffsetMap] = None,
+) -> Iterator[Dict[str, Any]]:
+    """
+    按片段顺序逐条产出 segments：时间戳加上片段起点，segment_index 全局连续编号；
+    有 offset_map（做过 VAD）时再映射回原始文件时间轴。
+    """
+    index = 0
+    for chunk, output in zip(chunks, outputs):
+        for seg in asr.iter_segments(output):
+            start_ms = int(seg.get("start_ms", 0)) + chunk.start_ms
+            end_ms = int(seg.get("end_ms", 0)) + chunk.start_ms
+            if offset_map is not None:
+                start_ms = offset_map.to_original(start_ms)
+                end_ms = max(start_ms, offset_map.to_original_end(end_ms))
+            yield {**seg, "segment_index": index, "start_ms": start_ms, "end_ms": end_ms}
+            index += 1
+
+
+async def _gather_or_cancel(aws: List[Any]) -> List[Any]:
+    """并发执行并按顺序返回结果；任一失败（或自身被取消）时取消其余任务、等它们退出后再抛出。"""
+    tasks = [asyncio.ensure_future(aw) for aw in aws]
+    try:
+        return list(await asyncio.gather(*tasks))
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+
+class ChunkedASRService:
+    def __init__(self) -> None:
+        self.settings = get_settings().dashscope
+
+    def should_chunk(self, object_key: str, audio_seconds: Optional[int]) -> bool:
+        """是否走本地预处理（VAD 和/或切段）；只处理 WAV。"""
+        if not object_key.lower().endswith(".wav"):
+            return False
+        if self.settings.asr_vad_enabled:
+            return True
+        if not self.settings.asr_chunking_enabled:
+            return False
+        return (audio_seconds or 0) > self.settings.asr_chunking_min_audio_seconds
+
+    async def transcribe(
+        self,
+        recording_id: str,
+        object_key: str,
+        max_wait_seconds: int = 600,
+    ) -> Optional[Iterator[Dict[str, Any]]]:
+        """
+        预处理后转写并返回拼接后的 segments 生成器；
+        音频不是 16-bit PCM WAV，或既无静音可去又不足以切段时返回 None，由调用方回退为整文件转写。
+        """
+        oss = get_oss_service()
+        asr = get_asr_service()
+        workdir = tempfile.mkdtemp(prefix="sofew_asr_")
+        uploaded_keys: List[str] = []
+        task_ids: List[str] = []
+        # 线程里的上传 / 提交取消不掉，清理（删临时目录、取消任务、删片段）前必须等它们全部结束
+        thread_ops: List[asyncio.Future] = []
+
+        def _in_thread(fn, *args) -> "asyncio.Future":
+            op = asyncio.ensure_future(asyncio.to_thread(fn, *args))
+            thread_ops.append(op)
+            return asyncio.shield(op)
+
+        def _upload(key: str, path: str) -> None:
+            # 先登记再上传：上传到一半失败或被放弃时也会被清理
+            uploaded_keys.append(key)
+            oss.upload_local_file(key, path)
+
+        def _create_task(url: str) -> str:
+            task_id = asr.create_transcription_task([url])
+            task_ids.append(task_id)
+            return task_id
+
+        try:
+            source = os.path.join(workdir, "source.wav")
+            await asyncio.to_thread(oss.download_to_file, object_key, source)
+            prepared = await asyncio.to_thread(self._prepare, source, workdir)
+            if prepared is None:
+                return None
+            chunks, offset_map = prepared
+            if not chunks:
+                return None
+
+            sem = asyncio.Semaphore(_UPLOAD_CONCURRENCY)
+
+            async def _submit(chunk: AudioChunk) -> str:
+                key = oss.object_key_for_chunk(recording_id, chunk.index)
+                async with sem:
+                    await _in_thread(_upload, key, self._chunk_path(workdir, chunk))
+                url = oss.sign_url_for_key("GET", key, max_wait_seconds + 3600)
+                return await _in_thread(_create_task, url)
+
+            chunk_task_ids = await _gather_or_cancel([_submit(c) for c in chunks])
+            outputs = await _gather_or_cancel(
+                [
+                    asr.await_output(
+                        task_id,
+                        max_wait_seconds=max_wait_seconds,
+                        audio_seconds=(c.end_ms - c.start_ms) // 1000,
+                    )
+                    for c, task_id in zip(chunks, chunk_task_ids)
+                ]
+            )
+            return stitch_segments(asr, chunks, outputs, offset_map)
+        except BaseException:
+            await asyncio.gather(*thread_ops, return_exceptions=True)
+            poller = get_asr_poller()
+            for task_id in task_ids:
+                poller.cancel(task_id)
+            raise
+        finally:
+            await asyncio.gather(*thread_ops, return_exceptions=True)
+            shutil.rmtree(workdir, ignore_errors=True)
+            # 任务结束后片段音频已无用
+            for key in uploaded_keys:
+                try:
+                    await asyncio.to_thread(oss.delete_object_key, key)
+                except Exception:
+                    pass
+
+    def _prepare(self, source: str, workdir: str) -> Optional[Tuple[List[AudioChunk], Optional[OffsetMap]]]:
+        audio = open_wav(source)
+        if audio is None:
+            return None
+        offset_map: Optional[OffsetMap] = None
+        with audio:
+            energy = frame_energy_db(audio)
+            if self.settings.asr_vad_enabled:
+                regions = detect_speech_regions(
+                    energy,
+                    audio.duration_ms,
+                    threshold_db=self.settings.asr_vad_threshold_db,
+                    min_silence_ms=self.settings.asr_vad_min_silence_ms,
+                )
+                # 检测不到语音时不当作静音丢弃，按未去静音处理（切段或整文件转写）
+                if regions and audio.duration_ms - sum(e - s for s, e in regions) >= self.settings.asr_vad_min_silence_ms:
+                    offset_map = OffsetMap.from_regions(regions)
+                    speech_path = os.path.join(workdir, "speech.wav")
+                    write_speech_only(audio, regions, speech_path)
+            if offset_map is None:
+                too_short = audio.duration_ms <= self.settings.asr_chunk_max_seconds * 1000
+                if not self.settings.asr_chunking_enabled or too_short:
+                    return None
+                return self._write_chunks(audio, workdir, energy), None
+
+        # 在去静音后的音频上切段
+        speech = open_wav(speech_path)
+        if speech is None:
+            return None
+        with speech:
+            if self.settings.asr_chunking_enabled:
+                chunks = self._write_chunks(speech, workdir)
+            else:
+                chunks = [AudioChunk(index=0, start_ms=0, end_ms=speech.duration_ms)]
+                write_chunk(speech, chunks[0], self._chunk_path(workdir, chunks[0]))
+        return chunks, offset_map
+
+    def _write_chunks(self, audio: WavAudio, workdir: str, energy: Optional[np.ndarray] = None) -> List[AudioChunk]:
+        chunks = plan_chunks(
+            audio,
+            target_seconds=self.settings.asr_chunk_target_seconds,
+            min_seconds=self.settings.asr_chunk_min_seconds,
+            max_seconds=self.settings.asr_chunk_max_seconds,
+            energy_db=energy,
+        )
+        for chunk in chunks:
+            write_chunk(audio, chunk, self._chunk_path(workdir, chunk))
+        return chunks
+
+    @staticmethod
+    def _chunk_path(workdir: str, chunk: AudioChunk) -> str:
+        return os.path.join(workdir, f"chunk_{chunk.index:04d}.wav")
+
+
+_chunked_asr_service: Optional[ChunkedASRService] = None
+
+
+def get_chunked_asr_service() -> ChunkedASRService:
+    global _chunked_asr_service
+    if _chunked_asr_service is None:
+        _chunked_asr_service = ChunkedASRService()
+    return _chunked_asr_service
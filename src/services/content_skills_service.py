@@ -2,8 +2,11 @@
 Dan Koe「AI 内容永动机」四步 Skills 服务。
 正确顺序：拆解 → 想清楚 → 写一次 → 用到极致
 """
-from typing import Any
+import asyncio
+import time
+from typing import Any, AsyncIterator, Dict, List, Tuple
 
+from src.services.llm_cache_service import get_llm_response_cache, make_cache_key
 from src.services.llm_service import get_llm_service
 
 
@@ -92,55 +95,213 @@ OUTPUT：
 4）视频脚本 × 1（含前 3 秒钩子 + 大字标题）
 5）CTA 备选 × 5"""
 
+# 扇出模式：每个输出部分单独一次补全，并发执行后按上面 OUTPUT 的顺序拼回
+SKILL4_SECTIONS: List[Tuple[str, str]] = [
+    ("assumptions", "0）必要假设（如有）"),
+    ("short_posts", "1）短内容 × 20（100–200 字）"),
+    ("hooks", "2）强钩子 × 5（一句话）"),
+    ("platform_structures", "3）平台内容结构 × 3"),
+    ("video_script", "4）视频脚本 × 1（含前 3 秒钩子 + 大字标题）"),
+    ("ctas", "5）CTA 备选 × 5"),
+]
 
-def _call_llm(system: str, user_content: str, temperature: float = 0.3) -> str:
+SKILL4_SECTION_TASK = """将输入的母内容裂变为可分发内容。本次只负责下面这一个输出部分，其余部分由其他流程完成。
+
+RULES：
+- 不新增核心观点
+- 每条内容只表达一个点
+- 表达方式必须不同
+- 只输出本部分内容，不要重复部分标题
+
+OUTPUT：
+{section}"""
+
+
+async def _call_llm(system: str, user_content: str, temperature: float = 0.3, skill: str = "") -> str:
+    """相同 (model, system, user_content, temperature) 命中缓存时直接返回；扣次由调用方照常处理。"""
     llm = get_llm_service()
-    resp = llm.client.chat.completions.create(
-        model=llm.model,
-        messages=[
+    cache = get_llm_response_cache()
+    key = make_cache_key(llm.model, system, user_content, temperature) if cache.enabled else ""
+    if key:
+        cached = await cache.get(key, skill)
+        if cached is not None:
+            return cached
+    text = await llm.chat(
+        [
             {"role": "system", "content": system},
             {"role": "user", "content": user_content},
         ],
         temperature=temperature,
     )
-    return (resp.choices[0].message.content or "").strip()
+    text = text.strip()
+    if key:
+        await cache.put(key, skill, llm.model, text)
+    return text
+
+
+def skill_prompt(skill_id: int, **kwargs: Any) -> Tuple[str, str]:
+    """返回 (system, user_content)，同步与流式接口共用。"""
+    if skill_id == 1:
+        user = f"请分析以下内容：\n\n{kwargs.get('content', '')}"
+        return SKILL1_SYSTEM, SKILL1_TASK + "\n\n---\n\n" + user
+    if skill_id == 2:
+        writing_intent = kwargs.get("writing_intent", "") or ""
+        if writing_intent.strip():
+            user = f"用户的写作意图或背景：\n{writing_intent}\n\n请根据上述信息，输出上述 6 个问题的完整版（可直接给用户填写）。"
+        else:
+            user = "用户尚未提供具体意图。请直接输出上述 6 个问题的完整版（留空让用户填写）。"
+        return SKILL2_SYSTEM, SKILL2_TASK + "\n\n---\n\n" + user
+    if skill_id == 3:
+        user = f"核心观点（已验证）：\n{kwargs.get('core_idea', '')}"
+        return SKILL3_SYSTEM, SKILL3_TASK + "\n\n---\n\n" + user
+    if skill_id == 4:
+        user = f"母内容全文：\n{kwargs.get('mother_content', '')}"
+        return SKILL4_SYSTEM, SKILL4_TASK + "\n\n---\n\n" + user
+    raise ValueError(f"Unknown skill_id: {skill_id}. Use 1-4.")
 
 
-def skill1_content_structure_judge(content: str) -> str:
+async def skill1_content_structure_judge(content: str) -> str:
     """Skill 1：爆款结构拆解器。输入任意内容，输出结构化判断。"""
-    user = f"请分析以下内容：\n\n{content}"
-    return _call_llm(SKILL1_SYSTEM, SKILL1_TASK + "\n\n---\n\n" + user)
+    return await _call_llm(*skill_prompt(1, content=content), skill="skill1")
 
 
-def skill2_pre_writing_clarifier(writing_intent: str = "") -> str:
+async def skill2_pre_writing_clarifier(writing_intent: str = "") -> str:
     """Skill 2：写作前元思考澄清器。输入模糊写作意图或留空，输出 6 个澄清问题。"""
-    if writing_intent.strip():
-        user = f"用户的写作意图或背景：\n{writing_intent}\n\n请根据上述信息，输出上述 6 个问题的完整版（可直接给用户填写）。"
-    else:
-        user = "用户尚未提供具体意图。请直接输出上述 6 个问题的完整版（留空让用户填写）。"
-    return _call_llm(SKILL2_SYSTEM, SKILL2_TASK + "\n\n---\n\n" + user)
+    return await _call_llm(*skill_prompt(2, writing_intent=writing_intent), skill="skill2")
 
 
-def skill3_mother_content_architect(core_idea: str) -> str:
+async def skill3_mother_content_architect(core_idea: str) -> str:
     """Skill 3：母内容结构构建器。输入已验证的核心观点，输出母内容结构蓝图。"""
-    user = f"核心观点（已验证）：\n{core_idea}"
-    return _call_llm(SKILL3_SYSTEM, SKILL3_TASK + "\n\n---\n\n" + user)
+    return await _call_llm(*skill_prompt(3, core_idea=core_idea), skill="skill3")
 
 
-def skill4_content_repurposing_engine(mother_content: str) -> str:
+async def skill4_content_repurposing_engine(mother_content: str) -> str:
     """Skill 4：内容裂变与复利引擎。输入完整母内容，输出多平台、多形式内容集合。"""
-    user = f"母内容全文：\n{mother_content}"
-    return _call_llm(SKILL4_SYSTEM, SKILL4_TASK + "\n\n---\n\n" + user)
+    return await _call_llm(*skill_prompt(4, mother_content=mother_content), skill="skill4")
 
 
-def run_skill(skill_id: int, **kwargs: Any) -> str:
+async def skill4_fanout(mother_content: str) -> Tuple[str, List[Dict[str, Any]]]:
+    """
+    Skill 4 扇出模式：各输出部分共享同一份母内容、并发生成，整体耗时约等于最慢的一部分。
+    返回 (按文档顺序拼接的全文, [{"key", "title", "latency_ms", "chars"}])。
+    """
+    user = f"母内容全文：\n{mother_content}"
+
+    async def _section(key: str, title: str) -> Dict[str, Any]:
+        started = time.perf_counter()
+        text = await _call_llm(
+            SKILL4_SYSTEM,
+            SKILL4_SECTION_TASK.format(section=title) + "\n\n---\n\n" + user,
+            skill="skill4",
+        )
+        return {
+            "key": key,
+            "title": title,
+            "text": text,
+            "latency_ms": int((time.perf_counter() - started) * 1000),
+        }
+
+    tasks = [asyncio.ensure_future(_section(key, title)) for key, title in SKILL4_SECTIONS]
+    try:
+        sections = await asyncio.gather(*tasks)
+    except BaseException:
+        # 任一部分失败（或请求被取消）时取消其余部分，等它们退出后再抛出，避免继续消耗 LLM 配额
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+    result = "\n\n".join(f"{s['title']}\n{s['text']}" for s in sections)
+    report = [
+        {"key": s["key"], "title": s["title"], "latency_ms": s["latency_ms"], "chars": len(s["text"])}
+        for s in sections
+    ]
+    return result, report
+
+
+async def run_skill(skill_id: int, **kwargs: Any) -> str:
     """统一入口：根据 skill_id 执行对应 Skill。"""
     if skill_id == 1:
-        return skill1_content_structure_judge(kwargs.get("content", ""))
+        return await skill1_content_structure_judge(kwargs.get("content", ""))
     if skill_id == 2:
-        return skill2_pre_writing_clarifier(kwargs.get("writing_intent", ""))
+        return await skill2_pre_writing_clarifier(kwargs.get("writing_intent", ""))
     if skill_id == 3:
-        return skill3_mother_content_architect(kwargs.get("core_idea", ""))
+        return await skill3_mother_content_architect(kwargs.get("core_idea", ""))
     if skill_id == 4:
-        return skill4_content_repurposing_engine(kwargs.get("mother_content", ""))
+        return await skill4_content_repurposing_engine(kwargs.get("mother_content", ""))
     raise ValueError(f"Unknown skill_id: {skill_id}. Use 1-4.")
+
+
+async def stream_skill(skill_id: int, temperature: float = 0.3, **kwargs: Any) -> AsyncIterator[str]:
+    """流式执行 Skill，逐段产出文本。命中缓存时一次性产出缓存结果；完整生成后写入缓存。"""
+    system, user_content = skill_prompt(skill_id, **kwargs)
+    skill = f"skill{skill_id}"
+    llm = get_llm_service()
+    cache = get_llm_response_cache()
+    key = make_cache_key(llm.model, system, user_content, temperature) if cache.enabled else ""
+    if key:
+        cached = await cache.get(key, skill)
+        if cached is not None:
+            yield cached
+            return
+    parts: List[str] = []
+    async for delta in llm.stream_chat(
+        [
+            {"role": "system", "content": system},
+            {"role": "user", "content": user_content},
+        ],
+        temperature=temperature,
+    ):
+        parts.append(delta)
+        yield delta
+    if key:
+        await cache.put(key, skill, llm.model, "".join(parts).strip())
+
+
+async def run_workflow(
+    content: str,
+    writing_intent: str = "",
+    core_idea: str = "",
+    mother_content: str = "",
+    fanout: bool = False,
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    服务端四步流水线，每完成一步产出 {"skill_id", "result", "elapsed_ms"}。
+    Skill 1 与 Skill 2 互不依赖，并行执行、先完成先产出；
+    Skill 3 未给 core_idea 时基于 Skill 1 的拆解结果；Skill 4 未给 mother_content 时基于 Skill 3 的结构蓝图。
+    Skill 4 默认单次补全；fanout 为 True 时以扇出模式执行（第 4 步额外带 sections 耗时）。
+    """
+    started = time.perf_counter()
+
+    def _step(skill_id: int, result: str) -> Dict[str, Any]:
+        return {"skill_id": skill_id, "result": result, "elapsed_ms": int((time.perf_counter() - started) * 1000)}
+
+    async def _tagged(skill_id: int, coro: Any) -> Tuple[int, str]:
+        return skill_id, await coro
+
+    first_two = [
+        asyncio.ensure_future(_tagged(1, skill1_content_structure_judge(content))),
+        asyncio.ensure_future(_tagged(2, skill2_pre_writing_clarifier(writing_intent))),
+    ]
+    results: Dict[int, str] = {}
+    try:
+        for fut in asyncio.as_completed(first_two):
+            skill_id, result = await fut
+            results[skill_id] = result
+            yield _step(skill_id, result)
+    finally:
+        for task in first_two:
+            task.cancel()
+
+    if not core_idea.strip():
+        core_idea = f"以下是对原内容的结构拆解，请以其中的核心观点为准：\n{results[1]}"
+    results[3] = await skill3_mother_content_architect(core_idea)
+    yield _step(3, results[3])
+
+    if not mother_content.strip():
+        mother_content = results[3]
+    if not fanout:
+        results[4] = await skill4_content_repurposing_engine(mother_content)
+        yield _step(4, results[4])
+        return
+    results[4], sections = await skill4_fanout(mother_content)
+    yield {**_step(4, results[4]), "sections": sections}
@@ -0,0 +1,96 @@
+"""
+文本向量化：Embedder 为可替换的提供方，输出 L2 归一化的 float32 向量（余弦相似度即点积）。
+
+- DashScopeEmbedder：OpenAI 兼容接口的 text-embedding-v3，按 batch_size 分批请求
+- HashingEmbedder：本地哈希向量（中文单字 + 相邻两字、英文整词），不联网，供离线联调与压测
+"""
+import re
+import zlib
+from typing import List, Optional, Sequence
+
+import numpy as np
+
+from src.config import get_settings
+from src.services.llm_service import get_llm_service
+
+
+_CJK_RUN_RE = re.compile(r"[\u3400-\u9fff\uf900-\ufaff]+")
+_WORD_RE = re.compile(r"[A-Za-z0-9]+")
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (matrix / norms).astype(np.float32, copy=False)
+
+
+class Embedder:
+    name = "base"
+    dim = 0
+    batch_size = 64
+
+    @property
+    def space(self) -> str:
+        """向量空间标识：不同提供方 / 模型 / 维度的向量不可混用，分开存放。"""
+        return f"{self.name}-{self.dim}"
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        """返回 (len(texts), dim) 的归一化 float32 矩阵；调用方按 batch_size 分批。"""
+        raise NotImplementedError
+
+
+class HashingEmbedder(Embedder):
+    name = "hashing"
+
+    def __init__(self, dim: int = 1024) -> None:
+        self.dim = dim
+        self.batch_size = 256
+
+    def _features(self, text: str) -> List[str]:
+        feats = [w.lower() for w in _WORD_RE.findall(text)]
+        for run in _CJK_RUN_RE.findall(text):
+            feats.extend(run)
+            feats.extend(run[i : i + 2] for i in range(len(run) - 1))
+        return feats
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for i, text in enumerate(texts):
+            for feat in self._features(text):
+                h = zlib.crc32(feat.encode("utf-8"))
+                out[i, h % self.dim] += 1.0 if (h >> 31) & 1 else -1.0
+        return _normalize(out)
+
+
+class DashScopeEmbedder(Embedder):
+    def __init__(self, model: str, dim: int, batch_size: int) -> None:
+        self.name = model
+        self.model = model
+        self.dim = dim
+        self.batch_size = batch_size
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        # 空串会被接口拒绝
+        inputs = [t if t.strip() else " " for t in texts]
+        resp = get_llm_service().client.embeddings.create(
+            model=self.model,
+            input=inputs,
+            dimensions=self.dim,
+            encoding_format="float",
+        )
+        data = sorted(resp.data, key=lambda d: d.index)
+        return _normalize(np.asarray([d.embedding for d in data], dtype=np.float32))
+
+
+_embedder: Optional[Embedder] = None
+
+
+def get_embedder() -> Embedder:
+    global _embedder
+    if _embedder is None:
+        settings = get_settings().embedding
+        if settings.provider == "hashing":
+            _embedder = HashingEmbedder(settings.dim)
+        else:
+            _embedder = DashScopeEmbedder(settings.model, settings.dim, settings.batch_size)
+    return _embedder
@@ -0,0 +1,123 @@
+"""
+只追加的向量文件：vectors.f32 为 (n, dim) 的 float32 行，ids.i64 为每行对应的片段 id（int64）。
+读取时用 np.memmap 映射，按需换入页面；查询分块计算点积并维护 top-k，常驻内存与语料规模无关。
+多进程（多个 uvicorn worker）追加时以 .lock 文件加排他锁；两文件行数不一致（追加中途退出）时按短的截齐。
+"""
+import os
+import threading
+from pathlib import Path
+from typing import Optional, Sequence, Tuple
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows 本地开发：仅进程内加锁
+    fcntl = None
+
+
+# 全量扫描时每块的行数（1024 维时约 64MB）
+SCAN_CHUNK_ROWS = 16384
+
+
+class EmbeddingStore:
+    def __init__(self, directory: str, dim: int) -> None:
+        self.dir = Path(directory)
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self.dim = dim
+        self.vectors_path = self.dir / "vectors.f32"
+        self.ids_path = self.dir / "ids.i64"
+        self.lock_path = self.dir / ".lock"
+        self._lock = threading.Lock()
+        self._vectors: Optional[np.memmap] = None
+        self._ids: Optional[np.memmap] = None
+        self._mapped_rows = 0
+
+    def __len__(self) -> int:
+        vec_rows = self.vectors_path.stat().st_size // (4 * self.dim) if self.vectors_path.exists() else 0
+        id_rows = self.ids_path.stat().st_size // 8 if self.ids_path.exists() else 0
+        return min(vec_rows, id_rows)
+
+    def _file_lock(self):
+        handle = open(self.lock_path, "a")
+        if fcntl is not None:
+            fcntl.flock(handle, fcntl.LOCK_EX)
+        return handle
+
+    def append(self, ids: Sequence[int], vectors: np.ndarray) -> int:
+        """追加若干行，返回第一行的行号。vectors 须已归一化。"""
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        ids_arr = np.ascontiguousarray(ids, dtype=np.int64)
+        if vectors.shape != (len(ids_arr), self.dim):
+            raise ValueError(f"expected ({len(ids_arr)}, {self.dim}) vectors, got {vectors.shape}")
+        with self._lock:
+            handle = self._file_lock()
+            try:
+                start = len(self)
+                with open(self.vectors_path, "ab") as vf, open(self.ids_path, "ab") as idf:
+                    # 截掉上次中断时多写的半截
+                    vf.truncate(start * 4 * self.dim)
+                    idf.truncate(start * 8)
+                    vf.write(vectors.tobytes())
+                    idf.write(ids_arr.tobytes())
+                    vf.flush()
+                    idf.flush()
+                    os.fsync(vf.fileno())
+                    os.fsync(idf.fileno())
+                return start
+            finally:
+                handle.close()
+
+    def _mapped(self) -> Tuple[Optional[np.memmap], Optional[np.memmap]]:
+        """按当前行数（重新）映射文件；文件增长后才重建映射。"""
+        rows = len(self)
+        with self._lock:
+            if rows != self._mapped_rows or self._vectors is None:
+                if rows == 0:
+                    self._vectors = self._ids = None
+                else:
+                    self._vectors = np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(rows, self.dim))
+                    self._ids = np.memmap(self.ids_path, dtype=np.int64, mode="r", shape=(rows,))
+                self._mapped_rows = rows
+            return self._vectors, self._ids
+
+    def top_k(
+        self,
+        query: np.ndarray,
+        k: int,
+        rows: Optional[Sequence[int]] = None,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        返回 (片段 id, 余弦相似度)，按相似度降序。rows 给定时只在这些行中找（按录音过滤后的候选），
+        否则分块扫描全部行。
+        """
+        vectors, ids = self._mapped()
+        empty = (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32))
+        if vectors is None or k <= 0:
+            return empty
+        query = np.asarray(query, dtype=np.float32).reshape(self.dim)
+
+        if rows is not None:
+            picked = np.unique(np.asarray(rows, dtype=np.int64))
+            picked = picked[picked < len(vectors)]
+            if not len(picked):
+                return empty
+            scores = vectors[picked] @ query
+            return self._select(ids[picked], scores, k)
+
+        best_ids, best_scores = empty
+        for start in range(0, len(vectors), SCAN_CHUNK_ROWS):
+            chunk_scores = vectors[start : start + SCAN_CHUNK_ROWS] @ query
+            chunk_ids, chunk_scores = self._select(ids[start : start + SCAN_CHUNK_ROWS], chunk_scores, k)
+            best_ids, best_scores = self._select(
+                np.concatenate([best_ids, chunk_ids]), np.concatenate([best_scores, chunk_scores]), k
+            )
+        return best_ids, best_scores
+
+    @staticmethod
+    def _select(ids: np.ndarray, scores: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        if len(scores) > k:
+            part = np.argpartition(-scores, k - 1)[:k]
+            ids, scores = ids[part], scores[part]
+        order = np.argsort(-scores, kind="stable")
+        return np.asarray(ids[order], dtype=np.int64), np.asarray(scores[order], dtype=np.float32)
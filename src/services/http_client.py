@@ -0,0 +1,29 @@
+"""进程内共享的 httpx 连接池：出站 HTTP（如下载 transcription_url）复用 keep-alive 连接。"""
+import threading
+from typing import Optional
+
+import httpx
+
+
+_client: Optional[httpx.Client] = None
+_lock = threading.Lock()
+
+
+def get_http_client() -> httpx.Client:
+    global _client
+    if _client is None:
+        with _lock:
+            if _client is None:
+                _client = httpx.Client(
+                    timeout=httpx.Timeout(60.0, connect=10.0),
+                    limits=httpx.Limits(max_connections=50, max_keepalive_connections=20, keepalive_expiry=30.0),
+                )
+    return _client
+
+
+def close_http_client() -> None:
+    global _client
+    with _lock:
+        if _client is not None:
+            _client.close()
+            _client = None
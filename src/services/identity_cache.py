@@ -0,0 +1,121 @@
+"""
+get_identity 的进程内缓存：已验证的 JWT payload 与身份快照（identity + remaining），按 TTL 过期、按条目数 LRU 淘汰。
+每个身份有一个版本号，本进程内的余额变化（预留、退回、充值）会递增版本号，旧快照随之失效；
+快照写入时带上查询前读到的版本号，查询期间发生的变化不会被旧结果覆盖。
+其他 worker 上的变化最多在 TTL 后可见；remaining 只用于展示，扣减以 usage_service.reserve 的条件 UPDATE 为准，缓存不会造成超扣。
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from src.config import get_settings
+from src.services.auth_service import decode_access_token
+
+
+IdentityKey = Tuple[str, str]
+
+
+class IdentityCache:
+    def __init__(self) -> None:
+        settings = get_settings().auth
+        self.ttl_seconds = settings.identity_cache_ttl_seconds
+        self.max_entries = settings.identity_cache_entries
+        self.enabled = self.ttl_seconds > 0
+        self._lock = threading.Lock()
+        self._tokens: "OrderedDict[str, Tuple[dict, float]]" = OrderedDict()
+        self._snapshots: "OrderedDict[IdentityKey, Tuple[int, dict, float]]" = OrderedDict()
+        # 版本号取自全局递增的 _clock；版本表也按 LRU 淘汰，被淘汰的身份按 _floor（已淘汰的最大版本）计，
+        # 只会让旧快照多失效一次，不会把过期快照当成最新
+        self._versions: "OrderedDict[IdentityKey, int]" = OrderedDict()
+        self._clock = 0
+        self._floor = 0
+        self._stats = {"token_hits": 0, "token_misses": 0, "identity_hits": 0, "identity_misses": 0}
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "tokens": len(self._tokens),
+                "identities": len(self._snapshots),
+                **self._stats,
+            }
+
+    def _put(self, store: OrderedDict, key: Any, value: tuple) -> None:
+        store[key] = value
+        store.move_to_end(key)
+        while len(store) > self.max_entries:
+            store.popitem(last=False)
+
+    # --- JWT ---
+
+    def decode_token(self, token: str) -> Optional[dict]:
+        """decode_access_token 的缓存版；缓存不超过 token 自身的 exp。无效 token 不缓存。"""
+        if not self.enabled:
+            return decode_access_token(token)
+        now = time.time()
+        with self._lock:
+            item = self._tokens.get(token)
+            if item is not None and item[1] > now:
+                self._tokens.move_to_end(token)
+                self._stats["token_hits"] += 1
+                return item[0]
+            self._stats["token_misses"] += 1
+        payload = decode_access_token(token)
+        if payload is not None:
+            expires_at = min(now + self.ttl_seconds, float(payload.get("exp", now)))
+            with self._lock:
+                self._put(self._tokens, token, (payload, expires_at))
+        return payload
+
+    # --- 身份快照 ---
+
+    def version(self, key: IdentityKey) -> int:
+        """查库前先取版本号，写回快照时带上。"""
+        with self._lock:
+            return self._versions.get(key, self._floor)
+
+    def get(self, key: IdentityKey) -> Optional[dict]:
+        if not self.enabled:
+            return None
+        with self._lock:
+            item = self._snapshots.get(key)
+            if item is not None:
+                version, info, expires_at = item
+                if version == self._versions.get(key, self._floor) and expires_at > time.time():
+                    self._snapshots.move_to_end(key)
+                    self._stats["identity_hits"] += 1
+                    return dict(info)
+                del self._snapshots[key]
+            self._stats["identity_misses"] += 1
+        return None
+
+    def put(self, key: IdentityKey, version: int, info: dict) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            if version != self._versions.get(key, self._floor):
+                # 查询期间余额已变化，结果可能是旧的
+                return
+            self._put(self._snapshots, key, (version, dict(info), time.time() + self.ttl_seconds))
+
+    def bump(self, key: IdentityKey) -> None:
+        """余额变化后调用：递增版本号，丢弃该身份的快照。"""
+        with self._lock:
+            self._clock += 1
+            self._versions[key] = self._clock
+            self._versions.move_to_end(key)
+            while len(self._versions) > self.max_entries:
+                _, evicted = self._versions.popitem(last=False)
+                self._floor = max(self._floor, evicted)
+            self._snapshots.pop(key, None)
+
+
+_identity_cache: Optional[IdentityCache] = None
+
+
+def get_identity_cache() -> IdentityCache:
+    global _identity_cache
+    if _identity_cache is None:
+        _identity_cache = IdentityCache()
+    return _identity_cache
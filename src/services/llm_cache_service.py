@@ -0,0 +1,220 @@
+"""
+内容 Skill 的 LLM 结果两级缓存：进程内 LRU + SQLite 持久层。
+键为 (model, system prompt, 用户内容哈希, temperature)，很多用户会把同一条爆款内容贴进 Skill 1，
+相同输入直接复用上次生成结果。两级都按 TTL 过期；内存层按条目数、SQLite 层按压缩后总字节数淘汰最久未使用的条目。
+缓存读写失败只记日志：LLM 调用已经成功，不能因为缓存写不进去让请求失败。
+"""
+import asyncio
+import hashlib
+import logging
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+
+from src.config import get_settings
+from src.db.models import LLMResponseCacheEntry
+from src.db.session import SessionLocal
+
+
+logger = logging.getLogger(__name__)
+
+
+def make_cache_key(model: str, system: str, user_content: str, temperature: float) -> str:
+    user_hash = hashlib.sha256(user_content.encode("utf-8")).hexdigest()
+    raw = "\x00".join([model, system, user_hash, f"{temperature:.3f}"])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class LLMResponseCache:
+    def __init__(self) -> None:
+        settings = get_settings().dashscope
+        self.enabled = settings.llm_cache_enabled
+        self.ttl_seconds = settings.llm_cache_ttl_seconds
+        self.memory_entries = settings.llm_cache_memory_entries
+        self.max_bytes = settings.llm_cache_max_bytes
+        self._lock = threading.Lock()
+        self._memory: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._stats: Dict[str, Dict[str, int]] = {}
+        # SQLite 层总字节数的本进程估计：首次写入时 SUM 一次，之后按增量维护；
+        # 超出上限时在淘汰前重新 SUM（同时计入其他 worker 的写入）
+        self._db_bytes: Optional[int] = None
+
+    # --- 统计 ---
+
+    def _bump(self, skill: str, key: str) -> None:
+        with self._lock:
+            per = self._stats.setdefault(skill, {"memory_hits": 0, "db_hits": 0, "misses": 0})
+            per[key] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """按 Skill 统计的命中率（本进程）。"""
+        with self._lock:
+            skills = {name: dict(per) for name, per in self._stats.items()}
+            memory_size = len(self._memory)
+        for per in skills.values():
+            hits = per["memory_hits"] + per["db_hits"]
+            lookups = hits + per["misses"]
+            per["hit_rate"] = round(hits / lookups, 4) if lookups else 0.0
+        return {"enabled": self.enabled, "memory_entries": memory_size, "skills": skills}
+
+    # --- 内存层 ---
+
+    def _memory_get(self, key: str) -> Optional[str]:
+        with self._lock:
+            item = self._memory.get(key)
+            if item is None:
+                return None
+            value, expires_at = item
+            if expires_at <= time.time():
+                del self._memory[key]
+                return None
+            self._memory.move_to_end(key)
+            return value
+
+    def _memory_put(self, key: str, value: str, expires_at: float) -> None:
+        with self._lock:
+            self._memory[key] = (value, expires_at)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_entries:
+                self._memory.popitem(last=False)
+
+    # --- SQLite 层（在线程中执行） ---
+
+    def _db_get(self, key: str) -> Optional[Tuple[str, int]]:
+        db = SessionLocal()
+        try:
+            entry = db.query(LLMResponseCacheEntry).filter(LLMResponseCacheEntry.cache_key == key).one_or_none()
+            now = int(time.time())
+            if entry is None:
+                return None
+            if entry.expires_at <= now:
+                db.delete(entry)
+                db.commit()
+                self._add_db_bytes(-entry.size_bytes)
+                return None
+            entry.last_used_at = now
+            db.commit()
+            return zlib.decompress(entry.response_blob).decode("utf-8"), entry.expires_at
+        finally:
+            db.close()
+
+    def _db_put(self, key: str, skill: str, model: str, value: str, expires_at: int) -> None:
+        blob = zlib.compress(value.encode("utf-8"))
+        if len(blob) > self.max_bytes:
+            return
+        db = SessionLocal()
+        try:
+            if self._db_bytes is None:
+                self._set_db_bytes(self._db_total(db))
+            entry = db.query(LLMResponseCacheEntry).filter(LLMResponseCacheEntry.cache_key == key).one_or_none()
+            old_size = 0
+            if entry is None:
+                entry = LLMResponseCacheEntry(cache_key=key)
+                db.add(entry)
+            else:
+                old_size = entry.size_bytes or 0
+            entry.skill = skill
+            entry.model = model
+            entry.response_blob = blob
+            entry.size_bytes = len(blob)
+            entry.expires_at = expires_at
+            entry.last_used_at = int(time.time())
+            try:
+                db.commit()
+            except IntegrityError:
+                # 并发写入同一键：以先写入者为准
+                db.rollback()
+                return
+            if self._add_db_bytes(len(blob) - old_size) > self.max_bytes:
+                self._db_evict(db)
+        finally:
+            db.close()
+
+    def _add_db_bytes(self, delta: int) -> int:
+        with self._lock:
+            if self._db_bytes is None:
+                return 0
+            self._db_bytes = max(0, self._db_bytes + delta)
+            return self._db_bytes
+
+    def _set_db_bytes(self, total: int) -> None:
+        with self._lock:
+            self._db_bytes = total
+
+    @staticmethod
+    def _db_total(db) -> int:
+        return db.query(func.coalesce(func.sum(LLMResponseCacheEntry.size_bytes), 0)).scalar() or 0
+
+    def _db_evict(self, db) -> None:
+        """先删过期条目，再按实际总量淘汰最久未使用的条目，并校正本进程的总字节数。"""
+        now = int(time.time())
+        db.query(LLMResponseCacheEntry).filter(LLMResponseCacheEntry.expires_at <= now).delete(
+            synchronize_session=False
+        )
+        db.commit()
+        total = self._db_total(db)
+        self._set_db_bytes(total)
+        if total <= self.max_bytes:
+            return
+        rows = (
+            db.query(LLMResponseCacheEntry.id, LLMResponseCacheEntry.size_bytes)
+            .order_by(LLMResponseCacheEntry.last_used_at.asc(), LLMResponseCacheEntry.id.asc())
+            .all()
+        )
+        victims = []
+        for row_id, size in rows:
+            if total <= self.max_bytes:
+                break
+            victims.append(row_id)
+            total -= size
+        if victims:
+            db.query(LLMResponseCacheEntry).filter(LLMResponseCacheEntry.id.in_(victims)).delete(
+                synchronize_session=False
+            )
+            db.commit()
+            self._set_db_bytes(total)
+
+    # --- 对外接口 ---
+
+    async def get(self, key: str, skill: str) -> Optional[str]:
+        value = self._memory_get(key)
+        if value is not None:
+            self._bump(skill, "memory_hits")
+            return value
+        try:
+            found = await asyncio.to_thread(self._db_get, key)
+        except Exception:
+            logger.warning("llm cache read failed, treated as miss", exc_info=True)
+            found = None
+        if found is None:
+            self._bump(skill, "misses")
+            return None
+        value, expires_at = found
+        self._memory_put(key, value, expires_at)
+        self._bump(skill, "db_hits")
+        return value
+
+    async def put(self, key: str, skill: str, model: str, value: str) -> None:
+        if not value:
+            return
+        expires_at = int(time.time()) + self.ttl_seconds
+        self._memory_put(key, value, expires_at)
+        try:
+            await asyncio.to_thread(self._db_put, key, skill, model, value, expires_at)
+        except Exception:
+            logger.warning("llm cache write failed, result kept in memory only", exc_info=True)
+
+
+_llm_response_cache: Optional[LLMResponseCache] = None
+
+
+def get_llm_response_cache() -> LLMResponseCache:
+    global _llm_response_cache
+    if _llm_response_cache is None:
+        _llm_response_cache = LLMResponseCache()
+    return _llm_response_cache
@@ -1,6 +1,13 @@
-from typing import Any, Dict, List, Optional
+import asyncio
+import hashlib
+import json
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Deque, Dict, List, Optional
 
-from openai import OpenAI
+import httpx
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient, OpenAI
 
 from src.config import get_settings
 
@@ -9,17 +16,182 @@ class LLMService:
     """
     使用 DashScope 的 OpenAI 兼容接口与 Qwen 模型进行分析。
 
-    这里只定义接口形状：
-    - analyze(transcript_segments) -> analysis_json
+    - client：同步 OpenAI 客户端（脚本等同步场景）
+    - aclient：AsyncOpenAI，共享 keep-alive 连接池；请求处理函数应 `await llm.chat(...)`，
+      等待期间不占用线程池，全局信号量限制同时在途的生成数
+    - stream_chat：流式输出增量文本，并记录首 token 延迟（TTFT）
+    - chat 按 prompt 指纹做 single-flight：同一进程内完全相同的并发请求（双击、前端重试）共享一次上游调用
+    - analyze(transcript_segments) -> analysis_json（接口形状，待实现）
     """
 
     def __init__(self) -> None:
         settings = get_settings().dashscope
         self.model = settings.llm_model
+        self.max_concurrency = settings.llm_max_concurrency
         self.client = OpenAI(
             api_key=settings.api_key,
-            base_url="https://dashscope.aliyuncs.com/compatible-mode/v1",
+            base_url=settings.compatible_base_url,
         )
+        self.aclient = AsyncOpenAI(
+            api_key=settings.api_key,
+            base_url=settings.compatible_base_url,
+            timeout=settings.llm_timeout_seconds,
+            http_client=DefaultAsyncHttpxClient(
+                limits=httpx.Limits(
+                    max_connections=settings.llm_pool_max_connections,
+                    max_keepalive_connections=settings.llm_pool_max_connections,
+                    keepalive_expiry=60.0,
+                ),
+            ),
+        )
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._in_flight = 0
+        self._waiting = 0
+        self._ttft_ms: Deque[float] = deque(maxlen=1000)
+        self._pending: Dict[str, "asyncio.Task[str]"] = {}
+        self._upstream_calls = 0
+        self._coalesced = 0
+
+    @asynccontextmanager
+    async def _slot(self) -> AsyncIterator[None]:
+        """占用一个并发名额，期间计入 in_flight。"""
+        self._waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self._waiting -= 1
+        self._in_flight += 1
+        try:
+            yield
+        finally:
+            self._in_flight -= 1
+            self._semaphore.release()
+
+    async def chat(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float = 0.2,
+        model: Optional[str] = None,
+        **kwargs: Any,
+    ) -> str:
+        """单轮对话补全，返回 message.content（可能为空字符串）。相同请求在途时直接等待已有结果。"""
+        model = model or self.model
+        key = self.fingerprint(messages, temperature, model, **kwargs)
+        task = self._pending.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._chat_upstream(messages, temperature, model, **kwargs))
+            self._pending[key] = task
+            self._upstream_calls += 1
+            task.add_done_callback(lambda t, k=key: self._forget(k, t))
+        else:
+            self._coalesced += 1
+        # shield：某个调用方断开时不取消其他调用方共享的上游请求
+        return await asyncio.shield(task)
+
+    def _forget(self, key: str, task: "asyncio.Task[str]") -> None:
+        self._pending.pop(key, None)
+        if not task.cancelled():
+            # 所有调用方都已断开时异常无人取走，这里标记为已处理，避免 "exception was never retrieved"
+            task.exception()
+
+    async def _chat_upstream(self, messages: List[Dict[str, str]], temperature: float, model: str, **kwargs: Any) -> str:
+        resp = await self.create_completion(messages, temperature=temperature, model=model, **kwargs)
+        return resp.choices[0].message.content or ""
+
+    @staticmethod
+    def fingerprint(messages: List[Dict[str, str]], temperature: float, model: str, **kwargs: Any) -> str:
+        payload = json.dumps(
+            {"model": model, "messages": messages, "temperature": temperature, "kwargs": kwargs},
+            ensure_ascii=False,
+            sort_keys=True,
+            default=str,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    async def create_completion(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float = 0.2,
+        model: Optional[str] = None,
+        **kwargs: Any,
+    ) -> Any:
+        async with self._slot():
+            return await self.aclient.chat.completions.create(
+                model=model or self.model,
+                messages=messages,
+                temperature=temperature,
+                **kwargs,
+            )
+
+    async def stream_chat(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float = 0.2,
+        model: Optional[str] = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[str]:
+        """stream=True 的对话补全，逐个产出非空的增量文本；整个流期间占用一个并发名额。"""
+        async with self._slot():
+            started = time.perf_counter()
+            stream = await self.aclient.chat.completions.create(
+                model=model or self.model,
+                messages=messages,
+                temperature=temperature,
+                stream=True,
+                **kwargs,
+            )
+            first = True
+            try:
+                async for chunk in stream:
+                    if not chunk.choices:
+                        continue
+                    delta = chunk.choices[0].delta.content
+                    if not delta:
+                        continue
+                    if first:
+                        self._ttft_ms.append((time.perf_counter() - started) * 1000)
+                        first = False
+                    yield delta
+            finally:
+                await stream.close()
+
+    async def warmup(self, connections: int = 4) -> None:
+        """启动时预先建立到 DashScope 的 TLS 连接，首个请求不再付握手开销；失败不影响启动。"""
+        if not get_settings().dashscope.api_key or connections <= 0:
+            return
+
+        async def _touch() -> None:
+            try:
+                # 轻量请求即可，返回内容不重要，目的是把连接放进池里
+                await self.aclient.with_options(max_retries=0, timeout=10.0).models.list()
+            except Exception:
+                pass
+
+        await asyncio.gather(*[_touch() for _ in range(connections)])
+
+    async def aclose(self) -> None:
+        await self.aclient.close()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "in_flight": self._in_flight,
+            "waiting": self._waiting,
+            "max_concurrency": self.max_concurrency,
+            "upstream_calls": self._upstream_calls,
+            "coalesced": self._coalesced,
+            "ttft_ms": self.ttft_stats(),
+        }
+
+    def ttft_stats(self) -> Dict[str, Any]:
+        """最近 1000 次流式请求的首 token 延迟（毫秒）。"""
+        samples = sorted(self._ttft_ms)
+        if not samples:
+            return {"count": 0, "p50": None, "p95": None, "max": None}
+
+        def pct(q: float) -> float:
+            return round(samples[min(len(samples) - 1, int(q * len(samples)))], 1)
+
+        return {"count": len(samples), "p50": pct(0.5), "p95": pct(0.95), "max": round(samples[-1], 1)}
 
     def analyze(self, transcript_segments: List[Dict[str, Any]]) -> Dict[str, Any]:
         # TODO: 根据 CURSORRULE 设计 prompt，返回结构化 JSON
@@ -34,5 +206,3 @@ def get_llm_service() -> LLMService:
     if _llm_service is None:
         _llm_service = LLMService()
     return _llm_service
-
-
@@ -29,6 +29,9 @@ class OSSService:
         ext_clean = (ext or "").strip().lstrip(".").lower() or "wav"
         return f"{self.prefix}{recording_id}.{ext_clean}"
 
+    def object_key_for_chunk(self, recording_id: str, index: int) -> str:
+        return f"{self.prefix}chunks/{recording_id}/{index:04d}.wav"
+
     def sign_url_for_key(self, method: str, object_key: str, expire_seconds: int) -> str:
         return self.bucket.sign_url(method, object_key, expire_seconds)
 
@@ -43,6 +46,12 @@ class OSSService:
     def upload_local_file(self, object_key: str, local_path: str) -> None:
         self.bucket.put_object_from_file(object_key, local_path)
 
+    def download_to_file(self, object_key: str, local_path: str) -> None:
+        self.bucket.get_object_to_file(object_key, local_path)
+
+    def get_etag(self, object_key: str) -> str:
+        return self.bucket.head_object(object_key).etag
+
     def delete_object(self, recording_id: str) -> None:
         key = self._object_key_for_recording(recording_id)
         self.bucket.delete_object(key)
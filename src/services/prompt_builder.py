@@ -0,0 +1,131 @@
+"""
+转写类 prompt 的 token 预算控制：本地估算 token（区分中日文字符），超出模型预算时
+先压缩过长片段，再按确定性的价值排序丢弃低价值片段，保持剩余片段的原有顺序。
+
+- estimate_tokens(text)
+- budget_for_model(model)：LLM_PROMPT_TOKEN_BUDGETS 中的按模型配置，缺省为 LLM_PROMPT_TOKEN_BUDGET
+- build_prompt(head, lines, tail, budget_tokens, query) -> BuiltPrompt（含 prompt_tokens 等统计）
+"""
+import re
+from dataclasses import dataclass
+from typing import List, Sequence, Set, Tuple
+
+from src.config import get_settings
+
+
+_CJK_RE = re.compile(r"[\u3400-\u9fff\uf900-\ufaff\u3000-\u303f\uff00-\uffef]")
+_WORD_RE = re.compile(r"[A-Za-z0-9]+")
+_FILLER = {"嗯", "啊", "哦", "呃", "额", "嗯嗯", "好", "好的", "对", "对对", "是", "是的", "行", "哈哈", "ok", "OK"}
+
+# 被压缩片段的结尾标记
+ELLIPSIS = "…"
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算：中日文字符及全角标点约 1 token/字，其余约 4 字符/token。"""
+    cjk = len(_CJK_RE.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """截到不超过 max_tokens（估算值），末尾加省略号。"""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    lo, hi = 0, len(text)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if estimate_tokens(text[:mid]) + 1 <= max_tokens:
+            lo = mid
+        else:
+            hi = mid - 1
+    return text[:lo] + ELLIPSIS
+
+
+def budget_for_model(model: str) -> int:
+    settings = get_settings().dashscope
+    return settings.llm_prompt_token_budgets.get(model, settings.llm_prompt_token_budget)
+
+
+def _terms(text: str) -> Set[str]:
+    """中文取相邻两字，英文/数字取整词（小写），用于与问题做重合度打分。"""
+    terms = {w.lower() for w in _WORD_RE.findall(text)}
+    cjk = "".join(_CJK_RE.findall(text))
+    terms.update(cjk[i : i + 2] for i in range(len(cjk) - 1))
+    return terms
+
+
+@dataclass
+class BuiltPrompt:
+    text: str
+    prompt_tokens: int
+    budget_tokens: int
+    total_lines: int
+    kept_lines: int
+    condensed_lines: int
+
+    @property
+    def dropped_lines(self) -> int:
+        return self.total_lines - self.kept_lines
+
+
+def build_prompt(
+    head: str,
+    lines: Sequence[Tuple[str, str]],
+    tail: str,
+    budget_tokens: int,
+    query: str = "",
+    max_line_tokens: int = 400,
+) -> BuiltPrompt:
+    """
+    lines 为 (label, text)，渲染为 "[label] text"，按原顺序放在 head 与 tail 之间。
+    超预算时：1）把超过 max_line_tokens 的片段截断；2）仍超出则按价值从低到高丢弃，
+    价值 = 与 query 的词重合数 × 10 + 片段长度（封顶 50 token）/ 50，口头语记 0；同分先丢靠前的片段。
+    """
+    fixed = estimate_tokens(head) + estimate_tokens(tail) + 2
+    rendered = [f"[{label}] {text}" for label, text in lines]
+    costs = [estimate_tokens(r) + 1 for r in rendered]
+    available = budget_tokens - fixed
+    condensed = 0
+
+    if sum(costs) > available:
+        for i, (label, text) in enumerate(lines):
+            if costs[i] > max_line_tokens:
+                rendered[i] = f"[{label}] {truncate_to_tokens(text, max_line_tokens - estimate_tokens(f'[{label}] '))}"
+                costs[i] = estimate_tokens(rendered[i]) + 1
+                condensed += 1
+
+    keep = [True] * len(lines)
+    total = sum(costs)
+    if total > available:
+        # 预留省略提示的位置
+        available -= 20
+        query_terms = _terms(query)
+        scores: List[Tuple[float, int]] = []
+        for i, (_, text) in enumerate(lines):
+            stripped = text.strip().strip("，。！？,.!?")
+            if not stripped or stripped in _FILLER:
+                score = 0.0
+            else:
+                overlap = len(query_terms & _terms(text)) if query_terms else 0
+                score = overlap * 10 + min(estimate_tokens(text), 50) / 50
+            scores.append((score, i))
+        for _, i in sorted(scores):
+            if total <= available:
+                break
+            keep[i] = False
+            total -= costs[i]
+
+    body = [r for r, k in zip(rendered, keep) if k]
+    dropped = len(lines) - len(body)
+    if dropped:
+        body.append(f"（为控制长度，已省略 {dropped} 个相关性较低的片段）")
+    text = head + "\n".join(body) + tail
+    return BuiltPrompt(
+        text=text,
+        prompt_tokens=estimate_tokens(text),
+        budget_tokens=budget_tokens,
+        total_lines=len(lines),
+        kept_lines=len(body) - (1 if dropped else 0),
+        condensed_lines=condensed,
+    )
+
@@ -1,11 +1,60 @@
-from datetime import datetime, timezone
-from typing import Optional
+from datetime import date, datetime, timedelta, timezone, tzinfo
+from functools import lru_cache
+from typing import List, Optional, Tuple
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 
-from sqlalchemy.orm import Session
+from sqlalchemy import select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Query, Session
 
 from src.db.models import RecordingMeta
 
 
+# 各时区相对 UTC 的最大偏移（UTC+14 / UTC-12），用于把本地日期换算成足够宽的 UTC 查询区间
+_MAX_AHEAD = timedelta(hours=14)
+_MAX_BEHIND = timedelta(hours=12)
+
+# 录音的时区名在本机无法识别时按北京时间处理
+_FALLBACK_TZ = timezone(timedelta(hours=8))
+
+
+@lru_cache(maxsize=64)
+def _zone(name: str) -> tzinfo:
+    try:
+        return ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError):
+        return _FALLBACK_TZ
+
+
+def local_date(rec: RecordingMeta) -> date:
+    """录音开始时间在其自身时区（RecordingMeta.timezone）下的日期。"""
+    return datetime.fromtimestamp(rec.start_at, _zone(rec.timezone or "Asia/Shanghai")).date()
+
+
+Cursor = Tuple[int, int]
+
+
+def _device_page_criteria(device_id: str, start_from: int, start_to: int, after: Optional[Cursor]) -> list:
+    criteria = [
+        RecordingMeta.device_id == device_id,
+        RecordingMeta.start_at >= start_from,
+        RecordingMeta.start_at < start_to,
+    ]
+    if after is not None:
+        criteria.append(tuple_(RecordingMeta.start_at, RecordingMeta.id) > tuple_(*after))
+    return criteria
+
+
+_DEVICE_PAGE_ORDER = (RecordingMeta.start_at.asc(), RecordingMeta.id.asc())
+
+
+def _utc_range(date_from: date, date_to: date) -> Tuple[int, int]:
+    """能覆盖所有时区下 [date_from, date_to] 本地日期的 UTC 时间戳区间 [start_from, start_to)。"""
+    midnight = datetime(date_from.year, date_from.month, date_from.day, tzinfo=timezone.utc)
+    end = datetime(date_to.year, date_to.month, date_to.day, tzinfo=timezone.utc) + timedelta(days=1)
+    return int((midnight - _MAX_AHEAD).timestamp()), int((end + _MAX_BEHIND).timestamp())
+
+
 class RecordingService:
     def __init__(self, db: Session) -> None:
         self.db = db
@@ -55,6 +104,55 @@ class RecordingService:
             .one_or_none()
         )
 
+    def device_page_query(self, device_id: str, start_from: int, start_to: int, after: Optional[Cursor]) -> Query:
+        """
+        device_id 相等 + start_at 区间 + (start_at, id) 之后，按 (start_at, id) 升序；
+        走 ix_recording_meta_device_start，每页只读取本页附近的索引项。
+        """
+        return (
+            self.db.query(RecordingMeta)
+            .filter(*_device_page_criteria(device_id, start_from, start_to, after))
+            .order_by(*_DEVICE_PAGE_ORDER)
+        )
+
+    def list_for_device(
+        self,
+        device_id: str,
+        date_from: date,
+        date_to: date,
+        limit: int = 50,
+        after: Optional[Cursor] = None,
+    ) -> Tuple[List[RecordingMeta], Optional[Cursor]]:
+        """
+        列出某设备本地日期在 [date_from, date_to] 内的录音（按各录音自身时区判断日期），按开始时间升序。
+        返回 (本页录音, 下一页游标)；没有更多时游标为 None。
+        先按所有时区都能覆盖的 UTC 区间查索引，再逐条按录音时区精确过滤，首尾最多多读约一天的录音。
+        """
+        start_from, start_to = _utc_range(date_from, date_to)
+        items: List[RecordingMeta] = []
+        scanned = after
+        batch = limit + 1
+        while True:
+            rows = self.device_page_query(device_id, start_from, start_to, scanned).limit(batch).all()
+            for rec in rows:
+                if date_from <= local_date(rec) <= date_to:
+                    if len(items) == limit:
+                        # 还有下一条符合条件的录音：以本页最后一条为游标
+                        return items, (items[-1].start_at, items[-1].id)
+                    items.append(rec)
+                scanned = (rec.start_at, rec.id)
+            if len(rows) < batch:
+                return items, None
+
+    def list_by_status(self, status: str, limit: int = 100) -> List[RecordingMeta]:
+        return (
+            self.db.query(RecordingMeta)
+            .filter(RecordingMeta.status == status)
+            .order_by(RecordingMeta.start_at.asc())
+            .limit(limit)
+            .all()
+        )
+
     def delete_recording(self, recording_id: str) -> None:
         rec = (
             self.db.query(RecordingMeta)
@@ -67,3 +165,92 @@ class RecordingService:
         self.db.commit()
 
 
+
+
+class AsyncRecordingService:
+    """RecordingService 的异步版本，供在事件循环上直接查询的路由使用；语义与同步版一致。"""
+
+    def __init__(self, db: AsyncSession) -> None:
+        self.db = db
+
+    async def create_or_get_recording(
+        self,
+        device_id: str,
+        recording_id: str,
+        start_at: int,
+        end_at: int,
+        timezone_str: str,
+        oss_file_path: str,
+    ) -> RecordingMeta:
+        existing = await self.get_recording(recording_id)
+        if existing:
+            if not existing.oss_file_path and oss_file_path:
+                existing.oss_file_path = oss_file_path
+                await self.db.commit()
+            return existing
+
+        rec = RecordingMeta(
+            device_id=device_id,
+            recording_id=recording_id,
+            start_at=start_at,
+            end_at=end_at,
+            timezone=timezone_str,
+            oss_file_path=oss_file_path,
+            status="uploaded",
+            retry_count=0,
+            create_time=datetime.now(timezone.utc),
+        )
+        self.db.add(rec)
+        await self.db.commit()
+        await self.db.refresh(rec)
+        return rec
+
+    async def get_recording(self, recording_id: str) -> Optional[RecordingMeta]:
+        result = await self.db.execute(select(RecordingMeta).where(RecordingMeta.recording_id == recording_id))
+        return result.scalar_one_or_none()
+
+    async def list_for_device(
+        self,
+        device_id: str,
+        date_from: date,
+        date_to: date,
+        limit: int = 50,
+        after: Optional[Cursor] = None,
+    ) -> Tuple[List[RecordingMeta], Optional[Cursor]]:
+        """见 RecordingService.list_for_device。"""
+        start_from, start_to = _utc_range(date_from, date_to)
+        items: List[RecordingMeta] = []
+        scanned = after
+        batch = limit + 1
+        while True:
+            result = await self.db.execute(
+                select(RecordingMeta)
+                .where(*_device_page_criteria(device_id, start_from, start_to, scanned))
+                .order_by(*_DEVICE_PAGE_ORDER)
+                .limit(batch)
+            )
+            rows = result.scalars().all()
+            for rec in rows:
+                if date_from <= local_date(rec) <= date_to:
+                    if len(items) == limit:
+                        return items, (items[-1].start_at, items[-1].id)
+                    items.append(rec)
+                scanned = (rec.start_at, rec.id)
+            if len(rows) < batch:
+                return items, None
+
+    async def list_by_status(self, status: str, limit: int = 100) -> List[RecordingMeta]:
+        result = await self.db.execute(
+            select(RecordingMeta)
+            .where(RecordingMeta.status == status)
+            .order_by(RecordingMeta.start_at.asc())
+            .limit(limit)
+        )
+        return list(result.scalars().all())
+
+    async def delete_recording(self, recording_id: str) -> None:
+        rec = await self.get_recording(recording_id)
+        if rec is None:
+            return
+        await self.db.delete(rec)
+        await self.db.commit()
@@ -0,0 +1,241 @@
+"""
+转写片段的本地 BM25 检索：中文按相邻两字切词，英文 / 数字按整词（小写）。
+倒排（transcript_terms）在 TranscriptService.replace_segments 写入片段时按差异同步更新；
+问答时只取与问题最相关的 top-k 片段及其前后相邻片段，prompt 大小不再随历史长度增长；
+与向量召回（semantic_retrieval_service）的结果用 fuse_rankings 合并。
+"""
+import math
+import re
+from collections import Counter, defaultdict
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import and_, func, insert, or_
+from sqlalchemy.orm import Session
+
+from src.db.models import TranscriptIndexStat, TranscriptSegment, TranscriptTerm
+
+
+_CJK_RUN_RE = re.compile(r"[\u3400-\u9fff\uf900-\ufaff]+")
+_WORD_RE = re.compile(r"[A-Za-z0-9]+")
+
+# 批量写入 / 按 IN 删除时每批的条数
+_WRITE_BATCH = 500
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+
+def tokenize(text: str) -> List[str]:
+    """中文连续字串取相邻两字（单字串保留单字），英文 / 数字取整词并转小写。"""
+    tokens = [w.lower()[:32] for w in _WORD_RE.findall(text)]
+    for run in _CJK_RUN_RE.findall(text):
+        if len(run) == 1:
+            tokens.append(run)
+        else:
+            tokens.extend(run[i : i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+def term_rows(recording_id: str, segment_index: int, text: str) -> List[Dict[str, Any]]:
+    """片段的倒排行（供 executemany 批量写入）。"""
+    tokens = tokenize(text)
+    return [
+        {
+            "recording_id": recording_id,
+            "segment_index": segment_index,
+            "term": term,
+            "tf": tf,
+            "doc_len": len(tokens),
+        }
+        for term, tf in Counter(tokens).items()
+    ]
+
+
+class TranscriptIndexWriter:
+    """
+    按录音维护倒排：replace_segments 只对变化的片段 remove / add，ensure_indexed 用 rebuild 全量补建。
+    倒排行攒批后一次 executemany 写入；finish 按当前片段重算统计。均不提交，由调用方控制事务。
+    """
+
+    def __init__(self, db: Session, recording_id: str) -> None:
+        self.db = db
+        self.recording_id = recording_id
+        self._pending: List[Dict[str, Any]] = []
+        self._removals: set = set()
+
+    def exists(self) -> bool:
+        return (
+            self.db.query(TranscriptIndexStat.recording_id)
+            .filter(TranscriptIndexStat.recording_id == self.recording_id)
+            .first()
+            is not None
+        )
+
+    def reset(self) -> None:
+        self._pending.clear()
+        self._removals.clear()
+        self.db.query(TranscriptTerm).filter(TranscriptTerm.recording_id == self.recording_id).delete()
+        self.db.query(TranscriptIndexStat).filter(TranscriptIndexStat.recording_id == self.recording_id).delete()
+
+    def remove(self, segment_indexes: Iterable[int]) -> None:
+        """删除这些片段的倒排行（在下次写入新行之前执行）。"""
+        self._removals.update(segment_indexes)
+
+    def add(self, segment_index: int, text: str) -> None:
+        self._pending.extend(term_rows(self.recording_id, segment_index, text))
+        if len(self._pending) >= _WRITE_BATCH * 10:
+            self._flush()
+
+    def _flush(self) -> None:
+        removals = sorted(self._removals)
+        for i in range(0, len(removals), _WRITE_BATCH):
+            self.db.query(TranscriptTerm).filter(
+                TranscriptTerm.recording_id == self.recording_id,
+                TranscriptTerm.segment_index.in_(removals[i : i + _WRITE_BATCH]),
+            ).delete(synchronize_session=False)
+        self._removals.clear()
+        if self._pending:
+            self.db.execute(insert(TranscriptTerm), self._pending)
+            self._pending = []
+
+    def rebuild(self) -> None:
+        self.reset()
+        for seg_index, text in (
+            self.db.query(TranscriptSegment.segment_index, TranscriptSegment.text)
+            .filter(TranscriptSegment.recording_id == self.recording_id)
+            .order_by(TranscriptSegment.segment_index.asc())
+        ):
+            self.add(seg_index, text)
+        self.finish()
+
+    def finish(self) -> None:
+        self._flush()
+        segment_count = (
+            self.db.query(func.count(TranscriptSegment.id))
+            .filter(TranscriptSegment.recording_id == self.recording_id)
+            .scalar()
+        )
+        per_segment = (
+            self.db.query(func.max(TranscriptTerm.doc_len).label("doc_len"))
+            .filter(TranscriptTerm.recording_id == self.recording_id)
+            .group_by(TranscriptTerm.segment_index)
+            .subquery()
+        )
+        total_terms = self.db.query(func.coalesce(func.sum(per_segment.c.doc_len), 0)).scalar()
+        self.db.query(TranscriptIndexStat).filter(TranscriptIndexStat.recording_id == self.recording_id).delete()
+        self.db.add(
+            TranscriptIndexStat(
+                recording_id=self.recording_id,
+                segment_count=segment_count or 0,
+                total_terms=total_terms or 0,
+            )
+        )
+
+
+def fuse_rankings(
+    rankings: Sequence[Sequence[Tuple[Tuple[str, int], float]]],
+    top_k: int,
+    k: int = 60,
+) -> List[Tuple[str, int]]:
+    """倒数排名融合（RRF）：各路结果按名次计 1 / (k + rank) 累加，分数尺度不同的召回可直接合并。"""
+    fused: Dict[Tuple[str, int], float] = defaultdict(float)
+    for ranking in rankings:
+        for rank, (key, _) in enumerate(ranking):
+            fused[key] += 1.0 / (k + rank + 1)
+    return [key for key, _ in sorted(fused.items(), key=lambda kv: (-kv[1], kv[0]))[:top_k]]
+
+
+class TranscriptRetriever:
+    def __init__(self, db: Session) -> None:
+        self.db = db
+
+    def ensure_indexed(self, recording_ids: Sequence[str]) -> None:
+        """补建此前写入、尚无倒排的录音（一次性）。"""
+        indexed = {
+            rid
+            for (rid,) in self.db.query(TranscriptIndexStat.recording_id)
+            .filter(TranscriptIndexStat.recording_id.in_(recording_ids))
+            .all()
+        }
+        for rid in recording_ids:
+            if rid in indexed:
+                continue
+            TranscriptIndexWriter(self.db, rid).rebuild()
+        self.db.commit()
+
+    def rank(
+        self,
+        recording_ids: Sequence[str],
+        question: str,
+        top_k: int = 20,
+    ) -> Optional[Tuple[List[Tuple[Tuple[str, int], float]], int]]:
+        """
+        返回 ([((recording_id, segment_index), BM25 分)], 候选片段数)，按分数降序取前 top_k；
+        问题中没有任何词出现在这些录音里时返回 None。
+        """
+        terms = sorted(set(tokenize(question)))
+        if not recording_ids or not terms:
+            return None
+        self.ensure_indexed(recording_ids)
+
+        n_docs, total_terms = (
+            self.db.query(
+                func.coalesce(func.sum(TranscriptIndexStat.segment_count), 0),
+                func.coalesce(func.sum(TranscriptIndexStat.total_terms), 0),
+            )
+            .filter(TranscriptIndexStat.recording_id.in_(recording_ids))
+            .one()
+        )
+        if not n_docs:
+            return None
+        avgdl = total_terms / n_docs
+
+        rows = (
+            self.db.query(
+                TranscriptTerm.recording_id,
+                TranscriptTerm.segment_index,
+                TranscriptTerm.term,
+                TranscriptTerm.tf,
+                TranscriptTerm.doc_len,
+            )
+            .filter(TranscriptTerm.term.in_(terms), TranscriptTerm.recording_id.in_(recording_ids))
+            .all()
+        )
+        if not rows:
+            return None
+
+        df = Counter(term for _, _, term, _, _ in rows)
+        scores: Dict[Tuple[str, int], float] = defaultdict(float)
+        for rid, seg_index, term, tf, doc_len in rows:
+            idf = math.log(1 + (n_docs - df[term] + 0.5) / (df[term] + 0.5))
+            norm = tf + BM25_K1 * (1 - BM25_B + BM25_B * doc_len / avgdl) if avgdl else tf + BM25_K1
+            scores[(rid, seg_index)] += idf * tf * (BM25_K1 + 1) / norm
+
+        # 同分按录音顺序、片段顺序，结果确定
+        order = {rid: i for i, rid in enumerate(recording_ids)}
+        ranked = sorted(scores.items(), key=lambda kv: (-kv[1], order.get(kv[0][0], 0), kv[0][1]))[:top_k]
+        return ranked, len(scores)
+
+    def expand(
+        self,
+        recording_ids: Sequence[str],
+        keys: Iterable[Tuple[str, int]],
+        neighbors: int = 1,
+    ) -> List[TranscriptSegment]:
+        """取命中片段及前后各 neighbors 个相邻片段，按 recording_ids 顺序、segment_index 升序排列。"""
+        wanted: Dict[str, set] = defaultdict(set)
+        for rid, seg_index in keys:
+            wanted[rid].update(range(seg_index - neighbors, seg_index + neighbors + 1))
+        order = {rid: i for i, rid in enumerate(recording_ids)}
+        segments = self._load(wanted)
+        segments.sort(key=lambda s: (order.get(s.recording_id, 0), s.segment_index))
+        return segments
+
+    def _load(self, wanted: Dict[str, Iterable[int]]) -> List[TranscriptSegment]:
+        conditions = [
+            and_(TranscriptSegment.recording_id == rid, TranscriptSegment.segment_index.in_(sorted(idx)))
+            for rid, idx in wanted.items()
+        ]
+        if not conditions:
+            return []
+        return self.db.query(TranscriptSegment).filter(or_(*conditions)).all()
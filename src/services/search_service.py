@@ -0,0 +1,135 @@
+"""
+跨录音的转写全文搜索：基于 transcript_fts（见 src/db/fts.py），按设备、录音开始时间过滤，分页返回命中片段与高亮摘要。
+"""
+import html
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from src.db.fts import FTS_TABLE, to_match_query
+
+
+MAX_PAGE_SIZE = 100
+# 命中数只数到这里为止：高频词（“就是”）的精确总数要把全部命中与录音表逐条关联，前端展示 “1000+” 即可
+MAX_COUNT = 1000
+SNIPPET_CHARS = 64
+MARK_OPEN = "<mark>"
+MARK_CLOSE = "</mark>"
+
+
+def _term_pattern(query: str) -> Optional["re.Pattern[str]"]:
+    terms = sorted({t.replace('"', "") for t in query.split()} - {""}, key=len, reverse=True)
+    if not terms:
+        return None
+    return re.compile("|".join(re.escape(t) for t in terms), re.IGNORECASE)
+
+
+def make_snippet(value: str, pattern: Optional["re.Pattern[str]"], width: int = SNIPPET_CHARS) -> str:
+    """以第一个命中为中心截取约 width 个字符，命中处包 <mark>，其余内容做 HTML 转义。"""
+    spans: List[Tuple[int, int]] = [m.span() for m in pattern.finditer(value)] if pattern else []
+    if spans:
+        center = (spans[0][0] + spans[0][1]) // 2
+        start = max(0, min(center - width // 2, len(value) - width))
+    else:
+        start = 0
+    end = min(len(value), start + width)
+
+    parts = ["…" if start > 0 else ""]
+    pos = start
+    for s, e in spans:
+        if e <= start or s >= end:
+            continue
+        s, e = max(s, start), min(e, end)
+        parts.append(html.escape(value[pos:s]))
+        parts.append(MARK_OPEN + html.escape(value[s:e]) + MARK_CLOSE)
+        pos = e
+    parts.append(html.escape(value[pos:end]))
+    parts.append("…" if end < len(value) else "")
+    return "".join(parts)
+
+
+class TranscriptSearchService:
+    def __init__(self, db: Session) -> None:
+        self.db = db
+
+    def search(
+        self,
+        query: str,
+        device_id: str,
+        start_from: Optional[int] = None,
+        start_to: Optional[int] = None,
+        page: int = 1,
+        page_size: int = 20,
+        order: str = "time",
+    ) -> Dict[str, Any]:
+        """
+        在 device_id 的录音范围内搜索（数据隔离，不提供跨设备搜索）。
+        query 按空白拆词，所有词都须出现（中文为连续子串）；start_from / start_to 为录音开始时间（Unix 秒，左闭右开）。
+        order=time 按录音开始时间倒序、片段顺序；order=relevance 按 bm25。
+        """
+        page = max(1, page)
+        page_size = max(1, min(page_size, MAX_PAGE_SIZE))
+        match = to_match_query(query)
+        result: Dict[str, Any] = {
+            "query": query,
+            "page": page,
+            "page_size": page_size,
+            "total": 0,
+            "total_capped": False,
+            "items": [],
+        }
+        if not match:
+            return result
+
+        where = [f"{FTS_TABLE} MATCH :match", "r.device_id = :device_id"]
+        params: Dict[str, Any] = {"match": match, "device_id": device_id}
+        if start_from is not None:
+            where.append("r.start_at >= :start_from")
+            params["start_from"] = start_from
+        if start_to is not None:
+            where.append("r.start_at < :start_to")
+            params["start_to"] = start_to
+
+        joins = (
+            f"FROM {FTS_TABLE} f "
+            "JOIN transcript_segments s ON s.id = f.rowid "
+            "JOIN recording_meta r ON r.recording_id = s.recording_id "
+            "WHERE " + " AND ".join(where)
+        )
+        if order == "relevance":
+            order_by = f"bm25({FTS_TABLE}), r.start_at DESC, s.segment_index ASC"
+        else:
+            order_by = "r.start_at DESC, s.recording_id, s.segment_index ASC"
+
+        total = self.db.execute(
+            text(f"SELECT count(*) FROM (SELECT 1 {joins} LIMIT :cap)"), {**params, "cap": MAX_COUNT + 1}
+        ).scalar() or 0
+        result["total"] = min(total, MAX_COUNT)
+        result["total_capped"] = total > MAX_COUNT
+        if not result["total"]:
+            return result
+
+        rows = self.db.execute(
+            text(
+                "SELECT s.recording_id, s.segment_index, s.start_ms, s.end_ms, s.text, r.device_id, r.start_at "
+                f"{joins} ORDER BY {order_by} LIMIT :limit OFFSET :offset"
+            ),
+            {**params, "limit": page_size, "offset": (page - 1) * page_size},
+        ).all()
+
+        pattern = _term_pattern(query)
+        result["items"] = [
+            {
+                "recording_id": row.recording_id,
+                "segment_index": row.segment_index,
+                "start_ms": row.start_ms,
+                "end_ms": row.end_ms,
+                "device_id": row.device_id,
+                "recording_start_at": row.start_at,
+                "snippet": make_snippet(row.text, pattern),
+            }
+            for row in rows
+        ]
+        return result
@@ -0,0 +1,208 @@
+"""
+转写片段的向量召回：补足 BM25 抓不到的同义表达（如“我跟谁吵架了”）。
+
+- 写入：TranscriptService.replace_segments 落库后调用 schedule_embedding，在后台线程按 batch_size 分批向量化，
+  向量追加到 EmbeddingStore，片段 → 行号记在 segment_embeddings；片段文本未变（text_hash 相同）时不重复向量化
+- 查询：只取所选录音对应的行做点积 top-k，耗时与常驻内存取决于所选录音的片段数，而非全部语料；
+  查询时不在请求内向量化，尚未建好向量的录音排入后台任务，本次只用已有的向量
+"""
+import hashlib
+import logging
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from src.config import get_settings
+from src.db.models import SegmentEmbedding, TranscriptSegment
+from src.db.session import SessionLocal
+from src.services.embedding_service import Embedder, get_embedder
+from src.services.embedding_store import EmbeddingStore
+
+
+logger = logging.getLogger(__name__)
+
+_stores: Dict[str, EmbeddingStore] = {}
+_stores_lock = threading.Lock()
+_executor: Optional[ThreadPoolExecutor] = None
+# 已排队、尚未开始执行的录音，避免每次问答重复排队
+_scheduled: Set[str] = set()
+_scheduled_lock = threading.Lock()
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()[:16]
+
+
+def get_embedding_store(embedder: Embedder) -> EmbeddingStore:
+    with _stores_lock:
+        store = _stores.get(embedder.space)
+        if store is None:
+            folder = re.sub(r"[^A-Za-z0-9._-]+", "_", embedder.space)
+            store = EmbeddingStore(str(Path(get_settings().embedding.store_dir) / folder), embedder.dim)
+            _stores[embedder.space] = store
+        return store
+
+
+class SegmentEmbeddingIndex:
+    def __init__(
+        self,
+        db: Session,
+        embedder: Optional[Embedder] = None,
+        store: Optional[EmbeddingStore] = None,
+    ) -> None:
+        self.db = db
+        self.embedder = embedder or get_embedder()
+        self.store = store or get_embedding_store(self.embedder)
+
+    def ensure_indexed(self, recording_ids: Sequence[str]) -> int:
+        """为这些录音中尚未向量化或文本已变的片段补建向量，清理已删除片段的行号；返回新向量化的片段数。"""
+        space = self.embedder.space
+        live = (
+            self.db.query(TranscriptSegment.id, TranscriptSegment.recording_id, TranscriptSegment.text)
+            .filter(TranscriptSegment.recording_id.in_(recording_ids))
+            .order_by(TranscriptSegment.recording_id, TranscriptSegment.segment_index)
+            .all()
+        )
+        existing = {
+            e.segment_id: e
+            for e in self.db.query(SegmentEmbedding)
+            .filter(SegmentEmbedding.space == space, SegmentEmbedding.recording_id.in_(recording_ids))
+            .all()
+        }
+        live_ids = {seg_id for seg_id, _, _ in live}
+        stale = [e.id for seg_id, e in existing.items() if seg_id not in live_ids]
+        if stale:
+            self.db.query(SegmentEmbedding).filter(SegmentEmbedding.id.in_(stale)).delete(synchronize_session=False)
+            self.db.commit()
+
+        todo = []
+        for seg_id, rid, text in live:
+            digest = text_hash(text)
+            entry = existing.get(seg_id)
+            if entry is None or entry.text_hash != digest:
+                todo.append((seg_id, rid, text, digest))
+
+        size = max(1, self.embedder.batch_size)
+        for i in range(0, len(todo), size):
+            batch = todo[i : i + size]
+            vectors = self.embedder.embed([text for _, _, text, _ in batch])
+            start = self.store.append([seg_id for seg_id, _, _, _ in batch], vectors)
+            self._save_batch(space, batch, start, existing)
+        return len(todo)
+
+    def _save_batch(self, space: str, batch: List[tuple], start: int, existing: Dict[int, SegmentEmbedding]) -> None:
+        """
+        按批提交行号，中途失败时已完成的批次不必重做。
+        另一个请求或后台任务可能同时为同一片段建了行（唯一约束冲突）：回滚后重读这些行，改为更新。
+        """
+        for attempt in range(2):
+            for offset, (seg_id, rid, _, digest) in enumerate(batch):
+                entry = existing.get(seg_id)
+                if entry is None:
+                    entry = SegmentEmbedding(space=space, segment_id=seg_id, recording_id=rid)
+                    self.db.add(entry)
+                entry.row = start + offset
+                entry.text_hash = digest
+            try:
+                self.db.commit()
+                return
+            except IntegrityError:
+                self.db.rollback()
+                if attempt:
+                    raise
+            for e in (
+                self.db.query(SegmentEmbedding)
+                .filter(
+                    SegmentEmbedding.space == space,
+                    SegmentEmbedding.segment_id.in_([seg_id for seg_id, _, _, _ in batch]),
+                )
+                .all()
+            ):
+                existing[e.segment_id] = e
+
+    def missing_recordings(self, recording_ids: Sequence[str]) -> List[str]:
+        """片段数多于已有向量数的录音：从未向量化，或后台向量化尚未完成。"""
+        live = dict(
+            self.db.query(TranscriptSegment.recording_id, func.count(TranscriptSegment.id))
+            .filter(TranscriptSegment.recording_id.in_(recording_ids))
+            .group_by(TranscriptSegment.recording_id)
+            .all()
+        )
+        indexed = dict(
+            self.db.query(SegmentEmbedding.recording_id, func.count(SegmentEmbedding.id))
+            .filter(SegmentEmbedding.space == self.embedder.space, SegmentEmbedding.recording_id.in_(recording_ids))
+            .group_by(SegmentEmbedding.recording_id)
+            .all()
+        )
+        return [rid for rid, count in live.items() if indexed.get(rid, 0) < count]
+
+    def rank(
+        self,
+        recording_ids: Sequence[str],
+        question: str,
+        top_k: int = 20,
+        min_score: float = 0.0,
+    ) -> List[Tuple[Tuple[str, int], float]]:
+        """
+        返回 [((recording_id, segment_index), 余弦相似度)]，按相似度降序，低于 min_score 的不返回。
+        只对已有向量打分；缺向量的录音交给后台补建（大量旧转写逐批调用向量服务不能放在请求里）。
+        """
+        if not recording_ids or not question.strip():
+            return []
+        for recording_id in self.missing_recordings(recording_ids):
+            schedule_embedding(recording_id)
+        rows = (
+            self.db.query(
+                SegmentEmbedding.row,
+                SegmentEmbedding.segment_id,
+                TranscriptSegment.recording_id,
+                TranscriptSegment.segment_index,
+            )
+            .join(TranscriptSegment, TranscriptSegment.id == SegmentEmbedding.segment_id)
+            .filter(SegmentEmbedding.space == self.embedder.space, SegmentEmbedding.recording_id.in_(recording_ids))
+            .all()
+        )
+        if not rows:
+            return []
+        keys = {seg_id: (rid, seg_index) for _, seg_id, rid, seg_index in rows}
+        query = self.embedder.embed([question])[0]
+        seg_ids, scores = self.store.top_k(query, top_k, rows=[row for row, _, _, _ in rows])
+        return [
+            (keys[int(seg_id)], float(score))
+            for seg_id, score in zip(seg_ids, scores)
+            if score >= min_score and int(seg_id) in keys
+        ]
+
+
+def _index_in_new_session(recording_id: str) -> None:
+    # 开始前出队：执行期间新写入的转写会重新排队，不会被这一轮漏掉
+    with _scheduled_lock:
+        _scheduled.discard(recording_id)
+    db = SessionLocal()
+    try:
+        SegmentEmbeddingIndex(db).ensure_indexed([recording_id])
+    except Exception:
+        # 向量化失败不影响转写；之后的问答发现缺向量时会重新排队
+        logger.exception("embedding recording %s failed", recording_id)
+    finally:
+        db.close()
+
+
+def schedule_embedding(recording_id: str) -> None:
+    """转写落库后在后台向量化，不阻塞转写流程；单线程执行，避免与写转写争抢 SQLite 写锁。"""
+    global _executor
+    if not get_settings().qa.semantic_enabled:
+        return
+    with _scheduled_lock:
+        if recording_id in _scheduled:
+            return
+        _scheduled.add(recording_id)
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="embedding")
+    _executor.submit(_index_in_new_session, recording_id)
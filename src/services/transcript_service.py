@@ -1,36 +1,139 @@
-from typing import Any, Dict, List, Optional
+from dataclasses import dataclass
+from itertools import chain
+from typing import Any, Dict, Iterable, List, Optional, Tuple
 
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
 from src.db.models import TranscriptSegment
+from src.services.retrieval_service import TranscriptIndexWriter
+from src.services.semantic_retrieval_service import schedule_embedding
+
+
+_WRITE_BATCH = 500
+
+# 参与比较的列：全部相同视为未变化
+_COMPARED = ("start_ms", "end_ms", "text", "confidence", "asr_model")
+
+
+@dataclass
+class SegmentDiff:
+    inserted: int = 0
+    updated: int = 0
+    deleted: int = 0
+    unchanged: int = 0
 
 
 class TranscriptService:
     def __init__(self, db: Session) -> None:
         self.db = db
+        # 最近一次 replace_segments 的增删改统计
+        self.last_diff = SegmentDiff()
 
     def replace_segments(
         self,
         recording_id: str,
-        segments: List[Dict[str, Any]],
+        segments: Iterable[Dict[str, Any]],
         asr_model: Optional[str] = None,
-    ) -> None:
-        self.db.query(TranscriptSegment).filter(TranscriptSegment.recording_id == recording_id).delete()
-        self.db.commit()
-
-        for i, seg in enumerate(segments):
-            item = TranscriptSegment(
-                recording_id=recording_id,
-                segment_index=int(seg.get("segment_index", i)),
-                start_ms=int(seg.get("start_ms", 0)),
-                end_ms=int(seg.get("end_ms", 0)),
-                text=str(seg.get("text", "")),
-                confidence=str(seg.get("confidence")) if seg.get("confidence") is not None else None,
-                asr_model=asr_model,
+    ) -> int:
+        """
+        用新的转写片段替换该录音的全部片段，返回新转写的片段数。
+        按 segment_index 与已有片段比对，只写入有变化的行：新增与修改分别按批 executemany，多余的按 id 删除；
+        整个替换在一个事务内完成，失败回滚后旧转写原样保留，读者也不会看到“没有转写”的中间状态。
+        segments 可为生成器（如 ASRService.iter_segments），按批写入，内存只随旧片段数增长；为空时不改动已有转写。
+        BM25 倒排按同一差异增量更新，FTS 由触发器同步，向量在提交后后台补建。
+        """
+        seg_iter = iter(segments)
+        first = next(seg_iter, None)
+        if first is None:
+            return 0
+
+        index = TranscriptIndexWriter(self.db, recording_id)
+        diff = SegmentDiff()
+        old: Dict[int, Tuple[Any, ...]] = {}
+        stale_ids: List[int] = []
+        for row in (
+            self.db.query(
+                TranscriptSegment.id,
+                TranscriptSegment.segment_index,
+                *[getattr(TranscriptSegment, c) for c in _COMPARED],
             )
-            self.db.add(item)
+            .filter(TranscriptSegment.recording_id == recording_id)
+            .order_by(TranscriptSegment.id.asc())
+        ):
+            if row.segment_index in old:
+                # 历史上重复写入的同号片段
+                stale_ids.append(row.id)
+            else:
+                old[row.segment_index] = tuple(row)
+
+        inserts: List[Dict[str, Any]] = []
+        updates: List[Dict[str, Any]] = []
+        seen = set()
+        count = 0
+        try:
+            # 旧数据中有重复片段号时倒排无法按号增量维护，直接重建
+            indexed = index.exists() and not stale_ids
+
+            def flush() -> None:
+                if inserts:
+                    self.db.execute(insert(TranscriptSegment), inserts)
+                    inserts.clear()
+                if updates:
+                    self.db.execute(update(TranscriptSegment), updates)
+                    updates.clear()
+
+            for i, seg in enumerate(chain([first], seg_iter)):
+                values = {
+                    "segment_index": int(seg.get("segment_index", i)),
+                    "start_ms": int(seg.get("start_ms", 0)),
+                    "end_ms": int(seg.get("end_ms", 0)),
+                    "text": str(seg.get("text", "")),
+                    "confidence": str(seg.get("confidence")) if seg.get("confidence") is not None else None,
+                    "asr_model": asr_model,
+                }
+                seg_index = values["segment_index"]
+                count += 1
+                prev = old.get(seg_index) if seg_index not in seen else None
+                seen.add(seg_index)
+                if prev is not None:
+                    if prev[2:] == tuple(values[c] for c in _COMPARED):
+                        diff.unchanged += 1
+                        continue
+                    updates.append({"id": prev[0], **values})
+                    diff.updated += 1
+                    if indexed and prev[2 + _COMPARED.index("text")] != values["text"]:
+                        index.remove([seg_index])
+                        index.add(seg_index, values["text"])
+                else:
+                    inserts.append({"recording_id": recording_id, **values})
+                    diff.inserted += 1
+                    if indexed:
+                        index.add(seg_index, values["text"])
+                if len(inserts) + len(updates) >= _WRITE_BATCH:
+                    flush()
+            flush()
+
+            stale_ids.extend(prev[0] for seg_index, prev in old.items() if seg_index not in seen)
+            for j in range(0, len(stale_ids), _WRITE_BATCH):
+                batch = stale_ids[j : j + _WRITE_BATCH]
+                self.db.execute(delete(TranscriptSegment).where(TranscriptSegment.id.in_(batch)))
+            diff.deleted = len(stale_ids)
+            if indexed:
+                index.remove(seg_index for seg_index in old if seg_index not in seen)
+                index.finish()
+            else:
+                index.rebuild()
+            self.db.commit()
+        except Exception:
+            self.db.rollback()
+            raise
 
-        self.db.commit()
+        self.last_diff = diff
+        if diff.inserted or diff.updated:
+            schedule_embedding(recording_id)
+        return count
 
     def list_segments(self, recording_id: str) -> List[TranscriptSegment]:
         return (
@@ -41,3 +144,35 @@ class TranscriptService:
         )
 
 
+class AsyncTranscriptService:
+    """TranscriptService 的异步版本。"""
+
+    def __init__(self, db: AsyncSession) -> None:
+        self.db = db
+        self.last_diff = SegmentDiff()
+
+    async def replace_segments(
+        self,
+        recording_id: str,
+        segments: Iterable[Dict[str, Any]],
+        asr_model: Optional[str] = None,
+    ) -> int:
+        """
+        见 TranscriptService.replace_segments。差异比对与倒排维护逻辑较多，这里通过 run_sync 复用同步实现：
+        语句经异步驱动执行，不占线程池；分词等 CPU 工作仍在事件循环上，大段转写宜放到后台任务里调用。
+        """
+
+        def run(session: Session) -> Tuple[int, SegmentDiff]:
+            service = TranscriptService(session)
+            return service.replace_segments(recording_id, segments, asr_model), service.last_diff
+
+        count, self.last_diff = await self.db.run_sync(run)
+        return count
+
+    async def list_segments(self, recording_id: str) -> List[TranscriptSegment]:
+        result = await self.db.execute(
+            select(TranscriptSegment)
+            .where(TranscriptSegment.recording_id == recording_id)
+            .order_by(TranscriptSegment.segment_index.asc())
+        )
+        return list(result.scalars().all())
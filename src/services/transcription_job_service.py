@@ -0,0 +1,403 @@
+"""
+转写编排与落库：单条转写（缓存 / 分段 / 整文件）、批量打包转写（提交后由轮询回调落库）、DashScope 回调与兜底轮询。
+
+回调模式：
+- start 时生成带签名和过期时间的 callback_url（recording_id + expires_at + HMAC），
+  创建任务后把 task_id 登记到该录音名下，DashScope 任务完成后 POST 到该地址；
+- 回调只取 body 中的 task_id，必须是登记在该录音名下的任务；结果由服务端用 fetch_task 重新查询，
+  不信任 body 里的 sentences / transcription_url；
+- 同时以很低的频率登记兜底轮询，仅在回调丢失时才会真正落库。
+"""
+import asyncio
+import hashlib
+import hmac
+import logging
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlencode
+
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+
+from src.config import get_settings
+from src.db.session import SessionLocal
+from src.db.models import ASRCallbackTask, RecordingMeta
+from src.services.asr_cache_service import ASRCacheService, content_hash_for_etag
+from src.services.asr_poller import get_asr_poller
+from src.services.asr_service import get_asr_service
+from src.services.chunked_asr_service import get_chunked_asr_service
+from src.services.oss_service import get_oss_service
+from src.services.recording_service import RecordingService
+from src.services.transcript_service import TranscriptService
+
+
+logger = logging.getLogger(__name__)
+
+CALLBACK_PATH = "/v1/transcribe/callback"
+
+
+def _callback_secret() -> bytes:
+    settings = get_settings()
+    return (settings.dashscope.asr_callback_secret or settings.auth.jwt_secret).encode("utf-8")
+
+
+def _safety_net_wait_seconds(audio_seconds: Optional[int]) -> int:
+    return int(max(7200, (audio_seconds or 0) * 3))
+
+
+def sign_callback(recording_id: str, expires_at: int) -> str:
+    message = f"{recording_id}\n{expires_at}".encode("utf-8")
+    return hmac.new(_callback_secret(), message, hashlib.sha256).hexdigest()
+
+
+def verify_callback_signature(recording_id: str, expires_at: int, sig: str) -> bool:
+    if expires_at < time.time():
+        return False
+    return hmac.compare_digest(sign_callback(recording_id, expires_at), sig or "")
+
+
+def build_callback_url(recording_id: str, audio_seconds: Optional[int] = None) -> str:
+    """回调地址在兜底轮询放弃之后再过一小时失效。"""
+    base = get_settings().app.public_base_url.rstrip("/")
+    expires_at = int(time.time()) + _safety_net_wait_seconds(audio_seconds) + 3600
+    query = urlencode(
+        {"recording_id": recording_id, "exp": expires_at, "sig": sign_callback(recording_id, expires_at)}
+    )
+    return f"{base}{CALLBACK_PATH}?{query}"
+
+
+def register_callback_task(db: Session, task_id: str, recording_id: str) -> None:
+    db.add(ASRCallbackTask(task_id=task_id, recording_id=recording_id))
+    db.commit()
+
+
+def is_callback_task(db: Session, recording_id: str, task_id: str) -> bool:
+    return (
+        db.query(ASRCallbackTask.id)
+        .filter(ASRCallbackTask.task_id == task_id, ASRCallbackTask.recording_id == recording_id)
+        .first()
+        is not None
+    )
+
+
+def apply_transcription_output(
+    db: Session, recording_id: str, output: Dict[str, Any], result_index: int = 0
+) -> Optional[int]:
+    """
+    按任务输出更新录音：SUCCEEDED 写入转写并进入 analyzing，FAILED 记为 failed。
+    先用条件 UPDATE 把录音从 transcribing 认领为 saving（短暂的中间状态），回调与兜底轮询同时到达时只有一方能写入；
+    未认领到（录音已不在 transcribing）或任务尚未结束时不做处理，返回 None；否则返回写入的片段数。
+    批量任务用 result_index 指定该录音在 results[] 中的下标。
+    """
+    task_status = output.get("task_status")
+    if task_status not in ("SUCCEEDED", "FAILED"):
+        return None
+    claimed = db.execute(
+        update(RecordingMeta)
+        .where(RecordingMeta.recording_id == recording_id, RecordingMeta.status == "transcribing")
+        .values(status="saving")
+    )
+    db.commit()
+    if claimed.rowcount != 1:
+        return None
+    rec = RecordingService(db).get_recording(recording_id)
+
+    if task_status == "FAILED":
+        rec.status = "failed"
+        rec.error_code = "ASR_ERROR"
+        rec.error_message = f"ASR task failed: {output.get('message', 'unknown error')}"[:256]
+        db.commit()
+        return 0
+
+    asr = get_asr_service()
+    try:
+        saved = TranscriptService(db).replace_segments(
+            recording_id, asr.iter_segments(output, result_index), asr_model=asr.settings.asr_model
+        )
+    except RuntimeError as e:
+        rec.status = "failed"
+        rec.error_code = "ASR_PARSE_ERROR"
+        rec.error_message = str(e)[:256]
+        db.commit()
+        return 0
+    except BaseException:
+        # 意外错误：退回 transcribing，留给另一方（回调 / 兜底轮询）或重试
+        db.rollback()
+        rec.status = "transcribing"
+        db.commit()
+        raise
+    if not saved:
+        rec.status = "failed"
+        rec.error_code = "ASR_EMPTY"
+        rec.error_message = "ASR returned empty segments"
+        db.commit()
+        return 0
+
+    rec.status = "analyzing"
+    db.commit()
+    return saved
+
+
+def watch_task_as_safety_net(task_id: str, recording_id: str, audio_seconds: Optional[int] = None) -> None:
+    """回调模式下登记低频兜底轮询：回调先到则取消，回调丢失则由轮询结果落库。"""
+    interval = get_settings().dashscope.asr_callback_safety_poll_seconds
+    future = get_asr_poller().submit(
+        task_id,
+        audio_seconds=audio_seconds,
+        max_wait_seconds=_safety_net_wait_seconds(audio_seconds),
+        min_interval=interval,
+        max_interval=interval,
+    )
+
+    def _on_done(fut) -> None:
+        if fut.cancelled():
+            return
+        err = fut.exception()
+        output: Dict[str, Any]
+        if err is None:
+            output = fut.result()
+        elif isinstance(err, RuntimeError):
+            output = {"task_status": "FAILED", "message": str(err)}
+        else:
+            # 兜底轮询超时：不改状态，留待回调或人工重试
+            return
+        # 下载并解析结果可能较慢，不占用轮询线程
+        threading.Thread(target=_apply_in_new_session, args=(recording_id, output), daemon=True).start()
+
+    future.add_done_callback(_on_done)
+
+
+def _apply_in_new_session(recording_id: str, output: Dict[str, Any]) -> None:
+    db = SessionLocal()
+    try:
+        apply_transcription_output(db, recording_id, output)
+    finally:
+        db.close()
+
+
+async def _content_hash(rec: RecordingMeta) -> Optional[str]:
+    """按 OSS ETag（一次 HEAD 请求）得到内容哈希；未开启缓存或请求失败时返回 None。"""
+    if not get_settings().dashscope.asr_cache_enabled:
+        return None
+    try:
+        return content_hash_for_etag(await asyncio.to_thread(get_oss_service().get_etag, rec.oss_file_path))
+    except Exception:
+        return None
+
+
+async def _load_cached(db: Session, rec: RecordingMeta, content_hash: Optional[str], asr_model: str) -> Optional[int]:
+    """按内容哈希查转写缓存；命中则直接落库并返回写入片段数。"""
+    if not content_hash:
+        return None
+    cached = await asyncio.to_thread(ASRCacheService(db).get, content_hash, asr_model)
+    if not cached:
+        return None
+    return await asyncio.to_thread(TranscriptService(db).replace_segments, rec.recording_id, cached, asr_model)
+
+
+async def _lookup_cache(
+    db: Session, rec: RecordingMeta, asr_model: str
+) -> Tuple[Optional[int], Optional[str]]:
+    """按 OSS ETag 查转写缓存；命中则直接落库。返回 (命中时写入片段数, content_hash)。"""
+    content_hash = await _content_hash(rec)
+    return await _load_cached(db, rec, content_hash, asr_model), content_hash
+
+
+def _store_in_cache(db: Session, recording_id: str, content_hash: Optional[str], asr_model: str) -> None:
+    if not content_hash:
+        return
+    stored = TranscriptService(db).list_segments(recording_id)
+    ASRCacheService(db).put(
+        content_hash,
+        asr_model,
+        (
+            {
+                "segment_index": s.segment_index,
+                "start_ms": s.start_ms,
+                "end_ms": s.end_ms,
+                "text": s.text,
+                "confidence": s.confidence,
+            }
+            for s in stored
+        ),
+    )
+
+
+async def _fill_cache(db: Session, recording_id: str, content_hash: Optional[str], asr_model: str) -> None:
+    await asyncio.to_thread(_store_in_cache, db, recording_id, content_hash, asr_model)
+
+
+async def transcribe_and_save(db: Session, rec: RecordingMeta, max_wait_seconds: int = 600) -> Tuple[int, bool]:
+    """
+    转写一条录音并写入 transcript_segments，返回 (写入片段数, 是否命中缓存)。
+    顺序：内容哈希缓存 → 长 WAV 分段并行转写 → 整文件转写；成功后回填缓存。
+    失败抛出 TimeoutError / RuntimeError，由调用方记录到录音状态。
+    """
+    asr = get_asr_service()
+    oss = get_oss_service()
+    asr_model = asr.settings.asr_model
+
+    cached_saved, content_hash = await _lookup_cache(db, rec, asr_model)
+    if cached_saved:
+        return cached_saved, True
+
+    chunked = get_chunked_asr_service()
+    audio_seconds = rec.end_at - rec.start_at
+    segments = None
+    if chunked.should_chunk(rec.oss_file_path, audio_seconds):
+        # 长音频：切段并行转写，拼回后统一落库
+        segments = await chunked.transcribe(rec.recording_id, rec.oss_file_path, max_wait_seconds=max_wait_seconds)
+    if segments is None:
+        download_url = oss.sign_url_for_key("GET", rec.oss_file_path, 3600)
+        task_id = await asyncio.to_thread(asr.create_transcription_task, [download_url])
+        output = await asr.await_output(task_id, max_wait_seconds=max_wait_seconds, audio_seconds=audio_seconds)
+        segments = asr.iter_segments(output)
+    # 流式解析结果并边解析边落库
+    transcript_service = TranscriptService(db)
+    saved = await asyncio.to_thread(transcript_service.replace_segments, rec.recording_id, segments, asr_model)
+
+    if saved:
+        await _fill_cache(db, rec.recording_id, content_hash, asr_model)
+    return saved, False
+
+
+def _mark_failed(rec: RecordingMeta, code: str, message: str) -> None:
+    rec.status = "failed"
+    rec.error_code = code
+    rec.error_message = message[:256]
+    rec.retry_count = (rec.retry_count or 0) + 1
+
+
+def _fail_if_transcribing(db: Session, recording_id: str, code: str, message: str) -> None:
+    """条件 UPDATE：录音仍在 transcribing 时才记为失败，不覆盖已由其他路径写入的结果。"""
+    db.execute(
+        update(RecordingMeta)
+        .where(RecordingMeta.recording_id == recording_id, RecordingMeta.status == "transcribing")
+        .values(
+            status="failed",
+            error_code=code,
+            error_message=message[:256],
+            retry_count=RecordingMeta.retry_count + 1,
+        )
+    )
+    db.commit()
+
+
+def _apply_batch_in_new_session(
+    members: List[Tuple[str, str, Optional[str]]],
+    output: Optional[Dict[str, Any]],
+    error: Optional[BaseException],
+) -> None:
+    """批量任务结束后按 file_url 拆分结果并逐条落库；members 为 (recording_id, file_url, content_hash)。"""
+    asr = get_asr_service()
+    asr_model = asr.settings.asr_model
+    db = SessionLocal()
+    try:
+        if output is None:
+            for rid, _, _ in members:
+                _fail_if_transcribing(db, rid, "ASR_ERROR", f"ASR wait failed: {error}")
+            return
+        if output.get("task_status") == "FAILED":
+            indexes: List[Optional[int]] = [0] * len(members)
+        else:
+            indexes = asr.match_results(output, [url for _, url, _ in members])
+        for (rid, _, content_hash), result_index in zip(members, indexes):
+            if result_index is None:
+                _fail_if_transcribing(db, rid, "ASR_EMPTY", "No result for file in batch task")
+                continue
+            try:
+                saved = apply_transcription_output(db, rid, output, result_index=result_index)
+                if saved:
+                    _store_in_cache(db, rid, content_hash, asr_model)
+            except Exception:
+                # 单条落库出错不影响同一任务里的其他录音；该条已退回 transcribing，可重试
+                logger.exception("saving batch result for recording %s failed", rid)
+    finally:
+        db.close()
+
+
+def watch_batch_task(
+    task_id: str,
+    members: List[Tuple[str, str, Optional[str]]],
+    audio_seconds: Optional[int] = None,
+    max_wait_seconds: int = 3600,
+) -> None:
+    """登记批量任务到集中轮询器，任务结束后在后台线程里拆分结果并落库。"""
+    future = get_asr_poller().submit(task_id, audio_seconds=audio_seconds, max_wait_seconds=max_wait_seconds)
+
+    def _on_done(fut) -> None:
+        if fut.cancelled():
+            return
+        err = fut.exception()
+        output: Optional[Dict[str, Any]] = None
+        if err is None:
+            output = fut.result()
+        elif isinstance(err, RuntimeError):
+            output = {"task_status": "FAILED", "message": str(err)}
+        # 下载并解析结果可能较慢，不占用轮询线程
+        threading.Thread(target=_apply_batch_in_new_session, args=(members, output, err), daemon=True).start()
+
+    future.add_done_callback(_on_done)
+
+
+async def submit_transcription_batch(
+    db: Session,
+    recs: List[RecordingMeta],
+    max_wait_seconds: int = 3600,
+) -> List[Dict[str, Any]]:
+    """
+    批量转写：把多条录音打包进同一个 DashScope 任务（每个任务最多 asr_batch_max_files 个文件），
+    创建任务后立即返回；任务结束时由集中轮询器的回调按 file_url 把 results[] 拆回各自的 recording_id 并落库。
+    批量模式不做本地 VAD / 切段，适合夜间积压的普通时长录音。返回每条录音的提交结果（缓存命中的已直接落库）。
+    """
+    asr = get_asr_service()
+    oss = get_oss_service()
+    asr_model = asr.settings.asr_model
+    report: Dict[str, Dict[str, Any]] = {}
+
+    # 1) 并发取 ETag 算内容哈希；查缓存与写库共用同一个 Session，仍顺序执行
+    hashes = await asyncio.gather(*(_content_hash(rec) for rec in recs))
+    pending: List[Tuple[RecordingMeta, Optional[str]]] = []
+    for rec, content_hash in zip(recs, hashes):
+        cached_saved = await _load_cached(db, rec, content_hash, asr_model)
+        if cached_saved:
+            rec.status = "analyzing"
+            report[rec.recording_id] = {"segments_saved": cached_saved, "asr_cache_hit": True}
+        else:
+            pending.append((rec, content_hash))
+    db.commit()
+
+    size = max(1, asr.settings.asr_batch_max_files)
+    batches = [pending[i : i + size] for i in range(0, len(pending), size)]
+    url_expire = max_wait_seconds + 3600
+    batch_urls = [[oss.sign_url_for_key("GET", rec.oss_file_path, url_expire) for rec, _ in b] for b in batches]
+
+    # 2) 并发创建任务
+    created = await asyncio.gather(
+        *[asyncio.to_thread(asr.create_transcription_task, urls) for urls in batch_urls],
+        return_exceptions=True,
+    )
+    watches = []
+    for batch, urls, task_id in zip(batches, batch_urls, created):
+        for rec, _ in batch:
+            if isinstance(task_id, BaseException):
+                _mark_failed(rec, "ASR_ERROR", f"ASR batch submit failed: {task_id}")
+                report[rec.recording_id] = {"error": str(task_id)}
+            else:
+                rec.status = "transcribing"
+                report[rec.recording_id] = {"task_id": task_id}
+        if not isinstance(task_id, BaseException):
+            members = [(rec.recording_id, url, content_hash) for (rec, content_hash), url in zip(batch, urls)]
+            audio_seconds = max((rec.end_at - rec.start_at) for rec, _ in batch)
+            watches.append((task_id, members, audio_seconds))
+    db.commit()
+
+    # 3) 状态已提交为 transcribing 后再登记轮询，回调里的条件 UPDATE 才能认领到录音
+    for task_id, members, audio_seconds in watches:
+        watch_batch_task(task_id, members, audio_seconds=audio_seconds, max_wait_seconds=max_wait_seconds)
+
+    return [
+        {"recording_id": rec.recording_id, "status": rec.status, **report.get(rec.recording_id, {})}
+        for rec in recs
+    ]
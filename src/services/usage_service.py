@@ -1,12 +1,25 @@
-"""游客与注册用户用量：剩余次数、扣减。"""
+"""
+游客与注册用户用量：剩余次数、预留 / 确认 / 退回、充值。
+每次运行先 reserve（一条带条件的 UPDATE 原子预扣），成功后 commit_reservation，失败或中断 release_reservation；
+每一步都在同一事务内追加一条 usage_ledger 流水。
+"""
+import logging
 from dataclasses import dataclass
-from typing import Literal, Optional
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Literal, Optional
 from uuid import uuid4
 
-from sqlalchemy.orm import Session
+from sqlalchemy import and_, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, aliased
 
 from src.config import get_settings
-from src.db.models import User, GuestUsage
+from src.db.models import User, GuestUsage, UsageLedgerEntry
+from src.services.identity_cache import get_identity_cache
+
+
+logger = logging.getLogger(__name__)
 
 
 @dataclass
@@ -24,6 +37,15 @@ class UserIdentity:
     balance: int = 0
 
 
+@dataclass
+class QuotaReservation:
+    """一次已预扣、尚未结算的用量。"""
+    id: str
+    identity: Any
+    amount: int
+    reason: str = ""
+
+
 def get_or_create_guest(db: Session, guest_id: Optional[str]) -> tuple:
     """返回 (identity, remaining)。若 guest_id 为空则创建新游客并写入 DB。"""
     settings = get_settings().auth
@@ -51,16 +73,11 @@ def get_guest_remaining(db: Session, guest_id: str) -> int:
     return max(0, settings.guest_free_quota - row.count)
 
 
-def consume_guest(db: Session, guest_id: str) -> None:
-    row = db.query(GuestUsage).filter(GuestUsage.guest_id == guest_id).first()
-    if not row:
-        return
-    row.count += 1
-    db.commit()
+def get_user_identity_and_remaining(db: Session, user_id: int) -> tuple:
+    return _user_identity_and_remaining(db.query(User).filter(User.id == user_id).first())
 
 
-def get_user_identity_and_remaining(db: Session, user_id: int) -> tuple:
-    user = db.query(User).filter(User.id == user_id).first()
+def _user_identity_and_remaining(user: Optional[User]) -> tuple:
     if not user:
         return None, 0
     identity = UserIdentity(
@@ -76,9 +93,251 @@ def get_user_identity_and_remaining(db: Session, user_id: int) -> tuple:
     return identity, remaining
 
 
-def consume_user(db: Session, user_id: int) -> None:
-    user = db.query(User).filter(User.id == user_id).first()
-    if not user or user.role == "admin":
-        return
-    user.balance = max(0, user.balance - 1)
+# --- 预留 / 确认 / 退回 ---
+
+
+def _identity_key(identity: Any) -> Optional[tuple]:
+    kind = getattr(identity, "type", None)
+    if kind == "guest":
+        return "guest", getattr(identity, "guest_id", "") or ""
+    if kind == "user":
+        return "user", str(getattr(identity, "user_id", 0) or 0)
+    return None
+
+
+def _balance_changed(identity: Any) -> None:
+    """提交后调用：让本进程缓存的该身份快照失效。"""
+    if not _is_admin(identity):
+        get_identity_cache().bump(_identity_key(identity))
+
+
+def _is_admin(identity: Any) -> bool:
+    return getattr(identity, "type", None) == "user" and getattr(identity, "role", "") == "admin"
+
+
+def _debit_stmt(identity: Any, amount: int):
+    """余量足够时扣 amount 次的条件 UPDATE；rowcount 为 1 表示扣减成功。"""
+    if identity.type == "guest":
+        quota = get_settings().auth.guest_free_quota
+        return (
+            update(GuestUsage)
+            .where(GuestUsage.guest_id == identity.guest_id, GuestUsage.count + amount <= quota)
+            .values(count=GuestUsage.count + amount)
+        )
+    return (
+        update(User)
+        .where(User.id == identity.user_id, User.role != "admin", User.balance >= amount)
+        .values(balance=User.balance - amount)
+    )
+
+
+def _credit_stmt(identity: Any, amount: int):
+    if identity.type == "guest":
+        return (
+            update(GuestUsage)
+            .where(GuestUsage.guest_id == identity.guest_id)
+            .values(count=GuestUsage.count - amount)
+        )
+    return (
+        update(User)
+        .where(User.id == identity.user_id, User.role != "admin")
+        .values(balance=User.balance + amount)
+    )
+
+
+def _entry(reservation: QuotaReservation, phase: str, event: str) -> Dict[str, Any]:
+    identity_type, identity_key = _identity_key(reservation.identity)
+    return {
+        "reservation_id": reservation.id,
+        "phase": phase,
+        "event": event,
+        "identity_type": identity_type,
+        "identity_key": identity_key,
+        "amount": reservation.amount,
+        "reason": reservation.reason,
+    }
+
+
+def _new_guest_row(identity: Any) -> Optional[GuestUsage]:
+    """游客带着库里没有的 guest_id 时需要先建行，之后再按条件 UPDATE 预扣。"""
+    if identity.type != "guest":
+        return None
+    return GuestUsage(guest_id=identity.guest_id, count=0)
+
+
+def reserve(db: Session, identity: Any, amount: int, reason: str = "") -> Optional[QuotaReservation]:
+    """
+    原子地预扣 amount 次并记一条 reserve 流水，余量不足返回 None。
+    并发请求各自的条件 UPDATE 由数据库串行执行，不会出现都通过检查后超扣。管理员不扣，但同样记流水。
+    """
+    if _identity_key(identity) is None:
+        return None
+    for _ in range(2):
+        reservation = QuotaReservation(id=str(uuid4()), identity=identity, amount=amount, reason=reason)
+        try:
+            if _is_admin(identity) or db.execute(_debit_stmt(identity, amount)).rowcount == 1:
+                db.execute(insert(UsageLedgerEntry), [_entry(reservation, "open", "reserve")])
+                db.commit()
+                _balance_changed(identity)
+                return reservation
+            db.rollback()
+            row = _new_guest_row(identity)
+            if row is None or db.query(GuestUsage.id).filter(GuestUsage.guest_id == row.guest_id).first():
+                # 余量不足：缓存里的 remaining 可能已过期（别的 worker 扣过），一并失效
+                _balance_changed(identity)
+                return None
+            db.add(row)
+            db.commit()
+        except IntegrityError:
+            # 并发创建了同一游客：按已存在的行重试
+            db.rollback()
+        except Exception:
+            db.rollback()
+            raise
+    return None
+
+
+def commit_reservation(db: Session, reservation: QuotaReservation) -> bool:
+    """确认扣减。已结算过（包括被超时回收退回）时返回 False。"""
+    try:
+        db.execute(insert(UsageLedgerEntry), [_entry(reservation, "settle", "commit")])
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        logger.warning("quota reservation %s already settled, commit ignored", reservation.id)
+        return False
+    return True
+
+
+def release_reservation(db: Session, reservation: QuotaReservation) -> bool:
+    """退回预扣的次数（运行失败或客户端中途断开时）。与 commit 互斥，重复调用只退一次。"""
+    try:
+        db.execute(insert(UsageLedgerEntry), [_entry(reservation, "settle", "release")])
+        if not _is_admin(reservation.identity):
+            db.execute(_credit_stmt(reservation.identity, reservation.amount))
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        return False
+    _balance_changed(reservation.identity)
+    return True
+
+
+def release_stale_reservations(db: Session, older_than_seconds: int) -> int:
+    """退回超过 older_than_seconds 仍未结算的预留（进程在运行中退出时遗留），返回退回的条数。"""
+    cutoff = datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(seconds=older_than_seconds)
+    settle = aliased(UsageLedgerEntry)
+    rows: List[UsageLedgerEntry] = (
+        db.query(UsageLedgerEntry)
+        .outerjoin(
+            settle,
+            and_(settle.reservation_id == UsageLedgerEntry.reservation_id, settle.phase == "settle"),
+        )
+        .filter(UsageLedgerEntry.phase == "open", UsageLedgerEntry.created_at < cutoff, settle.id.is_(None))
+        .all()
+    )
+    released = 0
+    for row in rows:
+        if row.identity_type == "guest":
+            identity: Any = GuestIdentity(guest_id=row.identity_key)
+        else:
+            identity = UserIdentity(user_id=int(row.identity_key))
+        reservation = QuotaReservation(id=row.reservation_id, identity=identity, amount=row.amount, reason=row.reason)
+        released += release_reservation(db, reservation)
+    return released
+
+
+def add_balance(db: Session, user_id: int, amount: int, reason: str = "admin") -> Optional[int]:
+    """为用户增加 amount 次并记 grant 流水，返回新余额；用户不存在返回 None。"""
+    result = db.execute(update(User).where(User.id == user_id).values(balance=User.balance + amount))
+    if result.rowcount != 1:
+        db.rollback()
+        return None
+    db.execute(
+        insert(UsageLedgerEntry),
+        [{"event": "grant", "identity_type": "user", "identity_key": str(user_id), "amount": amount, "reason": reason}],
+    )
     db.commit()
+    get_identity_cache().bump(("user", str(user_id)))
+    return db.query(User.balance).filter(User.id == user_id).scalar()
+
+
+# --- 异步版本（AsyncSession），语义与上面的同步函数一致 ---
+
+
+async def get_or_create_guest_async(db: AsyncSession, guest_id: Optional[str]) -> tuple:
+    quota = get_settings().auth.guest_free_quota
+    if not guest_id or not guest_id.strip():
+        guest_id = str(uuid4())
+        db.add(GuestUsage(guest_id=guest_id, count=0))
+        await db.commit()
+        return GuestIdentity(guest_id=guest_id), quota
+    count = await db.scalar(select(GuestUsage.count).where(GuestUsage.guest_id == guest_id))
+    if count is None:
+        db.add(GuestUsage(guest_id=guest_id, count=0))
+        await db.commit()
+        count = 0
+    return GuestIdentity(guest_id=guest_id), max(0, quota - count)
+
+
+async def get_guest_remaining_async(db: AsyncSession, guest_id: str) -> int:
+    quota = get_settings().auth.guest_free_quota
+    count = await db.scalar(select(GuestUsage.count).where(GuestUsage.guest_id == guest_id))
+    return max(0, quota - (count or 0))
+
+
+async def get_user_identity_and_remaining_async(db: AsyncSession, user_id: int) -> tuple:
+    return _user_identity_and_remaining(await db.get(User, user_id))
+
+
+async def reserve_async(db: AsyncSession, identity: Any, amount: int, reason: str = "") -> Optional[QuotaReservation]:
+    """见 reserve。"""
+    if _identity_key(identity) is None:
+        return None
+    for _ in range(2):
+        reservation = QuotaReservation(id=str(uuid4()), identity=identity, amount=amount, reason=reason)
+        try:
+            if _is_admin(identity) or (await db.execute(_debit_stmt(identity, amount))).rowcount == 1:
+                await db.execute(insert(UsageLedgerEntry), [_entry(reservation, "open", "reserve")])
+                await db.commit()
+                _balance_changed(identity)
+                return reservation
+            await db.rollback()
+            row = _new_guest_row(identity)
+            if row is None or await db.scalar(select(GuestUsage.id).where(GuestUsage.guest_id == row.guest_id)):
+                _balance_changed(identity)
+                return None
+            db.add(row)
+            await db.commit()
+        except IntegrityError:
+            await db.rollback()
+        except Exception:
+            await db.rollback()
+            raise
+    return None
+
+
+async def commit_reservation_async(db: AsyncSession, reservation: QuotaReservation) -> bool:
+    """见 commit_reservation。"""
+    try:
+        await db.execute(insert(UsageLedgerEntry), [_entry(reservation, "settle", "commit")])
+        await db.commit()
+    except IntegrityError:
+        await db.rollback()
+        logger.warning("quota reservation %s already settled, commit ignored", reservation.id)
+        return False
+    return True
+
+
+async def release_reservation_async(db: AsyncSession, reservation: QuotaReservation) -> bool:
+    """见 release_reservation。"""
+    try:
+        await db.execute(insert(UsageLedgerEntry), [_entry(reservation, "settle", "release")])
+        if not _is_admin(reservation.identity):
+            await db.execute(_credit_stmt(reservation.identity, reservation.amount))
+        await db.commit()
+    except IntegrityError:
+        await db.rollback()
+        return False
+    _balance_changed(reservation.identity)
+    return True